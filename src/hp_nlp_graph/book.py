@@ -1,18 +1,47 @@
 import pickle
-import time
+from collections.abc import Iterator
+from itertools import islice
 
 from tqdm import tqdm
 
+from .book_text import BookText
+from .character_index import CharacterIndex
 from .coreference import (
-    coref_resolve_and_get_characters_matches_in_chapter,
-    get_interactions,
+    WINDOW_SIZE,
+    coref_resolve_and_get_characters_matches_in_chapters,
+    get_chapter_seed,
+    get_interaction_distances,
 )
-from .language import FastCoref, add_entity_ruler, get_coref_resolver_nlp
+from .language import (
+    FASTCOREF_CONFIG,
+    SPACY_MODEL,
+    CharacterMatcher,
+    FastCoref,
+    add_entity_ruler,
+    get_coref_resolver_nlp,
+    get_default_num_threads,
+)
+from .language_constants import CHAPTER_HARDCODED_OPTIONS
+from .match_store import MatchStore
 from .neo4j import add_characters_to_neo4j, add_interactions_to_neo4j
-from .scraper import Chapter, get_characters_by_chapter
+from .pipeline import stream_chapter_matches
+from .parallel import ChapterTask, coreference_resolve_parallel
+from .doc_cache import (
+    RESOLVED_DOC_CACHE_VERSION,
+    RESOLVER_PACKAGES,
+    ResolvedDocCache,
+    get_package_versions,
+)
+from .fetcher import Fetcher
+from .scraper import Chapter, CharacterRegistry, get_characters_by_chapter
+from .stages import ArtifactStore, Stage, StageRunner, hash_key
 from .utils import get_characters_seen_till_chapter
 
 
+# Bump when the matching or interaction logic changes, which invalidates the stage artefacts
+BOOK_STAGES_VERSION = 1
+
+
 class Book:
     """A class to represent a Harry Potter book. It contains the book number and the url to the character index page.
     It also contains a list of Chapter objects, each of which contains a list of Character objects.
@@ -28,35 +57,54 @@ class Book:
     ```
     """
 
-    def __init__(self, book_number: int, character_index_url: str, book_text_path: str):
+    def __init__(
+        self,
+        book_number: int,
+        character_index_url: str,
+        book_text_path: str,
+        fetcher: Fetcher = None,
+        registry: CharacterRegistry = None,
+        entity_ruler_bundle_path: str = None,
+        character_index: CharacterIndex = None,
+    ):
         self.book_number = book_number
         self.character_index_url = character_index_url
         self.book_text_path = book_text_path
+        self.fetcher = fetcher if fetcher is not None else Fetcher()
+        # Share a registry between books to enrich recurring characters only once
+        self.registry = registry if registry is not None else CharacterRegistry()
+        # Precompiled entity ruler patterns, rebuilt when the characters change
+        self.entity_ruler_bundle_path = entity_ruler_bundle_path
+        # Share an index between books so the character ids are the same for the whole series
+        self.character_index = character_index
         self.chapters_with_characters = None
         self.chapters_with_characters_dict = None
         self.base_nlp = None
         self.nlp = None
         self.coref = None
-        self.chapter_texts = None
+        self.character_matcher = None
         self.matches_by_chapter = None
+        self.interaction_distances_by_chapter = None
         self.interactions_by_chapter = None
 
     def _scrape_chapters_with_characters(self) -> list[Chapter]:
-        return get_characters_by_chapter(self.character_index_url)
+        return self.registry.register_chapters(
+            get_characters_by_chapter(self.character_index_url, self.fetcher),
+            self.book_number,
+        )
 
-    def _enrich_characters(self) -> None:
-        for chapter in self.chapters_with_characters:
-            for character in chapter.characters:
-                time.sleep(1)
-                character.enrich()
+    def _enrich_characters(self, max_workers: int = 8) -> None:
+        self.registry.enrich(fetcher=self.fetcher, max_workers=max_workers)
 
-    def set_chapters_with_characters(self, reset: bool = False) -> None:
-        if self.chapters_with_characters is not None or reset:
+    def set_chapters_with_characters(
+        self, reset: bool = False, max_workers: int = 8
+    ) -> None:
+        if self.chapters_with_characters is None or reset:
             self.chapters_with_characters = self._scrape_chapters_with_characters()
             self.chapters_with_characters_dict = {
-                chapter.number: chapter for chapter in self.chapters_with_characters
+                chapter.chapter: chapter for chapter in self.chapters_with_characters
             }
-            self._enrich_characters()
+            self._enrich_characters(max_workers=max_workers)
 
     def save_chapters_with_characters(self, path: str = None) -> None:
         if self.chapters_with_characters is None:
@@ -81,58 +129,274 @@ class Book:
             for character in chapter.characters
         ]
 
-    def _initialize_coreference_resolver(self, device="cuda:0") -> None:
+    def get_character_index(self) -> CharacterIndex:
+        """Get the index of the character ids if none was given.
+
+        It is built from the characters of the book, or, if they were not scraped in this run, taken
+        from the loaded MatchStore or built from the names of the matches.
+
+        Raises:
+            ValueError: If neither the characters nor the matches have been set
+
+        Returns:
+            CharacterIndex: The index
+        """
+        if self.character_index is not None:
+            return self.character_index
+        if self.chapters_with_characters is not None:
+            self.character_index = CharacterIndex.from_characters(self.all_characters)
+        elif isinstance(self.matches_by_chapter, MatchStore):
+            self.character_index = self.matches_by_chapter.character_index
+        elif self.matches_by_chapter is not None:
+            self.character_index = CharacterIndex.from_matches(self.matches_by_chapter)
+        else:
+            raise ValueError("No chapters with characters or matches have been set.")
+        return self.character_index
+
+    def _initialize_coreference_resolver(
+        self, device="auto", direct: bool = False, quantize: bool = False
+    ) -> None:
         # Initialize the language models
-        base_nlp, nlp = get_coref_resolver_nlp(device=device)
+        base_nlp, nlp = get_coref_resolver_nlp(
+            device=device, quantize=quantize, num_threads=get_default_num_threads()
+        )
         # Add entity rulers to the language models using the character names
-        self.base_nlp = add_entity_ruler(base_nlp, self.all_characters)
-        self.nlp = add_entity_ruler(nlp, self.all_characters)
+        self.base_nlp = add_entity_ruler(
+            base_nlp, self.all_characters, self.entity_ruler_bundle_path
+        )
+        self.nlp = add_entity_ruler(
+            nlp, self.all_characters, self.entity_ruler_bundle_path
+        )
         # Initialize the coreference resolver
-        self.coref = FastCoref(base_nlp, nlp)
+        self.coref = FastCoref(base_nlp, nlp, direct=direct)
+        # The matcher is extended chapter by chapter instead of being rebuilt
+        self.character_matcher = CharacterMatcher(self.nlp.vocab)
+
+    def iter_chapter_tasks(
+        self, chapter_characters: dict = None
+    ) -> Iterator[ChapterTask]:
+        """Iterate over the chapters to resolve together with the characters to match in them.
+
+        The tasks only point at their chapters, which are read from the book text when they are
+        resolved.
+
+        Args:
+            chapter_characters (dict, optional): The characters of every chapter of every book, of the form {book_number: {chapter_number: [Character]}}. Defaults to None, in which case only the characters of this book are matched.
+
+        Yields:
+            ChapterTask: The chapters of the book in order
+        """
+        # Only the chapter offsets are needed here, the file is unmapped right away
+        with BookText(self.book_text_path) as book_text:
+            number_of_chapters = len(book_text)
+        if chapter_characters is None:
+            chapter_characters = {
+                self.book_number: {
+                    chapter.chapter: chapter.characters
+                    for chapter in self.chapters_with_characters
+                }
+            }
+        for chapter_number in range(number_of_chapters):
+            yield ChapterTask(
+                book_number=self.book_number,
+                chapter_number=chapter_number + 1,
+                book_text_path=self.book_text_path,
+                chapter_index=chapter_number,
+                characters=get_characters_seen_till_chapter(
+                    chapter_characters, self.book_number, chapter_number + 1
+                ),
+                chapter_hardcoded_options=CHAPTER_HARDCODED_OPTIONS.get(
+                    f"{self.book_number}-{chapter_number + 1}"
+                ),
+            )
+
+    def get_chapter_tasks(self, chapter_characters: dict = None) -> list[ChapterTask]:
+        """Get the chapters to resolve together with the characters to match in them.
+
+        Args:
+            chapter_characters (dict, optional): The characters of every chapter of every book, see iter_chapter_tasks. Defaults to None.
 
-    def _open_book_text(self) -> str:
-        with open(self.book_text_path, "r") as f:
-            return f.read().split("CHAPTER ")[1:]
+        Returns:
+            list[ChapterTask]: The chapters of the book in order
+        """
+        return list(self.iter_chapter_tasks(chapter_characters))
 
-    def coreference_resolve(self, device="cuda:0") -> None:
+    def coreference_resolve(
+        self,
+        device="auto",
+        chapter_characters: dict = None,
+        chapters_per_batch: int = 1,
+        direct: bool = False,
+        workers: int = None,
+        quantize: bool = False,
+        doc_cache_path: str = None,
+        pipelined: bool = False,
+        seed: int = None,
+    ) -> None:
+        """Resolve coreferences and match the characters in every chapter.
+
+        Args:
+            device (str, optional): Device to run coreference resolution on. Defaults to "auto", i.e. the GPU if CUDA is available and the CPU otherwise.
+            chapter_characters (dict, optional): The characters of every chapter of every book, of the form {book_number: {chapter_number: [Character]}}. Defaults to None, in which case only the characters of this book are matched.
+            chapters_per_batch (int, optional): Number of chapters whose windows are resolved in one batch. Defaults to 1. Workers always resolve one chapter at a time.
+            direct (bool, optional): Whether to build the resolved docs from the original tokens, which also records the source position of every match. Defaults to False.
+            workers (int, optional): Number of worker processes to resolve the chapters in. Defaults to None, in which case they are resolved in this process.
+            quantize (bool, optional): Whether to quantize the coreference model to int8 for CPU inference. Defaults to False.
+            doc_cache_path (str, optional): Directory of the cache of resolved docs, chapters found in it are not resolved again. Defaults to None.
+            pipelined (bool, optional): Whether to parse, resolve and match the chapters in overlapping stages, see stream_chapter_matches. Defaults to False.
+            seed (int, optional): Seed of the random disambiguation, see get_chapter_seed. Defaults to None.
+
+        Raises:
+            ValueError: If workers is combined with chapters_per_batch or pipelined
+        """
+        if workers is not None and (chapters_per_batch != 1 or pipelined):
+            raise ValueError(
+                "chapters_per_batch and pipelined only apply to chapters resolved in this process, not with workers"
+            )
+        if workers is not None:
+            coreference_resolve_books(
+                [self],
+                self.get_chapter_tasks(chapter_characters),
+                workers=workers,
+                device=device,
+                direct=direct,
+                quantize=quantize,
+                doc_cache_path=doc_cache_path,
+                seed=seed,
+            )
+            return
         if self.coref is None or self.base_nlp is None or self.nlp is None:
-            self._initialize_coreference_resolver(device=device)
-        if self.chapter_texts is None:
-            self.chapter_texts = self._open_book_text()
+            self._initialize_coreference_resolver(
+                device=device, direct=direct, quantize=quantize
+            )
+        self.coref.direct = direct
+        doc_cache = (
+            ResolvedDocCache(doc_cache_path, self.coref)
+            if doc_cache_path is not None
+            else None
+        )
+        # The chapters are read one at a time as the resolution reaches them
+        tasks = self.iter_chapter_tasks(chapter_characters)
         matches_by_chapter = {}
-        for chapter_number, chapter_text in enumerate(self.chapter_texts):
-            (
-                matches,
-                resolved_docs,
-            ) = coref_resolve_and_get_characters_matches_in_chapter(
+        if pipelined:
+            for chapter_number, matches in stream_chapter_matches(
                 base_nlp=self.base_nlp,
                 nlp=self.nlp,
-                chapter_text=chapter_text,
-                characters_seen_till_this_chapter=get_characters_seen_till_chapter(
-                    self.book_number, chapter_number + 1
+                chapters=(
+                    (
+                        task.chapter_number,
+                        task.chapter_text,
+                        task.characters,
+                        task.chapter_hardcoded_options,
+                    )
+                    for task in tasks
                 ),
-                coref_resolver=self.coref.resolve,
-            )
-            matches_by_chapter[chapter_number + 1] = matches
+                batch_coref_resolver=self.coref.resolve_batch,
+                character_matcher=self.character_matcher,
+                doc_cache=doc_cache,
+                chapters_per_batch=chapters_per_batch,
+                get_seed=lambda chapter_number: get_chapter_seed(
+                    self.book_number, chapter_number, seed
+                ),
+            ):
+                matches_by_chapter[chapter_number] = matches
+        else:
+            while batch := list(islice(tasks, chapters_per_batch)):
+                results = coref_resolve_and_get_characters_matches_in_chapters(
+                    base_nlp=self.base_nlp,
+                    nlp=self.nlp,
+                    chapters=[
+                        (
+                            task.chapter_text,
+                            task.characters,
+                            task.chapter_hardcoded_options,
+                        )
+                        for task in batch
+                    ],
+                    batch_coref_resolver=self.coref.resolve_batch,
+                    character_matcher=self.character_matcher,
+                    doc_cache=doc_cache,
+                    seeds=[
+                        get_chapter_seed(task.book_number, task.chapter_number, seed)
+                        for task in batch
+                    ],
+                )
+                for task, (matches, _) in zip(batch, results):
+                    matches_by_chapter[task.chapter_number] = matches
         self.matches_by_chapter = matches_by_chapter
+        self.interaction_distances_by_chapter = None
 
     def save_coreference_resolution(self, path: str = None) -> None:
+        """Save the matches of every chapter as a MatchStore.
+
+        Args:
+            path (str, optional): The directory of the store. Defaults to book/{book_number}/matches.
+        """
         if self.matches_by_chapter is None:
             raise ValueError("No coreference resolution has been done.")
         if path is None:
-            path = f"book/{self.book_number}/coreference_resolution_by_chapter.pkl"
-        with open(path, "wb") as f:
-            pickle.dump(self.matches_by_chapter, f)
+            path = f"book/{self.book_number}/matches"
+        if not isinstance(self.matches_by_chapter, MatchStore):
+            self.matches_by_chapter = MatchStore.from_matches(
+                self.matches_by_chapter, self.get_character_index()
+            )
+        self.matches_by_chapter.save(path)
+
+    def load_coreference_resolution(self, path: str = None, mmap: bool = True) -> None:
+        """Load the matches of every chapter from a MatchStore.
+
+        Args:
+            path (str, optional): The directory of the store. Defaults to book/{book_number}/matches.
+            mmap (bool, optional): Whether to memory map the store. Defaults to True.
+        """
+        if path is None:
+            path = f"book/{self.book_number}/matches"
+        self.matches_by_chapter = MatchStore.load(path, mmap=mmap)
+        self.interaction_distances_by_chapter = None
+
+    def calculate_interaction_distances(self, max_distance_threshold: int = 50):
+        """Calculate the interactions of every chapter for all distance thresholds up to a maximum.
+
+        Args:
+            max_distance_threshold (int, optional): The largest distance threshold to calculate the interactions for. Defaults to 50.
+        """
+        if self.matches_by_chapter is None:
+            raise ValueError("No coreference resolution has been done.")
+        character_index = (
+            self.matches_by_chapter.character_index
+            if isinstance(self.matches_by_chapter, MatchStore)
+            else self.get_character_index()
+        )
+        self.interaction_distances_by_chapter = {
+            chapter_number: get_interaction_distances(
+                matches, max_distance_threshold, character_index
+            )
+            for chapter_number, matches in self.matches_by_chapter.items()
+        }
 
     def calculate_interactions(self, thresh: int = 14):
+        """Calculate the interactions of every chapter. They are derived from the interaction
+        distances if those were calculated for the threshold.
+
+        Args:
+            thresh (int, optional): The distance between two characters for them to be considered an interaction. Defaults to 14.
+        """
         if self.matches_by_chapter is None:
             raise ValueError("No coreference resolution has been done.")
-        interactions_by_chapter = {}
-        for chapter_number, matches in self.matches_by_chapter.items():
-            interactions_by_chapter[chapter_number] = get_interactions(
-                matches, thresh=thresh
+        if (
+            self.interaction_distances_by_chapter is None
+            or self.interaction_distances_by_chapter.keys()
+            != self.matches_by_chapter.keys()
+            or any(
+                distances.max_distance_threshold < thresh
+                for distances in self.interaction_distances_by_chapter.values()
             )
-        self.interactions_by_chapter = interactions_by_chapter
+        ):
+            self.calculate_interaction_distances(max(thresh, 50))
+        self.interactions_by_chapter = {
+            chapter_number: distances.interactions(thresh)
+            for chapter_number, distances in self.interaction_distances_by_chapter.items()
+        }
 
     def save_interactions(self, path: str = None) -> None:
         if self.interactions_by_chapter is None:
@@ -148,4 +412,260 @@ class Book:
         for interactions in tqdm(self.interactions_by_chapter.values()):
             add_interactions_to_neo4j(driver, interactions)
 
+    def _use_chapters_with_characters(self, chapters: list[Chapter]) -> None:
+        self.chapters_with_characters = chapters
+        self.chapters_with_characters_dict = {
+            chapter.chapter: chapter for chapter in chapters
+        }
+
+    def get_stages(
+        self,
+        thresh: int = 14,
+        device="auto",
+        direct: bool = False,
+        quantize: bool = False,
+        chapter_characters: dict = None,
+        driver=None,
+        seed: int = None,
+        refresh_characters: bool = False,
+    ) -> list[Stage]:
+        """Get the stages of the book for a StageRunner.
+
+        The stages are "characters" (scraping), "matches" (coreference resolution and matching, per
+        chapter), "interactions" (per chapter) and, if a driver is given, "neo4j". The key of the
+        characters only hashes the character index url, so the wiki is scraped once and then only
+        again with refresh_characters. The key of a chapter's matches hashes its text, the titles
+        of the characters seen till the chapter, its hardcoded options, the installed versions of
+        spaCy, its model, fastcoref, transformers and torch and the settings of the resolution, so
+        only the chapters whose inputs changed are resolved again. The key of its interactions hashes the key of its matches
+        and the threshold, so changing the threshold never resolves a chapter again.
+
+        Args:
+            thresh (int, optional): The distance between two characters for them to be considered an interaction. Defaults to 14.
+            device (str, optional): Device to run coreference resolution on. Defaults to "auto".
+            direct (bool, optional): Whether to build the resolved docs from the original tokens. Defaults to False.
+            quantize (bool, optional): Whether to quantize the coreference model to int8. Defaults to False.
+            chapter_characters (dict, optional): The characters of every chapter of every book, see get_chapter_tasks. Defaults to None.
+            driver (optional): The Neo4j driver to add the interactions with. Defaults to None, i.e. no "neo4j" stage.
+            seed (int, optional): Seed of the random disambiguation, see get_chapter_seed. Defaults to None.
+            refresh_characters (bool, optional): Whether to scrape the characters again even if they were scraped before. Only the chapters whose characters changed are resolved again. Defaults to False.
+
+        Returns:
+            list[Stage]: The stages
+        """
+        tasks = {}
+        resolver = {
+            "packages": get_package_versions((*RESOLVER_PACKAGES, SPACY_MODEL)),
+            "fastcoref": FASTCOREF_CONFIG,
+            "direct": direct,
+            "quantize": quantize,
+            "window_size": WINDOW_SIZE,
+            "resolved_doc_version": RESOLVED_DOC_CACHE_VERSION,
+            "seed": seed,
+        }
+
+        def get_characters_keys(inputs):
+            return {
+                self.book_number: hash_key(
+                    BOOK_STAGES_VERSION,
+                    self.book_number,
+                    self.character_index_url,
+                )
+            }
+
+        def compute_characters(parts, inputs):
+            self.set_chapters_with_characters(reset=True)
+            return {self.book_number: self.chapters_with_characters}
+
+        def get_matches_keys(inputs):
+            self._use_chapters_with_characters(
+                inputs["characters"].values[self.book_number]
+            )
+            tasks.update(
+                (task.chapter_number, task)
+                for task in self.get_chapter_tasks(chapter_characters)
+            )
+            return {
+                chapter_number: hash_key(
+                    BOOK_STAGES_VERSION,
+                    resolver,
+                    task.chapter_text,
+                    [character.title for character in task.characters],
+                    task.chapter_hardcoded_options,
+                )
+                for chapter_number, task in tasks.items()
+            }
+
+        def compute_matches(parts, inputs):
+            if self.coref is None or self.base_nlp is None or self.nlp is None:
+                self._initialize_coreference_resolver(
+                    device=device, direct=direct, quantize=quantize
+                )
+            self.coref.direct = direct
+            # The stale chapters are resolved in order with a matcher of their own and a seed per
+            # chapter, so their matches do not depend on which other chapters are stale
+            character_matcher = CharacterMatcher(self.nlp.vocab)
+            matches = {}
+            for chapter_number in sorted(parts):
+                task = tasks[chapter_number]
+                (
+                    (matches[chapter_number], _),
+                ) = coref_resolve_and_get_characters_matches_in_chapters(
+                    base_nlp=self.base_nlp,
+                    nlp=self.nlp,
+                    chapters=[
+                        (
+                            task.chapter_text,
+                            task.characters,
+                            task.chapter_hardcoded_options,
+                        )
+                    ],
+                    batch_coref_resolver=self.coref.resolve_batch,
+                    character_matcher=character_matcher,
+                    seeds=[
+                        get_chapter_seed(task.book_number, task.chapter_number, seed)
+                    ],
+                )
+            return matches
+
+        def get_interactions_keys(inputs):
+            return {
+                chapter_number: hash_key(BOOK_STAGES_VERSION, key, thresh)
+                for chapter_number, key in inputs["matches"].keys.items()
+            }
+
+        def compute_interactions(parts, inputs):
+            return {
+                chapter_number: get_interaction_distances(
+                    inputs["matches"].values[chapter_number], thresh
+                ).interactions(thresh)
+                for chapter_number in parts
+            }
+
+        def get_neo4j_keys(inputs):
+            return {
+                self.book_number: hash_key(sorted(inputs["interactions"].keys.items()))
+            }
+
+        def compute_neo4j(parts, inputs):
+            for interactions in tqdm(inputs["interactions"].values.values()):
+                add_interactions_to_neo4j(driver, interactions)
+            return {self.book_number: None}
+
+        stages = [
+            # A refresh replaces the stored characters, so later runs reuse the refreshed ones
+            Stage(
+                "characters",
+                get_characters_keys,
+                compute_characters,
+                force=refresh_characters,
+            ),
+            Stage("matches", get_matches_keys, compute_matches, inputs=("characters",)),
+            Stage(
+                "interactions",
+                get_interactions_keys,
+                compute_interactions,
+                inputs=("matches",),
+            ),
+        ]
+        if driver is not None:
+            stages.append(
+                Stage(
+                    "neo4j",
+                    get_neo4j_keys,
+                    compute_neo4j,
+                    inputs=("interactions",),
+                    cache=False,
+                )
+            )
+        return stages
+
+    def run_stages(
+        self, artifact_path: str, targets: tuple[str, ...] = ("interactions",), **kwargs
+    ) -> dict[str, dict[str, int]]:
+        """Run the stages of the book, recomputing only the stale chapters and stages.
+
+        The outputs are set on the book like with the methods of the single stages.
+
+        Args:
+            artifact_path (str): The directory of the ArtifactStore
+            targets (tuple[str, ...], optional): The stages to run, together with the stages they depend on. Defaults to ("interactions",).
+            **kwargs: The parameters of the stages, see get_stages
+
+        Returns:
+            dict[str, dict[str, int]]: The number of reused and computed parts of every stage that ran
+        """
+        runner = StageRunner(ArtifactStore(artifact_path), self.get_stages(**kwargs))
+        outputs = runner.run(list(targets))
+        if "characters" in outputs:
+            self._use_chapters_with_characters(
+                outputs["characters"].values[self.book_number]
+            )
+        if "matches" in outputs:
+            self.matches_by_chapter = outputs["matches"].values
+            self.interaction_distances_by_chapter = None
+        if "interactions" in outputs:
+            self.interactions_by_chapter = outputs["interactions"].values
+        return runner.report
+
     # TODO: Add methods to add node metrics to Neo4j
+
+
+def coreference_resolve_books(
+    books: list[Book],
+    tasks: list[ChapterTask],
+    workers: int = None,
+    device: str = "cpu",
+    direct: bool = False,
+    quantize: bool = False,
+    doc_cache_path: str = None,
+    seed: int = None,
+) -> dict[tuple[int, int], str]:
+    """Resolve coreferences in the chapters of several books in a pool of worker processes.
+
+    The matches of every book are set like with Book.coreference_resolve. Chapters that failed are
+    left out of them and reported.
+
+    Args:
+        books (list[Book]): The books to resolve
+        tasks (list[ChapterTask]): The chapters of the books, see Book.get_chapter_tasks
+        workers (int, optional): Number of worker processes. Defaults to as many as fit into the available memory, see get_default_resolve_workers.
+        device (str, optional): Device to run coreference resolution on. Defaults to "cpu".
+        direct (bool, optional): Whether to build the resolved docs from the original tokens. Defaults to False.
+        quantize (bool, optional): Whether to quantize the coreference model to int8. Defaults to False.
+        doc_cache_path (str, optional): Directory of the cache of resolved docs. Defaults to None.
+        seed (int, optional): Seed of the random disambiguation, see get_chapter_seed. Defaults to None.
+
+    Returns:
+        dict[tuple[int, int], str]: The reason of every (book number, chapter number) that failed
+    """
+    characters = list(
+        {
+            id(character): character
+            for book in books
+            for character in book.all_characters
+        }.values()
+    )
+    results, failures = coreference_resolve_parallel(
+        tasks,
+        characters,
+        max_workers=workers,
+        device=device,
+        entity_ruler_bundle_path=books[0].entity_ruler_bundle_path,
+        direct=direct,
+        quantize=quantize,
+        doc_cache_path=doc_cache_path,
+        seed=seed,
+    )
+    for (book_number, chapter_number), reason in failures.items():
+        print(
+            f"Failed to resolve chapter {chapter_number} of book {book_number}: {reason}"
+        )
+    for book in books:
+        book.matches_by_chapter = {
+            chapter_number: matches
+            for (book_number, chapter_number), matches in results.items()
+            if book_number == book.book_number
+        }
+        book.interaction_distances_by_chapter = None
+    return failures
@@ -0,0 +1,183 @@
+import json
+import mmap
+import os
+import tempfile
+from collections.abc import Iterator, Sequence
+from dataclasses import asdict, dataclass
+
+# Bump when the layout of the index or the way chapters are cut changes
+BOOK_TEXT_INDEX_VERSION = 1
+# Every chapter of the book texts starts with this heading, e.g. "CHAPTER ONE"
+CHAPTER_MARKER = b"CHAPTER "
+
+
+@dataclass(frozen=True)
+class ChapterOffsets:
+    """The position of a chapter in the book file.
+
+    Args:
+        title (str): The first line of the chapter after the marker, e.g. "ONE"
+        start (int): The byte offset of the chapter, right after the marker
+        end (int): The byte offset of the next marker or the end of the file
+    """
+
+    title: str
+    start: int
+    end: int
+
+
+class BookText(Sequence):
+    """A memory-mapped book text, read one chapter at a time.
+
+    The chapters are cut like `open(path).read().split("CHAPTER ")[1:]`, but only their byte offsets
+    are kept. The offsets are persisted to an index next to the book, which is rebuilt when the
+    book changes. A chapter is decoded from the mapped pages when it is accessed, so processing one
+    chapter does not load the whole book. The mapping is read only and backed by the page cache, so
+    processes reading the same book share its pages. A pickled BookText only carries the path and
+    the offsets and maps the file again when it is read.
+
+    Args:
+        path (str): The path of the book text
+        index_path (str, optional): The path of the chapter offset index. Defaults to None, i.e. "{path}.chapters.json".
+        encoding (str, optional): The encoding of the book text. Defaults to "utf-8".
+    """
+
+    def __init__(
+        self, path: str, index_path: str = None, encoding: str = "utf-8"
+    ) -> None:
+        self.path = path
+        self.index_path = (
+            index_path if index_path is not None else path + ".chapters.json"
+        )
+        self.encoding = encoding
+        self._file = None
+        self._mmap = None
+        self.chapters = self._load_or_build_index()
+
+    def _open(self) -> mmap.mmap | bytes:
+        if self._mmap is None:
+            self._file = open(self.path, "rb")
+            # Empty files can not be mapped
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._mmap = b""
+            else:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def close(self) -> None:
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self._mmap = None
+
+    def __enter__(self) -> "BookText":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_file"] = None
+        state["_mmap"] = None
+        return state
+
+    def _get_stamp(self) -> dict:
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _build_index(self) -> list[ChapterOffsets]:
+        data = self._open()
+        starts = []
+        position = data.find(CHAPTER_MARKER)
+        while position != -1:
+            starts.append(position + len(CHAPTER_MARKER))
+            position = data.find(CHAPTER_MARKER, starts[-1])
+        chapters = []
+        for i, start in enumerate(starts):
+            end = (
+                starts[i + 1] - len(CHAPTER_MARKER)
+                if i + 1 < len(starts)
+                else len(data)
+            )
+            title_end = data.find(b"\n", start, end)
+            title = self._decode(data[start : end if title_end == -1 else title_end])
+            chapters.append(ChapterOffsets(title.strip(), start, end))
+        return chapters
+
+    def _load_or_build_index(self) -> list[ChapterOffsets]:
+        stamp = self._get_stamp()
+        try:
+            with open(self.index_path, "r") as f:
+                state = json.load(f)
+            if (
+                state["version"] == BOOK_TEXT_INDEX_VERSION
+                and state["book"] == stamp
+                and state["encoding"] == self.encoding
+            ):
+                return [ChapterOffsets(**chapter) for chapter in state["chapters"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        chapters = self._build_index()
+        self._save_index(stamp, chapters)
+        return chapters
+
+    def _save_index(self, stamp: dict, chapters: list[ChapterOffsets]) -> None:
+        directory = os.path.dirname(self.index_path) or "."
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory)
+        except OSError:
+            # The index is only a shortcut, so a read only directory just rebuilds it every time
+            return
+        with os.fdopen(fd, "w") as f:
+            json.dump(
+                {
+                    "version": BOOK_TEXT_INDEX_VERSION,
+                    "book": stamp,
+                    "encoding": self.encoding,
+                    "chapters": [asdict(chapter) for chapter in chapters],
+                },
+                f,
+            )
+        os.replace(tmp_path, self.index_path)
+
+    def _decode(self, data: bytes) -> str:
+        text = data.decode(self.encoding)
+        # Like reading the file in text mode, which translates the newlines
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text
+
+    @property
+    def titles(self) -> list[str]:
+        return [chapter.title for chapter in self.chapters]
+
+    def __len__(self) -> int:
+        return len(self.chapters)
+
+    def __getitem__(self, i: int) -> str:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        chapter = self.chapters[i]
+        return self._decode(self._open()[chapter.start : chapter.end])
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+def read_chapter(path: str, index: int, encoding: str = "utf-8") -> str:
+    """Read a single chapter of a book text and unmap the file again.
+
+    Args:
+        path (str): The path of the book text
+        index (int): The index of the chapter, starting at 0
+        encoding (str, optional): The encoding of the book text. Defaults to "utf-8".
+
+    Returns:
+        str: The text of the chapter
+    """
+    with BookText(path, encoding=encoding) as book_text:
+        return book_text[index]
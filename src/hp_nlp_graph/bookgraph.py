@@ -5,6 +5,10 @@ import matplotlib.pyplot as plt
 import pandas as pd
 from cdlib import algorithms
 
+from .character_index import CharacterIndex
+from .coreference import get_interaction_distances
+from .match_store import MatchStore
+
 NUMBER_OF_IMPORTANT_CHARACTERS = 7
 
 
@@ -12,16 +16,34 @@ class BookGraph:
     def __init__(
         self,
         book_number: int,
-        interactions_by_chapter_path: str,
+        interactions_by_chapter_path: str = None,
         number_of_important_characters: int = NUMBER_OF_IMPORTANT_CHARACTERS,
+        match_store_path: str = None,
+        distance_threshold: int = 14,
     ) -> None:
+        if interactions_by_chapter_path is None and match_store_path is None:
+            raise ValueError(
+                "Either the interactions or the match store of the book is required."
+            )
         self.book_number = book_number
         self.interactions_path = interactions_by_chapter_path
+        # The interactions are calculated from the matches if there is no pickle of them
+        self.match_store_path = match_store_path
+        self.distance_threshold = distance_threshold
         self.number_of_important_characters = number_of_important_characters
-        interactions_by_chapter = self._load_interactions()
-        self.number_of_chapters = len(interactions_by_chapter)
+        if self.interactions_path is None:
+            character_index, counts_by_chapter = self._load_interaction_counts()
+            self.number_of_chapters = len(counts_by_chapter)
+            self.interactions_dfs = self._create_interactions_df_from_counts(
+                character_index, counts_by_chapter
+            )
+        else:
+            interactions_by_chapter = self._load_interactions()
+            self.number_of_chapters = len(interactions_by_chapter)
+            self.interactions_dfs = self._create_interactions_df(
+                interactions_by_chapter
+            )
         self.chapter_numbers = list(range(1, self.number_of_chapters + 1))
-        self.interactions_dfs = self._create_interactions_df(interactions_by_chapter)
         self.graphs = self._create_graphs()
         self.metrics_dfs = {
             chapter: get_graph_metrics(graph) for chapter, graph in self.graphs.items()
@@ -67,6 +89,52 @@ class BookGraph:
         )
         return dfs
 
+    def _load_interaction_counts(
+        self,
+    ) -> tuple[CharacterIndex, dict[int, tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+        store = MatchStore.load(self.match_store_path)
+        return store.character_index, {
+            chapter: get_interaction_distances(matches, self.distance_threshold).counts(
+                self.distance_threshold
+            )
+            for chapter, matches in store.items()
+        }
+
+    def _create_interactions_df_from_counts(
+        self,
+        character_index: CharacterIndex,
+        counts_by_chapter: dict[int, tuple[np.ndarray, np.ndarray, np.ndarray]],
+    ) -> dict[int | str, pd.DataFrame]:
+        # The frames are built and summed up with the character ids, which are replaced by the
+        # names at the end
+        dfs = {}
+        for chapter, (sources, targets, counts) in counts_by_chapter.items():
+            dfs[chapter] = pd.DataFrame(
+                {
+                    "source": sources,
+                    "target": targets,
+                    "book": self.book_number,
+                    "chapter": chapter,
+                    "weight": counts,
+                }
+            )
+        ranks = character_index.ranks
+        book_df = (
+            pd.concat(dfs)
+            .reset_index(drop=True)
+            .groupby(["source", "target"])
+            .weight.sum()
+            .reset_index()
+        )
+        dfs["book"] = book_df.iloc[
+            np.lexsort((ranks[book_df.target], ranks[book_df.source]))
+        ].reset_index(drop=True)
+        names = np.array(character_index.names, dtype=object)
+        for df in dfs.values():
+            df["source"] = names[df.source.to_numpy()]
+            df["target"] = names[df.target.to_numpy()]
+        return dfs
+
     def _create_graphs(self) -> dict[str | int, nx.Graph]:
         graphs = {}
         for chapter, df in self.interactions_dfs.items():
@@ -201,14 +269,16 @@ def plt_centrality_diagram(
         ax.set_title(title)
 
 
-def get_graph_metrics(G: nx.Graph) -> pd.DataFrame:
+def _get_node_metrics(G: nx.Graph) -> dict[str, dict]:
+    # The centralities and Louvain and Leiden communities of every character
     hub_centrality, authority_centrality = nx.hits(G)
     louvain = dict(algorithms.louvain(G, weight="weight").to_node_community_map())
     try:
         leiden = dict(algorithms.leiden(G, weights="weight").to_node_community_map())
-    except:
+    except ImportError:
+        # Leiden needs the optional igraph and leidenalg packages
         leiden = louvain
-    metrics = {
+    return {
         "eigen_centrality": nx.eigenvector_centrality(
             G, weight="weight", max_iter=1000
         ),
@@ -223,7 +293,14 @@ def get_graph_metrics(G: nx.Graph) -> pd.DataFrame:
         "louvain": louvain,
         "leiden": leiden,
     }
-    metrics_df = pd.DataFrame.from_dict(metrics).explode("louvain").explode("leiden")
+
+
+def get_graph_metrics(G: nx.Graph) -> pd.DataFrame:
+    metrics_df = (
+        pd.DataFrame.from_dict(_get_node_metrics(G))
+        .explode("louvain")
+        .explode("leiden")
+    )
     metrics_df.index.name = "name"
 
     metric_cols = metrics_df.columns.difference(["louvain", "leiden"])
@@ -233,3 +310,35 @@ def get_graph_metrics(G: nx.Graph) -> pd.DataFrame:
     metrics_df[["louvain", "leiden"]] = metrics_df[["louvain", "leiden"]].astype(int)
 
     return metrics_df
+
+
+def get_overall_metrics(
+    G: nx.Graph, girvan_newman_level: int = 5, spectral_kmax: int = 8
+) -> pd.DataFrame:
+    """Get the metrics of the characters in the graph of a whole book, as added to Neo4j.
+
+    Unlike get_graph_metrics, the metrics are not normalized, and the communities found by
+    Girvan-Newman and spectral clustering are added, which are too slow to find for every chapter.
+
+    Args:
+        G (nx.Graph): The graph of the book
+        girvan_newman_level (int, optional): The level of the Girvan-Newman dendrogram. Defaults to 5.
+        spectral_kmax (int, optional): The maximum number of spectral communities. Defaults to 8.
+
+    Returns:
+        pd.DataFrame: The metrics of every character
+    """
+    metrics = _get_node_metrics(G)
+    metrics["girvan_newman"] = dict(
+        algorithms.girvan_newman(G, level=girvan_newman_level).to_node_community_map()
+    )
+    metrics["spectral"] = dict(
+        algorithms.spectral(G, kmax=spectral_kmax).to_node_community_map()
+    )
+    community_cols = ["louvain", "leiden", "girvan_newman", "spectral"]
+    metrics_df = pd.DataFrame.from_dict(metrics)
+    for col in community_cols:
+        metrics_df = metrics_df.explode(col)
+    metrics_df.index.name = "name"
+    metrics_df[community_cols] = metrics_df[community_cols].astype(int)
+    return metrics_df
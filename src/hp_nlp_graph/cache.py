@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+
+class CacheMissError(LookupError):
+    """Raised when a url is requested from an offline cache that does not contain it."""
+
+
+@dataclass
+class CacheEntry:
+    """Metadata of a cached response. The body is stored separately under its content hash.
+
+    Args:
+        url (str): The url of the response.
+        digest (str): The sha256 hash of the body.
+        size (int): The size of the body in bytes.
+        encoding (str): The encoding of the body.
+        etag (str): The ETag header of the response, if any.
+        last_modified (str): The Last-Modified header of the response, if any.
+        fetched_at (float): The time the response was fetched or last revalidated.
+    """
+
+    url: str
+    digest: str
+    size: int
+    encoding: str = None
+    etag: str = None
+    last_modified: str = None
+    fetched_at: float = 0.0
+
+
+def hash_bytes(content: bytes) -> str:
+    """Gets the sha256 hex digest of some bytes.
+
+    Args:
+        content (bytes): The bytes to hash.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+class ResponseCache:
+    """A content-addressed on-disk cache of HTTP responses keyed by url.
+
+    Bodies are stored once per content hash under `objects/` and every url has a small json entry
+    under `index/` pointing at its body, so identical pages are stored only once. When the bodies
+    grow beyond max_bytes the least recently used entries are evicted.
+
+    Args:
+        directory (str): The directory to store the cache in.
+        max_bytes (int, optional): The maximum total size of the stored bodies. Defaults to 1 GiB.
+        max_age (float, optional): Number of seconds after which an entry is revalidated with the server. Defaults to None, i.e. entries never go stale.
+        offline (bool, optional): Whether to serve only from the cache and fail on a miss. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = 1 << 30,
+        max_age: float = None,
+        offline: bool = False,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, "index"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._object_paths())
+        # Number of index entries pointing at each body, so dropping a body needs no index scan
+        self._references = {}
+        for entry in self._read_entries():
+            self._add_reference(entry.digest)
+
+    def _index_path(self, url: str) -> str:
+        return os.path.join(
+            self.directory, "index", hash_bytes(url.encode("utf-8")) + ".json"
+        )
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def _object_paths(self) -> list[str]:
+        objects_dir = os.path.join(self.directory, "objects")
+        return [
+            os.path.join(root, name)
+            for root, _, names in os.walk(objects_dir)
+            for name in names
+        ]
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def _read_entry(self, path: str) -> CacheEntry | None:
+        try:
+            with open(path, "r") as f:
+                return CacheEntry(**json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _read_entries(self) -> list[CacheEntry]:
+        index_dir = os.path.join(self.directory, "index")
+        entries = (
+            self._read_entry(os.path.join(index_dir, name))
+            for name in os.listdir(index_dir)
+        )
+        return [entry for entry in entries if entry is not None]
+
+    def _add_reference(self, digest: str) -> None:
+        self._references[digest] = self._references.get(digest, 0) + 1
+
+    def _drop_reference(self, digest: str) -> int:
+        count = self._references.get(digest, 0) - 1
+        if count > 0:
+            self._references[digest] = count
+        else:
+            self._references.pop(digest, None)
+        return max(count, 0)
+
+    def _remove_object(self, digest: str, size: int) -> None:
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            # Removed by hand, but it was still counted
+            pass
+        self.total_bytes -= size
+
+    def lookup(self, url: str) -> CacheEntry | None:
+        """Gets the cache entry of a url and marks it as recently used.
+
+        Args:
+            url (str): The url to look up.
+
+        Returns:
+            CacheEntry | None: The entry, or None if the url is not cached.
+        """
+        path = self._index_path(url)
+        try:
+            with open(path, "r") as f:
+                entry = CacheEntry(**json.load(f))
+        except FileNotFoundError:
+            return None
+        if not os.path.exists(self._object_path(entry.digest)):
+            return None
+        # The modification time of the index file records when the entry was last used. An
+        # offline cache is read only, and an entry evicted meanwhile is simply not touched.
+        if not self.offline:
+            with self._lock:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+        return entry
+
+    def is_stale(self, entry: CacheEntry) -> bool:
+        """Checks whether an entry should be revalidated with the server.
+
+        Args:
+            entry (CacheEntry): The entry to check.
+
+        Returns:
+            bool: Whether the entry is stale.
+        """
+        return (
+            self.max_age is not None and time.time() - entry.fetched_at > self.max_age
+        )
+
+    def read(self, entry: CacheEntry) -> bytes:
+        """Reads the body of an entry.
+
+        Args:
+            entry (CacheEntry): The entry to read.
+
+        Returns:
+            bytes: The body.
+        """
+        with open(self._object_path(entry.digest), "rb") as f:
+            return f.read()
+
+    def read_text(self, entry: CacheEntry) -> str:
+        """Reads and decodes the body of an entry.
+
+        Args:
+            entry (CacheEntry): The entry to read.
+
+        Returns:
+            str: The decoded body.
+        """
+        return self.read(entry).decode(entry.encoding or "utf-8", errors="replace")
+
+    def store(
+        self,
+        url: str,
+        content: bytes,
+        encoding: str = None,
+        etag: str = None,
+        last_modified: str = None,
+    ) -> CacheEntry:
+        """Stores a response in the cache, evicting old entries if the cache grows too large.
+
+        Args:
+            url (str): The url of the response.
+            content (bytes): The body of the response.
+            encoding (str, optional): The encoding of the body. Defaults to None.
+            etag (str, optional): The ETag header of the response. Defaults to None.
+            last_modified (str, optional): The Last-Modified header of the response. Defaults to None.
+
+        Returns:
+            CacheEntry: The stored entry.
+        """
+        entry = CacheEntry(
+            url=url,
+            digest=hash_bytes(content),
+            size=len(content),
+            encoding=encoding,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=time.time(),
+        )
+        with self._lock:
+            previous = self._read_entry(self._index_path(url))
+            object_path = self._object_path(entry.digest)
+            if not os.path.exists(object_path):
+                self._write_atomic(object_path, content)
+                self.total_bytes += entry.size
+            self._write_atomic(
+                self._index_path(url), json.dumps(asdict(entry)).encode("utf-8")
+            )
+            self._add_reference(entry.digest)
+            # The body of the previous version is dropped unless another url has the same one
+            if (
+                previous is not None
+                and self._drop_reference(previous.digest) == 0
+                and previous.digest != entry.digest
+            ):
+                self._remove_object(previous.digest, previous.size)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+        return entry
+
+    def refresh(self, entry: CacheEntry) -> None:
+        """Marks an entry as revalidated, e.g. after the server answered 304 Not Modified.
+
+        Args:
+            entry (CacheEntry): The entry to refresh.
+        """
+        entry.fetched_at = time.time()
+        with self._lock:
+            self._write_atomic(
+                self._index_path(entry.url), json.dumps(asdict(entry)).encode("utf-8")
+            )
+
+    def _evict(self) -> None:
+        index_dir = os.path.join(self.directory, "index")
+        entries = []
+        for name in os.listdir(index_dir):
+            path = os.path.join(index_dir, name)
+            try:
+                with open(path, "r") as f:
+                    entries.append((os.path.getmtime(path), path, json.load(f)))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        # Least recently used entries first
+        entries.sort(key=lambda entry: entry[0])
+        # Recount from the index, which also picks up entries removed by hand
+        references = {}
+        for _, _, entry in entries:
+            references[entry["digest"]] = references.get(entry["digest"], 0) + 1
+        self._references = references
+        # Bodies no entry points at, e.g. left behind by an interrupted store, go first
+        for path in self._object_paths():
+            if os.path.basename(path) not in references:
+                self._remove_object(os.path.basename(path), os.path.getsize(path))
+        for _, path, entry in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            os.remove(path)
+            if self._drop_reference(entry["digest"]) == 0:
+                self._remove_object(entry["digest"], entry["size"])
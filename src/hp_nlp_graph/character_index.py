@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+from .scraper import Character
+
+# Bump when the layout of the file changes
+CHARACTER_INDEX_VERSION = 1
+
+
+class CharacterIndex:
+    """A persisted table interning character names as integer ids.
+
+    The ids of the scraped characters are assigned in name order when the index is built. Names
+    added later, e.g. by hardcoded options, get the next free id, so an id never changes once it is
+    saved and the ids are the same for every book and chapter. Code working on many mentions uses
+    the ids, and the names are looked up again when the results are written out.
+
+    Args:
+        names (list[str], optional): The names by id. Defaults to None, i.e. an empty index.
+    """
+
+    def __init__(self, names: list[str] = None) -> None:
+        self.names: list[str] = []
+        self.ids: dict[str, int] = {}
+        self._ranks = None
+        for name in names or []:
+            self.add(name)
+
+    @classmethod
+    def from_characters(cls, characters: list[Character]) -> "CharacterIndex":
+        """Builds an index of the titles of the scraped characters.
+
+        Args:
+            characters (list[Character]): The characters
+
+        Returns:
+            CharacterIndex: The index
+        """
+        return cls(sorted({character.title for character in characters}))
+
+    @classmethod
+    def from_matches(cls, matches_by_chapter: Mapping) -> "CharacterIndex":
+        """Builds an index of the names of the matched characters.
+
+        Args:
+            matches_by_chapter (Mapping): The list of MatchResult objects of every chapter number
+
+        Returns:
+            CharacterIndex: The index
+        """
+        return cls(
+            sorted(
+                {
+                    string_id
+                    for matches in matches_by_chapter.values()
+                    for match in matches
+                    for string_id in match.string_id
+                }
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+    def add(self, name: str) -> int:
+        """Gets the id of a name, adding it to the index if it is new.
+
+        Args:
+            name (str): The name
+
+        Returns:
+            int: The id
+        """
+        id_ = self.ids.get(name)
+        if id_ is None:
+            id_ = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self._ranks = None
+        return id_
+
+    def get_id(self, name: str) -> int:
+        return self.ids[name]
+
+    def get_name(self, id_: int) -> str:
+        return self.names[id_]
+
+    def map_to(self, other: "CharacterIndex") -> np.ndarray:
+        """Maps the ids of this index to the ids of the same names in another one.
+
+        Args:
+            other (CharacterIndex): The other index, names missing from it are added
+
+        Returns:
+            np.ndarray: The id in the other index of every id of this one
+        """
+        return np.array([other.add(name) for name in self.names], dtype=np.int64)
+
+    @property
+    def ranks(self) -> np.ndarray:
+        """The position of every id in name order, used to order pairs of ids like their names."""
+        if self._ranks is None or len(self._ranks) != len(self.names):
+            self._ranks = np.empty(len(self.names), dtype=np.int64)
+            self._ranks[
+                np.argsort(np.array(self.names, dtype=object), kind="stable")
+            ] = np.arange(len(self.names))
+        return self._ranks
+
+    def save(self, path: str) -> None:
+        """Saves the index as a JSON file.
+
+        Args:
+            path (str): The path of the file
+        """
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": CHARACTER_INDEX_VERSION, "names": self.names}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CharacterIndex":
+        """Loads an index saved with CharacterIndex.save.
+
+        Args:
+            path (str): The path of the file
+
+        Returns:
+            CharacterIndex: The index
+        """
+        with open(path, "r") as f:
+            state = json.load(f)
+        if state["version"] != CHARACTER_INDEX_VERSION:
+            raise ValueError(
+                f"The character index {path} has version {state['version']}, expected {CHARACTER_INDEX_VERSION}"
+            )
+        return cls(state["names"])
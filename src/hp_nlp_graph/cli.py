@@ -0,0 +1,437 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from tqdm import tqdm
+
+from .scraper import NUMBER_OF_BOOKS
+
+# Exit codes for batch schedulers
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+COMMANDS = ("scrape", "resolve", "interactions", "metrics", "ingest")
+
+
+def parse_books(value: str) -> list[int]:
+    """Parses a selection of books like "1-7" or "1,3,5-7".
+
+    Args:
+        value (str): The selection
+
+    Returns:
+        list[int]: The sorted book numbers
+    """
+    books = set()
+    for part in value.split(","):
+        start, _, end = part.strip().partition("-")
+        try:
+            first, last = int(start), int(end or start)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid book selection: {value}")
+        if not 1 <= first <= last <= NUMBER_OF_BOOKS:
+            raise argparse.ArgumentTypeError(
+                f"Books have to be between 1 and {NUMBER_OF_BOOKS}: {value}"
+            )
+        books.update(range(first, last + 1))
+    return sorted(books)
+
+
+def _log(message: str) -> None:
+    # Printed above the progress bar instead of through it
+    tqdm.write(message, file=sys.stderr)
+
+
+def _book_dir(args: argparse.Namespace, book_number: int) -> str:
+    path = os.path.join(args.data_dir, str(book_number))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _load_character_index_urls(path: str) -> dict[int, str]:
+    return {
+        int(book): row["url"]
+        for book, row in pd.read_csv(path, index_col=0).to_dict(orient="index").items()
+    }
+
+
+def _load_chapters_with_characters(data_dir: str, book_number: int) -> list:
+    with open(
+        os.path.join(data_dir, str(book_number), "chapter_characters.pkl"), "rb"
+    ) as f:
+        return list(pickle.load(f))
+
+
+def _get_book_text_path(books_dir: str, book_number: int) -> str:
+    # The texts are named like "7 Deathly Hallows.txt"
+    paths = sorted(glob.glob(os.path.join(books_dir, f"{book_number} *.txt")))
+    if not paths:
+        raise FileNotFoundError(f"No text of book {book_number} in {books_dir}")
+    return paths[0]
+
+
+def _get_workers(args: argparse.Namespace) -> int:
+    # Resolve picks its own default, see get_default_resolve_workers
+    return args.workers if args.workers is not None else os.cpu_count() or 1
+
+
+def _run_per_book(args: argparse.Namespace, job, *job_args) -> int:
+    # Books are independent, so every book runs in its own process
+    failed = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(_get_workers(args), len(args.books))),
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = {
+            executor.submit(job, book_number, *job_args): book_number
+            for book_number in args.books
+        }
+        for future in tqdm(
+            as_completed(futures), total=len(futures), desc=args.command
+        ):
+            book_number = futures[future]
+            try:
+                _log(f"Book {book_number}: {future.result()}")
+            except Exception as e:
+                failed.append(book_number)
+                _log(f"Book {book_number} failed: {type(e).__name__}: {e}")
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+def scrape(args: argparse.Namespace) -> int:
+    from .scraper import CharacterScraper
+
+    # The books share the registry of enriched characters and the fetcher, so they are scraped in
+    # this process and the characters are enriched by a pool of threads
+    scraper = CharacterScraper(
+        url=_load_character_index_urls(args.urls), max_workers=_get_workers(args)
+    )
+    stats = scraper.scrape(books_to_scrape=args.books, journal_path=args.journal)
+    _log(
+        f"Enriched {stats['characters']} unique characters, "
+        f"saved {stats['fetches_saved']} fetches, "
+        f"{stats['parse_errors']} characters with unparsable fields."
+    )
+    for book_number in args.books:
+        _book_dir(args, book_number)
+    scraper.save_characters_by_chapter(args.data_dir, books_to_save=args.books)
+    scraper.save_dataframe(args.data_dir)
+    return EXIT_OK
+
+
+def resolve(args: argparse.Namespace) -> int:
+    from .book import Book, coreference_resolve_books
+    from .character_index import CharacterIndex
+
+    urls = _load_character_index_urls(args.urls)
+    # Characters of earlier books are matched in later ones too
+    chapter_characters = {
+        book_number: {
+            chapter.chapter: chapter.characters
+            for chapter in _load_chapters_with_characters(args.data_dir, book_number)
+        }
+        for book_number in range(1, max(args.books) + 1)
+    }
+    character_index_path = os.path.join(args.data_dir, "character_index.json")
+    character_index = (
+        CharacterIndex.load(character_index_path)
+        if os.path.exists(character_index_path)
+        else CharacterIndex()
+    )
+    books, tasks = [], []
+    for book_number in args.books:
+        book = Book(
+            book_number,
+            urls[book_number],
+            _get_book_text_path(args.books_dir, book_number),
+            entity_ruler_bundle_path=args.entity_ruler_bundle,
+            character_index=character_index,
+        )
+        book._use_chapters_with_characters(
+            _load_chapters_with_characters(args.data_dir, book_number)
+        )
+        for character in book.all_characters:
+            character_index.add(character.title)
+        books.append(book)
+        tasks.extend(book.get_chapter_tasks(chapter_characters))
+
+    _log(f"Resolving {len(tasks)} chapters of books {args.books}")
+    failures = coreference_resolve_books(
+        books,
+        tasks,
+        workers=args.workers,
+        device=args.device,
+        direct=args.direct,
+        quantize=args.quantize,
+        doc_cache_path=args.doc_cache,
+        seed=args.seed,
+    )
+    for (book_number, chapter_number), error in failures.items():
+        _log(f"Book {book_number} chapter {chapter_number} failed: {error}")
+    for book in books:
+        book.save_coreference_resolution(
+            os.path.join(_book_dir(args, book.book_number), "matches")
+        )
+    character_index.save(character_index_path)
+    return EXIT_FAILED if failures else EXIT_OK
+
+
+def _interactions_job(book_number: int, data_dir: str, thresh: int) -> str:
+    from .coreference import get_interaction_distances
+    from .match_store import MatchStore
+
+    store = MatchStore.load(os.path.join(data_dir, str(book_number), "matches"))
+    interactions_by_chapter = {
+        chapter_number: dict(
+            get_interaction_distances(matches, thresh).interactions(thresh)
+        )
+        for chapter_number, matches in store.items()
+    }
+    with open(
+        os.path.join(data_dir, str(book_number), "interactions_by_chapter.pkl"), "wb"
+    ) as f:
+        pickle.dump(interactions_by_chapter, f)
+    return f"interactions of {len(interactions_by_chapter)} chapters"
+
+
+def interactions(args: argparse.Namespace) -> int:
+    return _run_per_book(args, _interactions_job, args.data_dir, args.thresh)
+
+
+def _metrics_job(book_number: int, data_dir: str) -> str:
+    from .bookgraph import BookGraph, get_overall_metrics
+
+    book_dir = os.path.join(data_dir, str(book_number))
+    book_graph = BookGraph(
+        book_number,
+        interactions_by_chapter_path=os.path.join(
+            book_dir, "interactions_by_chapter.pkl"
+        ),
+    )
+    book_graph.interactions_dfs["book"].sort_values("weight", ascending=False).to_csv(
+        os.path.join(book_dir, "interactions.csv"), index=False
+    )
+    metrics_df = get_overall_metrics(book_graph.graphs["book"])
+    metrics_df.to_csv(os.path.join(book_dir, "metrics.csv"))
+    return f"metrics of {len(metrics_df)} characters"
+
+
+def metrics(args: argparse.Namespace) -> int:
+    return _run_per_book(args, _metrics_job, args.data_dir)
+
+
+def ingest(args: argparse.Namespace) -> int:
+    from dotenv import dotenv_values
+    from neo4j import GraphDatabase
+
+    from .neo4j import (
+        add_characters_to_neo4j,
+        add_interactions_to_neo4j,
+        add_metrics_to_neo4j,
+    )
+
+    neo4j_config = dotenv_values(args.env)
+    driver = GraphDatabase.driver(
+        neo4j_config["NEO4J_URL"],
+        auth=(neo4j_config["NEO4J_USER"], neo4j_config["NEO4J_PASSWORD"]),
+    )
+    # A single database is written to, so the books are added one after another
+    with driver:
+        for book_number in tqdm(args.books, desc="ingest"):
+            book_dir = os.path.join(args.data_dir, str(book_number))
+            characters = {
+                character.title: character.to_dict()
+                for chapter in _load_chapters_with_characters(
+                    args.data_dir, book_number
+                )
+                for character in chapter.characters
+            }
+            add_characters_to_neo4j(driver, list(characters.values()))
+            with open(os.path.join(book_dir, "interactions_by_chapter.pkl"), "rb") as f:
+                for chapter_interactions in pickle.load(f).values():
+                    add_interactions_to_neo4j(driver, chapter_interactions)
+            metrics_path = os.path.join(book_dir, "metrics.csv")
+            if os.path.exists(metrics_path):
+                add_metrics_to_neo4j(
+                    driver, pd.read_csv(metrics_path).to_dict("records")
+                )
+    return EXIT_OK
+
+
+def run_all(args: argparse.Namespace) -> int:
+    steps = [resolve, interactions, metrics]
+    if not args.skip_scrape:
+        steps.insert(0, scrape)
+    if args.ingest:
+        steps.append(ingest)
+    for step in steps:
+        start = time.perf_counter()
+        args.command = step.__name__
+        code = step(args)
+        _log(f"{step.__name__} finished in {time.perf_counter() - start:.1f}s")
+        if code != EXIT_OK:
+            return code
+    return EXIT_OK
+
+
+def _get_common_parser(defaults: bool = True) -> argparse.ArgumentParser:
+    # The options of every command, accepted before and after the command. The copy of the
+    # commands has no defaults, so it does not overwrite the options given before the command.
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--books",
+        type=parse_books,
+        default=default(list(range(1, NUMBER_OF_BOOKS + 1))),
+        help="Books to process, e.g. 1-7 or 1,3,5-7 (default: all)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=default(None),
+        help="Number of worker processes (default: number of CPUs, for resolve as many as fit into the available memory)",
+    )
+    parser.add_argument(
+        "--device",
+        default=default("auto"),
+        help="Device of the coreference model, e.g. cpu, cuda:0 or auto (default: auto)",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=default("./data/processed"),
+        help="Directory of the processed data (default: ./data/processed)",
+    )
+    return parser
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="hp-nlp-graph",
+        description="Build the Harry Potter character interaction network.",
+        parents=[_get_common_parser()],
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    common = [_get_common_parser(defaults=False)]
+
+    scrape_parser = subparsers.add_parser(
+        "scrape",
+        help="Scrape and enrich the characters of every chapter",
+        parents=common,
+    )
+    resolve_parser = subparsers.add_parser(
+        "resolve",
+        help="Resolve coreferences and match the characters",
+        parents=common,
+    )
+    interactions_parser = subparsers.add_parser(
+        "interactions", help="Count the interactions of every chapter", parents=common
+    )
+    subparsers.add_parser(
+        "metrics", help="Calculate the graph metrics of every book", parents=common
+    )
+    ingest_parser = subparsers.add_parser(
+        "ingest",
+        help="Add characters, interactions and metrics to Neo4j",
+        parents=common,
+    )
+    all_parser = subparsers.add_parser(
+        "all", help="Run every step in order", parents=common
+    )
+    all_parser.add_argument(
+        "--skip-scrape", action="store_true", help="Use the scraped characters"
+    )
+    all_parser.add_argument(
+        "--ingest", action="store_true", help="Also add the results to Neo4j"
+    )
+
+    for subparser in (scrape_parser, resolve_parser, all_parser):
+        subparser.add_argument(
+            "--urls",
+            default="./data/character_indices_url.csv",
+            help="CSV of the character index url of every book",
+        )
+    scrape_parser.add_argument(
+        "--journal", help="Journal to resume an interrupted scrape from"
+    )
+    all_parser.add_argument("--journal", help=argparse.SUPPRESS)
+    for subparser in (resolve_parser, all_parser):
+        subparser.add_argument(
+            "--books-dir",
+            default="./data/books",
+            help='Directory of the book texts, named like "1 Philosopher\'s Stone.txt"',
+        )
+        subparser.add_argument(
+            "--direct",
+            action="store_true",
+            help="Build the resolved docs from the original tokens",
+        )
+        subparser.add_argument(
+            "--quantize",
+            action="store_true",
+            help="Quantize the coreference model to int8 for CPU inference",
+        )
+        subparser.add_argument("--doc-cache", help="Directory of resolved doc cache")
+        subparser.add_argument(
+            "--entity-ruler-bundle", help="Directory of precompiled entity ruler"
+        )
+        subparser.add_argument(
+            "--seed",
+            type=int,
+            help="Seed of the random choice between ambiguous names (default: seeded by book and chapter)",
+        )
+    for subparser in (interactions_parser, all_parser):
+        subparser.add_argument(
+            "--thresh",
+            type=int,
+            default=14,
+            help="Distance between two characters for an interaction (default: 14)",
+        )
+    for subparser in (ingest_parser, all_parser):
+        subparser.add_argument(
+            "--env", default=".env", help="File with the Neo4j credentials"
+        )
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """Runs the command line interface.
+
+    Args:
+        argv (list[str], optional): The arguments. Defaults to None, i.e. sys.argv.
+
+    Returns:
+        int: The exit code, 0 on success, 1 if a book or chapter failed and 2 on invalid arguments
+    """
+    args = get_parser().parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        _log("--workers has to be at least 1")
+        return EXIT_USAGE
+    command = {
+        "scrape": scrape,
+        "resolve": resolve,
+        "interactions": interactions,
+        "metrics": metrics,
+        "ingest": ingest,
+        "all": run_all,
+    }[args.command]
+    try:
+        return command(args)
+    except KeyboardInterrupt:
+        _log("Interrupted")
+        return 130
+    except Exception as e:
+        _log(f"{args.command} failed: {type(e).__name__}: {e}")
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,23 +1,36 @@
 import random
 import sys
-from collections import Counter
-from dataclasses import dataclass
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import ChainMap, Counter
+from difflib import SequenceMatcher
+from dataclasses import dataclass, replace
 
+import numpy as np
 from spacy.language import Language
-from spacy.tokens import Doc
+from spacy.pipeline import Sentencizer
+from spacy.tokens import Doc, Span
 
-from .language import get_matcher
+from .character_index import CharacterIndex
+from .doc_cache import ResolvedDocCache
+from .language import CharacterMatcher, get_matcher
+from .match_store import ChapterMatches
+from .mentions import MentionMatcher
 from .scraper import Character
 
 
 @dataclass
 class MatchResult:
-    """Class representing a single match result from the matcher. Contains the string id, start and end character and the span of the match."""
+    """Class representing a single match result from the matcher. Contains the string id, start and end character and the span of the match.
+    If the doc was resolved directly, the source start and end character point at the match in the chapter text before resolution.
+    """
 
     string_id: list[str]
     start: int
     end: int
     span: str
+    source_start: int = None
+    source_end: int = None
 
     def add_string_id(self, string_id: str) -> None:
         """Add a string id to the list of string ids.
@@ -28,6 +41,11 @@ class MatchResult:
         self.string_id.append(string_id)
 
 
+# Maximum number of tokens of the chapter windows that are resolved separately
+WINDOW_SIZE = 2100
+# Splits the chapters into sentences to cut them into windows
+SENTENCIZER = Sentencizer()
+
 hardcoded_options = dict()
 hardcoded_options["Malfoy"] = ["Draco Malfoy"]
 hardcoded_options["Patil"] = ["Padma Patil", "Parvati Patil"]
@@ -79,145 +97,321 @@ hardcoded_options["Gamp"] = ["Gamp"]
 hardcoded_options["Creevey"] = ["Colin Creevey"]
 
 
+@dataclass(frozen=True)
+class TitleRule:
+    """Rule resolving an ambiguous span by the words around it, e.g. Mr. or Mrs. before a surname.
+
+    Args:
+        span (str): The ambiguous span the rule applies to
+        resolution (tuple[str, ...]): The characters the span is resolved to
+        prefix (tuple[str, ...], optional): Texts of which one has to occur in the three tokens before the span. Defaults to (), i.e. no condition.
+        suffix (tuple[str, ...], optional): Texts of which one has to occur in the three tokens after the span. Defaults to (), i.e. no condition.
+    """
+
+    span: str
+    resolution: tuple[str, ...]
+    prefix: tuple[str, ...] = ()
+    suffix: tuple[str, ...] = ()
+
+    def applies(self, prefix: str, suffix: str) -> bool:
+        """Check whether the rule applies to an occurrence of its span.
+
+        Args:
+            prefix (str): The text of the three tokens before the span
+            suffix (str): The text of the three tokens after the span
+
+        Returns:
+            bool: Whether the rule applies
+        """
+        return (not self.prefix or any(text in prefix for text in self.prefix)) and (
+            not self.suffix or any(text in suffix for text in self.suffix)
+        )
+
+
+# The first rule of a span that applies resolves it
+TITLE_RULES = [
+    # Special logic for Dursleys, if there if Mr. then Vernon, if Mrs. then Petunia
+    TitleRule(
+        "Dursley",
+        ("Vernon Dursley", "Petunia Dursley"),
+        prefix=("Mr. and Mrs.", "Mrs. and Mr."),
+    ),
+    TitleRule("Dursley", ("Petunia Dursley",), prefix=("Mrs.",)),
+    TitleRule("Dursley", ("Vernon Dursley",), prefix=("Mr.",)),
+    TitleRule(
+        "Dursley",
+        ("Vernon Dursley", "Petunia Dursley", "Dudley Dursley"),
+        suffix=("ish",),
+    ),
+    TitleRule(
+        "Weasley",
+        ("Arthur Weasley", "Molly Weasley"),
+        prefix=("Mr. and Mrs.", "Mrs. and Mr."),
+    ),
+    TitleRule("Weasley", ("Arthur Weasley",), prefix=("Mr.",)),
+    TitleRule("Weasley", ("Molly Weasley",), prefix=("Mrs.",)),
+    TitleRule("Malfoy", ("Narcissa Malfoy",), prefix=("Mrs.",)),
+    TitleRule("Malfoy", ("Lucius Malfoy",), prefix=("Mr.",)),
+    TitleRule("Malfoy", ("Draco Malfoy",)),
+    TitleRule("Diggory", ("Amos Diggory",), prefix=("Mr.",)),
+    TitleRule("Creevey", ("Colin Creevey", "Dennis Creevey"), suffix=("brothers",)),
+    TitleRule("Cattermole", ("Mary Cattermole",), prefix=("Mrs.",)),
+    TitleRule("Cattermole", ("Reginald Cattermole",), prefix=("Mr.",)),
+]
+TITLE_RULES_BY_SPAN: dict[str, list[TitleRule]] = {}
+for title_rule in TITLE_RULES:
+    TITLE_RULES_BY_SPAN.setdefault(title_rule.span, []).append(title_rule)
+
+
+class MentionIndex:
+    """Positions of the unambiguous mentions of every character in a chapter.
+
+    Every character has a list of (end, index) pairs sorted by end token, so the mention of a set
+    of characters nearest to a position is found by bisection. Ties go to the mention that comes
+    first in the results.
+
+    Args:
+        results (list[MatchResult]): The match results of the chapter
+    """
+
+    def __init__(self, results: list[MatchResult]):
+        self.positions: dict[str, list[tuple[int, int]]] = {}
+        for index, result in enumerate(results):
+            if len(result.string_id) == 1:
+                self.positions.setdefault(result.string_id[0], []).append(
+                    (result.end, index)
+                )
+        for positions in self.positions.values():
+            positions.sort()
+
+    def add(self, string_id: str, end: int, index: int) -> None:
+        """Add the mention of a result that was resolved to a single character.
+
+        Args:
+            string_id (str): The character
+            end (int): The end token of the result
+            index (int): The index of the result
+        """
+        insort(self.positions.setdefault(string_id, []), (end, index))
+
+    def nearest(self, string_ids: list[str], end: int) -> str | None:
+        """Find the character of the mention nearest to a position.
+
+        Args:
+            string_ids (list[str]): The characters to consider
+            end (int): The end token to measure the distance from
+
+        Returns:
+            str | None: The nearest character, or None if none of them is mentioned
+        """
+        best = None
+        for string_id in set(string_ids):
+            positions = self.positions.get(string_id)
+            if not positions:
+                continue
+            # The first mention with the largest end up to the position and the first one with the
+            # smallest end after it
+            i = bisect_right(positions, (end, sys.maxsize))
+            candidates = []
+            if i > 0:
+                left_end = positions[i - 1][0]
+                candidates.append(positions[bisect_left(positions, (left_end, -1))])
+            if i < len(positions):
+                candidates.append(positions[i])
+            for candidate_end, index in candidates:
+                key = (abs(end - candidate_end), index)
+                if best is None or key < best[0]:
+                    best = (key, string_id)
+        return best[1] if best is not None else None
+
+
+def get_chapter_seed(book_number: int, chapter_number: int, seed: int = None) -> str:
+    """Get the seed of the random disambiguation of a chapter.
+
+    A chapter gets the same seed whether it is resolved alone, in a batch, in a pipeline or in a
+    worker process, so all of them disambiguate it the same way.
+
+    Args:
+        book_number (int): The book number
+        chapter_number (int): The chapter number
+        seed (int, optional): Seed of the whole run, which changes the seed of every chapter. Defaults to None.
+
+    Returns:
+        str: The seed of the chapter
+    """
+    if seed is None:
+        return f"{book_number}-{chapter_number}"
+    return f"{seed}-{book_number}-{chapter_number}"
+
+
 def handle_multiple_options(
     results: list[MatchResult],
     doc: Doc,
     chapter_hardcoded_options: dict[str, list[str]] = None,
+    seed: int | str = None,
 ) -> list[MatchResult]:
     """Handle multiple options for a single entity. This is done by finding the nearest entity and using that one.
 
+    The TITLE_RULES are tried first. Otherwise the nearest unambiguous mention of one of the options
+    is looked up in a MentionIndex, and spans without one fall back to the hardcoded options.
+
     Args:
         results (list[MatchResult]): List of matched results
         doc (Doc): Spacy doc object in which the matches were found
+        chapter_hardcoded_options (dict[str, list[str]], optional): Chapter specific options for ambiguous spans, they take precedence over hardcoded_options. Defaults to None.
+        seed (int | str, optional): Seed of the random choice between several hardcoded options. Defaults to None, in which case the global random state is used.
 
     Returns:
         list[MatchResult]: List of matched results with disambiguated entities
     """
-    if chapter_hardcoded_options is None:
-        chapter_hardcoded_options = hardcoded_options
-    else:
-        for key, value in hardcoded_options.items():
-            if key in chapter_hardcoded_options:
-                continue
-            chapter_hardcoded_options[key] = value
+    options = ChainMap(chapter_hardcoded_options or {}, hardcoded_options)
+    rng = random.Random(seed) if seed is not None else random
     needs_deduplication = [
         (i, result) for i, result in enumerate(results) if len(result.string_id) > 1
     ]
+    mention_index = MentionIndex(results) if needs_deduplication else None
     for index, multiple_options in needs_deduplication:
-        # Special logic for Dursleys, if there if Mr. then Vernon, if Mrs. then Petunia
-        prefix = doc[multiple_options.start - 3 : multiple_options.start]
-        suffix = doc[multiple_options.end : multiple_options.end + 3]
-        if (multiple_options.span == "Dursley") and (
-            ("Mr. and Mrs." in prefix.text) or ("Mrs. and Mr." in prefix.text)
-        ):
-            resolution = ["Vernon Dursley", "Petunia Dursley"]
-        elif (multiple_options.span == "Dursley") and ("Mrs." in prefix.text):
-            resolution = ["Petunia Dursley"]
-        elif (multiple_options.span == "Dursley") and ("Mr." in prefix.text):
-            resolution = ["Vernon Dursley"]
-        elif (multiple_options.span == "Dursley") and ("ish" in suffix.text):
-            resolution = ["Vernon Dursley", "Petunia Dursley", "Dudley Dursley"]
-        elif (multiple_options.span == "Weasley") and (
-            ("Mr. and Mrs." in prefix.text) or ("Mrs. and Mr." in prefix.text)
-        ):
-            resolution = ["Arthur Weasley", "Molly Weasley"]
-        elif (multiple_options.span == "Weasley") and ("Mr." in prefix.text):
-            resolution = ["Arthur Weasley"]
-        elif (multiple_options.span == "Weasley") and ("Mrs." in prefix.text):
-            resolution = ["Molly Weasley"]
-        elif (multiple_options.span == "Malfoy") and ("Mrs." in prefix.text):
-            resolution = ["Narcissa Malfoy"]
-        elif (multiple_options.span == "Malfoy") and ("Mr." in prefix.text):
-            resolution = ["Lucius Malfoy"]
-        elif (multiple_options.span == "Malfoy") and (
-            not ("Mr." in prefix.text) or ("Mrs." in prefix.text)
-        ):
-            resolution = ["Draco Malfoy"]
-        elif (multiple_options.span == "Diggory") and ("Mr." in prefix.text):
-            resolution = ["Amos Diggory"]
-        elif (multiple_options.span == "Creevey") and ("brothers" in suffix.text):
-            resolution = ["Colin Creevey", "Dennis Creevey"]
-        elif (multiple_options.span == "Cattermole") and ("Mrs." in prefix.text):
-            resolution = ["Mary Cattermole"]
-        elif (multiple_options.span == "Cattermole") and ("Mr." in prefix.text):
-            resolution = ["Reginald Cattermole"]
+        prefix = doc[multiple_options.start - 3 : multiple_options.start].text
+        suffix = doc[multiple_options.end : multiple_options.end + 3].text
+        title_rule = next(
+            (
+                title_rule
+                for title_rule in TITLE_RULES_BY_SPAN.get(multiple_options.span, ())
+                if title_rule.applies(prefix, suffix)
+            ),
+            None,
+        )
+        if title_rule is not None:
+            resolution = list(title_rule.resolution)
         # Find nearest entity
         else:
-            end_char = multiple_options.end
-            distance = sys.maxsize
-            resolution = []
-            for possible_option in results:
-                # Skip multiple options and entities that don't have any of the multiple option
-                if (not len(possible_option.string_id) == 1) or (
-                    not possible_option.string_id[0] in multiple_options.string_id
-                ):
-                    continue
-                new_distance = abs(multiple_options.end - possible_option.end)
-                if new_distance < distance:
-                    distance = new_distance
-                    resolution = possible_option.string_id
+            nearest = mention_index.nearest(
+                multiple_options.string_id, multiple_options.end
+            )
+            resolution = [nearest] if nearest is not None else []
 
             if not resolution:
                 if multiple_options.span == "Senior":
                     continue
-                try:
-                    ho = chapter_hardcoded_options[multiple_options.span]
-                    if len(ho) == 1:
-                        resolution = ho
-                    else:
-                        resolution = [random.choice(ho)]
-                except:
+                ho = options.get(multiple_options.span)
+                if not ho:
                     print(
                         f"no way to disambiguate {multiple_options.span} from options: {multiple_options.string_id}"
                     )
+                elif len(ho) == 1:
+                    resolution = list(ho)
+                else:
+                    resolution = [rng.choice(ho)]
 
         results[index].string_id = resolution
+        if len(resolution) == 1:
+            mention_index.add(resolution[0], multiple_options.end, index)
     return results
 
 
-def coref_resolve_and_get_characters_matches_in_chapter(
-    base_nlp: Language,
-    nlp: Language,
-    chapter_text: str,
-    characters_seen_till_this_chapter: list[Character],
-    coref_resolver: callable,
-    chapter_hardcoded_options: dict[str, list[str]],
-) -> tuple[list[MatchResult], Doc]:
-    """Resolve coreferences and get matches for the given characters in the chapter.
+def get_chapter_windows(
+    base_nlp: Language, chapter_text: str, window_size: int = WINDOW_SIZE
+) -> list[Span]:
+    """Prepare the text of a chapter and cut it into windows that are resolved separately.
+
+    Only the tokenizer of base_nlp and a rule-based sentencizer run over the chapter. A window
+    takes as many whole sentences as fit into window_size tokens, so a coreference cluster is not
+    cut in the middle of a sentence. Sentences longer than a window are cut.
 
     Args:
         base_nlp (Language): The base nlp object without the coref and span_resolver components
-        nlp (Language): The nlp object with the coref and span_resolver components
         chapter_text (str): The text of the chapter
-        chapter_characters (list[Character]): The characters to find
-        coref_resolver (callable): The coreference resolver
+        window_size (int, optional): The maximum number of tokens of a window. Defaults to WINDOW_SIZE.
 
     Returns:
-        tuple[list[MatchResult], Doc]: The list of match results and the resolved doc
+        list[Span]: The windows, as spans of the chapter text without its title
     """
-    matcher = get_matcher(nlp, characters_seen_till_this_chapter)
-
-    # Prepare text
     lines = chapter_text.split("\n")[1:]
     lines = list(filter(None, lines))
     chapter_title = lines[0]
     print(chapter_title)
 
     text = " ".join(lines[1:])
-    base_doc = base_nlp(text)
-    resolved_doc = list()
-    for i in range(0, len(base_doc), 2100):
-        tmp = coref_resolver(base_doc[i : i + 2100].text)
-        resolved_doc.append(tmp)
-    resolved_doc = Doc.from_docs(resolved_doc)
-    # resolved_doc = coref_resolver(text)
-
-    matches = matcher(resolved_doc)
-    match_results: list[MatchResult] = []
-    for match_id, start, end in matches:
-        string_id = nlp.vocab.strings[match_id]
-        span = resolved_doc[start:end]
+    base_doc = SENTENCIZER(base_nlp.make_doc(text))
+    windows = []
+    start = end = 0
+    for sentence in base_doc.sents:
+        if sentence.end - start > window_size and end > start:
+            windows.append(base_doc[start:end])
+            start = end
+        while sentence.end - start > window_size:
+            windows.append(base_doc[start : start + window_size])
+            start += window_size
+        end = sentence.end
+    if end > start:
+        windows.append(base_doc[start:end])
+    return windows
+
+
+def join_resolved_windows(windows: list[Span], resolved_docs: list[Doc]) -> Doc:
+    """Join the resolved windows of a chapter into a single doc.
+
+    If the windows were resolved directly, doc._.source_offsets of the joined doc maps every token
+    to its character span in the chapter text.
+
+    Args:
+        windows (list[Span]): The windows of the chapter
+        resolved_docs (list[Doc]): The resolved docs of the windows
+
+    Returns:
+        Doc: The resolved doc of the chapter
+    """
+    resolved_doc = Doc.from_docs(resolved_docs, exclude=["user_data"])
+    if resolved_docs and all(doc._.source_offsets is not None for doc in resolved_docs):
+        resolved_doc._.source_offsets = [
+            (window.start_char + start, window.start_char + end)
+            for window, doc in zip(windows, resolved_docs)
+            for start, end in doc._.source_offsets
+        ]
+    return resolved_doc
+
+
+def get_match_candidates(
+    nlp: Language, resolved_doc: Doc, matcher: callable
+) -> list[MatchResult]:
+    """Get the raw matches of the characters in a resolved doc, one result per match.
+
+    Args:
+        nlp (Language): The nlp object whose vocab holds the match ids
+        resolved_doc (Doc): The doc with resolved coreferences
+        matcher (callable): The matcher of the characters to find
+
+    Returns:
+        list[MatchResult]: The matches in the order of the matcher
+    """
+    source_offsets = resolved_doc._.source_offsets
+    candidates = []
+    for match_id, start, end in matcher(resolved_doc):
+        if source_offsets is None:
+            source_start = source_end = None
+        else:
+            source_start, source_end = (
+                source_offsets[start][0],
+                source_offsets[end - 1][1],
+            )
+        candidates.append(
+            MatchResult(
+                string_id=[nlp.vocab.strings[match_id]],
+                start=start,
+                end=end,
+                span=resolved_doc[start:end].text,
+                source_start=source_start,
+                source_end=source_end,
+            )
+        )
+    return candidates
+
 
+def _merge_match_candidates_naive(candidates: list[MatchResult]) -> list[MatchResult]:
+    # The original quadratic merge, kept as the reference of merge_match_candidates
+    match_results: list[MatchResult] = []
+    for candidate in candidates:
+        start, end = candidate.start, candidate.end
         exists_long = [
             (start == res.start and end < res.end)
             or (start > res.start and end == res.end)
@@ -238,50 +432,264 @@ def coref_resolve_and_get_characters_matches_in_chapter(
 
         if any(shorter_end):
             del match_results[shorter_end.index(True)]
-            match_results.append(
-                MatchResult(
-                    string_id=[string_id],
-                    start=start,
-                    end=end,
-                    span=span.text,
-                )
-            )
+            match_results.append(candidate)
         elif any(shorter_start):
             del match_results[shorter_start.index(True)]
-            match_results.append(
-                MatchResult(
-                    string_id=[string_id],
-                    start=start,
-                    end=end,
-                    span=span.text,
-                )
-            )
+            match_results.append(candidate)
         elif not any(same):
-            match_results.append(
-                MatchResult(
-                    string_id=[string_id],
-                    start=start,
-                    end=end,
-                    span=span.text,
-                )
-            )
+            match_results.append(candidate)
         else:
             i = same.index(True)
-            match_results[i].add_string_id(string_id)
+            match_results[i].add_string_id(candidate.string_id[0])
+    return match_results
+
+
+def merge_match_candidates(candidates: list[MatchResult]) -> list[MatchResult]:
+    """Merge the raw matches of a chapter into match results.
+
+    A match is dropped if a kept result starts at the same token and ends later, or ends at the
+    same token and starts earlier. A match with the same span as a kept result adds its string id
+    to it. A match ending where a kept result starts replaces it. The kept results are indexed by
+    their start and end token, so every match is merged in constant time instead of comparing it
+    with all kept results, with the same results and order as before.
+
+    Args:
+        candidates (list[MatchResult]): The matches in the order of the matcher, see get_match_candidates
 
-    handle_multiple_options(match_results, resolved_doc, chapter_hardcoded_options)
+    Returns:
+        list[MatchResult]: The merged match results
+    """
+    kept: dict[int, MatchResult] = {}  # In the order the results were kept
+    by_start: dict[int, list[int]] = {}
+    by_end: dict[int, list[int]] = {}
+    for key, candidate in enumerate(candidates):
+        start, end = candidate.start, candidate.end
+        starting = by_start.get(start, ())
+        if any(kept[other].end > end for other in starting) or any(
+            kept[other].start < start for other in by_end.get(end, ())
+        ):
+            continue
+
+        # A kept result starting where the match ends always starts after the match starts and
+        # ends after it ends, so the first one is replaced
+        adjacent = by_start.get(end)
+        if adjacent:
+            other = adjacent.pop(0)
+            by_end[kept[other].end].remove(other)
+            del kept[other]
+        else:
+            same = next((other for other in starting if kept[other].end == end), None)
+            if same is not None:
+                kept[same].add_string_id(candidate.string_id[0])
+                continue
+        kept[key] = candidate
+        by_start.setdefault(start, []).append(key)
+        by_end.setdefault(end, []).append(key)
+    return list(kept.values())
+
+
+def get_characters_matches(
+    nlp: Language,
+    resolved_doc: Doc,
+    matcher: callable,
+    chapter_hardcoded_options: dict[str, list[str]] = None,
+    seed: int | str = None,
+) -> list[MatchResult]:
+    """Get the disambiguated character matches in a resolved doc.
+
+    Args:
+        nlp (Language): The nlp object whose vocab holds the match ids
+        resolved_doc (Doc): The doc with resolved coreferences
+        matcher (callable): The matcher of the characters to find
+        chapter_hardcoded_options (dict[str, list[str]], optional): Chapter specific options for ambiguous spans. Defaults to None.
+        seed (int | str, optional): Seed of the random disambiguation, see get_chapter_seed. Defaults to None, in which case the global random state is used.
+
+    Returns:
+        list[MatchResult]: The list of match results
+    """
+    match_results = merge_match_candidates(
+        get_match_candidates(nlp, resolved_doc, matcher)
+    )
+    handle_multiple_options(
+        match_results, resolved_doc, chapter_hardcoded_options, seed=seed
+    )
+    return match_results
+
+
+def benchmark_match_merging(
+    match_streams: list[list[MatchResult]], repeat: int = 3
+) -> dict[str, dict[str, float]]:
+    """Compare the indexed merge of the raw matches with the original quadratic one.
+
+    The match streams of real chapters are obtained with get_match_candidates, e.g. on the docs of
+    a ResolvedDocCache.
+
+    Args:
+        match_streams (list[list[MatchResult]]): The raw matches of every chapter
+        repeat (int, optional): The number of runs to take the best time of. Defaults to 3.
+
+    Returns:
+        dict[str, dict[str, float]]: For both merges, the best time per chapter in milliseconds and the fraction of chapters whose results agree with the original merge
+    """
+
+    def copy_streams():
+        return [
+            [
+                replace(candidate, string_id=list(candidate.string_id))
+                for candidate in stream
+            ]
+            for stream in match_streams
+        ]
+
+    expected = [_merge_match_candidates_naive(stream) for stream in copy_streams()]
+    report = {}
+    for name, merge in (
+        ("naive", _merge_match_candidates_naive),
+        ("indexed", merge_match_candidates),
+    ):
+        best = float("inf")
+        for _ in range(repeat):
+            streams = copy_streams()
+            start = time.perf_counter()
+            merged = [merge(stream) for stream in streams]
+            best = min(best, time.perf_counter() - start)
+        report[name] = {
+            "ms_per_chapter": 1000 * best / max(len(match_streams), 1),
+            "agreement": sum(m == e for m, e in zip(merged, expected))
+            / max(len(match_streams), 1),
+        }
+    return report
+
+
+def _get_matcher(
+    nlp: Language,
+    characters: list[Character],
+    character_matcher: CharacterMatcher | MentionMatcher = None,
+) -> callable:
+    if character_matcher is None:
+        return get_matcher(nlp, characters)
+    return character_matcher.update(characters)
+
+
+def coref_resolve_and_get_characters_matches_in_chapter(
+    base_nlp: Language,
+    nlp: Language,
+    chapter_text: str,
+    characters_seen_till_this_chapter: list[Character],
+    coref_resolver: callable,
+    chapter_hardcoded_options: dict[str, list[str]] = None,
+    character_matcher: CharacterMatcher | MentionMatcher = None,
+    doc_cache: ResolvedDocCache = None,
+    seed: int | str = None,
+) -> tuple[list[MatchResult], Doc]:
+    """Resolve coreferences and get matches for the given characters in the chapter.
+
+    Args:
+        base_nlp (Language): The base nlp object without the coref and span_resolver components
+        nlp (Language): The nlp object with the coref and span_resolver components
+        chapter_text (str): The text of the chapter
+        chapter_characters (list[Character]): The characters to find
+        coref_resolver (callable): The coreference resolver
+        chapter_hardcoded_options (dict[str, list[str]], optional): Chapter specific options for ambiguous spans. Defaults to None.
+        character_matcher (CharacterMatcher | MentionMatcher, optional): Matcher reused across chapters. Defaults to None, in which case a new matcher is built.
+        doc_cache (ResolvedDocCache, optional): Cache of resolved docs, on a hit the coreference model is skipped. Defaults to None.
+        seed (int | str, optional): Seed of the random disambiguation, see get_chapter_seed. Defaults to None, in which case the global random state is used.
+
+    Returns:
+        tuple[list[MatchResult], Doc]: The list of match results and the resolved doc
+    """
+    matcher = _get_matcher(nlp, characters_seen_till_this_chapter, character_matcher)
+    resolved_doc = doc_cache.get(chapter_text) if doc_cache is not None else None
+    if resolved_doc is None:
+        windows = get_chapter_windows(base_nlp, chapter_text)
+        resolved_doc = join_resolved_windows(
+            windows, [coref_resolver(window.text) for window in windows]
+        )
+        if doc_cache is not None:
+            doc_cache.put(chapter_text, resolved_doc)
+    match_results = get_characters_matches(
+        nlp, resolved_doc, matcher, chapter_hardcoded_options, seed=seed
+    )
     return match_results, resolved_doc
 
 
-def flatten_results(results: list[MatchResult]) -> list[MatchResult]:
+def coref_resolve_and_get_characters_matches_in_chapters(
+    base_nlp: Language,
+    nlp: Language,
+    chapters: list[tuple[str, list[Character], dict[str, list[str]]]],
+    batch_coref_resolver: callable,
+    character_matcher: CharacterMatcher | MentionMatcher = None,
+    doc_cache: ResolvedDocCache = None,
+    seeds: list[int | str] = None,
+) -> list[tuple[list[MatchResult], Doc]]:
+    """Resolve coreferences in several chapters at once and get the matches of their characters.
+
+    The windows of all chapters are handed to the batch resolver in a single call, so the
+    coreference model can pack them into batches instead of resolving one window at a time. The
+    resolved windows are then reassembled into one doc per chapter. The results are the same as
+    with coref_resolve_and_get_characters_matches_in_chapter on every chapter.
+
+    Args:
+        base_nlp (Language): The base nlp object without the coref and span_resolver components
+        nlp (Language): The nlp object with the coref and span_resolver components
+        chapters (list[tuple[str, list[Character], dict[str, list[str]]]]): The text, the characters seen till the chapter and the chapter specific options for ambiguous spans of every chapter
+        batch_coref_resolver (callable): The coreference resolver of a list of texts, e.g. FastCoref.resolve_batch
+        character_matcher (CharacterMatcher | MentionMatcher, optional): Matcher reused across chapters. Defaults to None, in which case a new matcher is built per chapter.
+        doc_cache (ResolvedDocCache, optional): Cache of resolved docs, only the chapters that miss it are resolved. Defaults to None.
+        seeds (list[int | str], optional): The seed of the random disambiguation of every chapter, see get_chapter_seed. Defaults to None, in which case the global random state is used.
+
+    Returns:
+        list[tuple[list[MatchResult], Doc]]: The list of match results and the resolved doc of every chapter
+    """
+    resolved_docs = [
+        doc_cache.get(chapter_text) if doc_cache is not None else None
+        for chapter_text, _, _ in chapters
+    ]
+    chapter_windows = {
+        i: get_chapter_windows(base_nlp, chapter_text)
+        for i, (chapter_text, _, _) in enumerate(chapters)
+        if resolved_docs[i] is None
+    }
+    window_texts = [
+        window.text for windows in chapter_windows.values() for window in windows
+    ]
+    resolved_windows = batch_coref_resolver(window_texts) if window_texts else []
+    offset = 0
+    for i, windows in chapter_windows.items():
+        resolved_docs[i] = join_resolved_windows(
+            windows, resolved_windows[offset : offset + len(windows)]
+        )
+        offset += len(windows)
+        if doc_cache is not None:
+            doc_cache.put(chapters[i][0], resolved_docs[i])
+
+    if seeds is None:
+        seeds = [None] * len(chapters)
+    results = []
+    for (_, characters, chapter_hardcoded_options), resolved_doc, seed in zip(
+        chapters, resolved_docs, seeds
+    ):
+        matcher = _get_matcher(nlp, characters, character_matcher)
+        match_results = get_characters_matches(
+            nlp, resolved_doc, matcher, chapter_hardcoded_options, seed=seed
+        )
+        results.append((match_results, resolved_doc))
+    return results
+
+
+def flatten_results(
+    results: list[MatchResult] | ChapterMatches,
+) -> list[MatchResult] | ChapterMatches:
     """Flatten the results to have a single string id per result.
 
     Args:
-        results (list[MatchResult]): List of match results
+        results (list[MatchResult] | ChapterMatches): List of match results, or the matches of a chapter in a MatchStore
 
     Returns:
-        list[MatchResult]: List of match results with a single string id per result
+        list[MatchResult] | ChapterMatches: List of match results with a single string id per result, of the same kind as the given results
     """
+    if isinstance(results, ChapterMatches):
+        return results.flatten()
     flat_results = []
     for res in results:
         if len(res.string_id) == 1:
@@ -294,46 +702,329 @@ def flatten_results(results: list[MatchResult]) -> list[MatchResult]:
                         start=res.start,
                         end=res.end,
                         span=res.span,
+                        source_start=res.source_start,
+                        source_end=res.source_end,
                     )
                 )
     return flat_results
 
 
+@dataclass
+class InteractionDistances:
+    """The interactions of a chapter for every distance threshold up to a maximum.
+
+    Every candidate interaction is stored with the smallest distance threshold above which it is
+    counted, so the interactions of any threshold up to max_distance_threshold are derived without
+    going through the matches again. The characters are kept as ids of a CharacterIndex and only
+    turned into names by interactions and histogram.
+
+    Args:
+        character_index (CharacterIndex): The index of the character ids
+        sources (np.ndarray): The character id of the first character of every interaction
+        targets (np.ndarray): The character id of the second character of every interaction, whose name never sorts before the first
+        distances (np.ndarray): The distance every interaction needs, it is counted if the threshold is larger
+        max_distance_threshold (int): The largest distance threshold the interactions are known for
+    """
+
+    character_index: CharacterIndex
+    sources: np.ndarray
+    targets: np.ndarray
+    distances: np.ndarray
+    max_distance_threshold: int
+
+    def counts(
+        self, distance_threshold: int = 14
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Get the number of interactions of every pair of character ids for a distance threshold.
+
+        Args:
+            distance_threshold (int, optional): The distance between two Entities for them to be considered an interaction. Defaults to 14.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The source and target ids and the count of every pair, in the order in which they first occur in the chapter
+        """
+        if distance_threshold > self.max_distance_threshold:
+            raise ValueError(
+                f"The distance threshold {distance_threshold} is larger than the maximum {self.max_distance_threshold}"
+            )
+        size = len(self.character_index)
+        mask = self.distances < distance_threshold
+        codes = self.sources[mask] * size + self.targets[mask]
+        pairs, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        order = np.argsort(first, kind="stable")
+        return pairs[order] // size, pairs[order] % size, counts[order]
+
+    def interactions(self, distance_threshold: int = 14) -> Counter:
+        """Get the interactions for a distance threshold.
+
+        Args:
+            distance_threshold (int, optional): The distance between two Entities for them to be considered an interaction. Defaults to 14.
+
+        Returns:
+            Counter: Counter of interactions, in the order in which they first occur in the chapter
+        """
+        names = self.character_index.names
+        return Counter(
+            {
+                (names[source], names[target]): count
+                for source, target, count in zip(
+                    *(column.tolist() for column in self.counts(distance_threshold))
+                )
+            }
+        )
+
+    def histogram(self) -> dict[tuple[str, str], np.ndarray]:
+        """Get the distance histogram of every pair of characters.
+
+        The number of interactions of a pair for a distance threshold is the sum of its histogram
+        below the threshold, i.e. histogram[pair][:distance_threshold].sum().
+
+        Returns:
+            dict[tuple[str, str], np.ndarray]: The number of interactions of every pair by the distance they need
+        """
+        names = self.character_index.names
+        size = len(self.character_index)
+        codes = self.sources * size + self.targets
+        histogram = {}
+        for pair in np.unique(codes).tolist():
+            histogram[(names[pair // size], names[pair % size])] = np.bincount(
+                self.distances[codes == pair], minlength=self.max_distance_threshold
+            )
+        return histogram
+
+
+def _get_interaction_arrays(
+    results: list[MatchResult] | ChapterMatches,
+    character_index: CharacterIndex = None,
+) -> tuple[CharacterIndex, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # The character index, the entity and the character id of the first string id of every result
+    # and their start and end. Entities with several string ids only equal the same combination.
+    if isinstance(results, ChapterMatches):
+        counts = results.id_counts
+        firsts = (results.id_offsets[:-1] - results.id_offsets[0])[counts > 0]
+        characters = np.asarray(results.character_ids[firsts], dtype=np.int64)
+        if character_index is None or character_index is results.character_index:
+            character_index = results.character_index
+        else:
+            characters = results.character_index.map_to(character_index)[characters]
+        starts, ends = results.starts[counts > 0], results.ends[counts > 0]
+        if np.all(counts[counts > 0] == 1):
+            entities = characters
+        else:
+            entity_ids = {}
+            entities = np.array(
+                [
+                    entity_ids.setdefault(tuple(result.string_id), len(entity_ids))
+                    for result in results
+                    if result.string_id
+                ],
+                dtype=np.int64,
+            )
+        return character_index, entities, characters, starts, ends
+
+    results = [result for result in results if result.string_id]
+    if character_index is None:
+        character_index = CharacterIndex(
+            sorted({result.string_id[0] for result in results})
+        )
+    entity_ids = {}
+    entities = np.array(
+        [
+            entity_ids.setdefault(tuple(result.string_id), len(entity_ids))
+            for result in results
+        ],
+        dtype=np.int64,
+    )
+    characters = np.array(
+        [character_index.add(result.string_id[0]) for result in results],
+        dtype=np.int64,
+    )
+    starts = np.array([result.start for result in results], dtype=np.int64)
+    ends = np.array([result.end for result in results], dtype=np.int64)
+    return character_index, entities, characters, starts, ends
+
+
+def get_interaction_distances(
+    results: list[MatchResult] | ChapterMatches,
+    max_distance_threshold: int = 50,
+    character_index: CharacterIndex = None,
+) -> InteractionDistances:
+    """Get the interactions from the given results for all distance thresholds up to a maximum.
+
+    The results are sorted by start and neighbouring results of the same entity are merged. Then
+    every entity interacts with the entities after it, up to the first one that is the same entity
+    or that starts at least distance_threshold tokens away from its end. So an interaction is
+    counted if the threshold is larger than the largest such distance up to the second entity. It
+    is computed with NumPy for all pairs at the same offset at once. Results without a string id
+    are left out.
+
+    Args:
+        results (list[MatchResult] | ChapterMatches): List of match results, or the matches of a chapter in a MatchStore
+        max_distance_threshold (int, optional): The largest distance threshold to get the interactions for. Defaults to 50.
+        character_index (CharacterIndex, optional): The index to number the characters with, names missing from it are added. Defaults to None, i.e. the index of the MatchStore or one of the characters of the results.
+
+    Returns:
+        InteractionDistances: The interactions for every distance threshold up to the maximum
+    """
+    character_index, entities, characters, starts, ends = _get_interaction_arrays(
+        results, character_index
+    )
+    ranks = character_index.ranks
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    # sort by start character
+    order = np.argsort(starts, kind="stable")
+    entities, characters, starts, ends = (
+        entities[order],
+        characters[order],
+        starts[order],
+        ends[order],
+    )
+    # Merge entities, a run of the same entity keeps its first start and its last end
+    first = np.ones(len(entities), dtype=bool)
+    first[1:] = entities[1:] != entities[:-1]
+    last = np.ones(len(entities), dtype=bool)
+    last[:-1] = first[1:]
+    entities, characters, starts, ends = (
+        entities[first],
+        characters[first],
+        starts[first],
+        ends[last],
+    )
+
+    sources, targets, distances, positions = [], [], [], []
+    n = len(entities)
+    # Entity i reaches entity i + offset while all entities up to it are other entities and start
+    # close enough to its end
+    reachable = np.ones(max(n - 1, 0), dtype=bool)
+    distance = np.zeros(max(n - 1, 0), dtype=np.int64)
+    for offset in range(1, n):
+        reachable = reachable[: n - offset]
+        distance = np.maximum(
+            distance[: n - offset], np.abs(ends[: n - offset] - starts[offset:])
+        )
+        reachable &= (entities[: n - offset] != entities[offset:]) & (
+            distance < max_distance_threshold
+        )
+        if not reachable.any():
+            break
+        (index,) = np.nonzero(reachable)
+        # The pair is ordered by the names of the characters
+        source, target = characters[index], characters[index + offset]
+        swap = ranks[source] > ranks[target]
+        sources.append(np.where(swap, target, source))
+        targets.append(np.where(swap, source, target))
+        distances.append(distance[index])
+        positions.append(index * n + index + offset)
+
+    if positions:
+        # Order the interactions like the entities they start from and then like their targets
+        order = np.argsort(np.concatenate(positions), kind="stable")
+        sources, targets, distances = (
+            np.concatenate(sources)[order],
+            np.concatenate(targets)[order],
+            np.concatenate(distances)[order],
+        )
+    else:
+        sources = targets = distances = np.zeros(0, dtype=np.int64)
+    return InteractionDistances(
+        character_index=character_index,
+        sources=sources,
+        targets=targets,
+        distances=distances,
+        max_distance_threshold=max_distance_threshold,
+    )
+
+
 def get_interactions(
-    results: list[MatchResult], distance_threshold: int = 14
+    results: list[MatchResult] | ChapterMatches,
+    distance_threshold: int = 14,
+    character_index: CharacterIndex = None,
 ) -> Counter:
     """Get interactions from the given results.
 
     Args:
-        results (list[MatchResult]): List of match results
+        results (list[MatchResult] | ChapterMatches): List of match results, or the matches of a chapter in a MatchStore
         distance_threshold (int, optional): The distance between two Entities for them to be considered an interaction. Defaults to 14.
+        character_index (CharacterIndex, optional): The index to number the characters with while counting. Defaults to None.
 
     Returns:
         Counter: Counter of interactions
     """
-    # sort by start character
-    results = sorted(results, key=lambda k: k.start)
-    compact_entities = []
-    # Merge entities
-    for entity in results:
-        # If the same entity occurs, prolong the end
-        if (len(compact_entities) > 0) and (
-            compact_entities[-1].string_id == entity.string_id
-        ):
-            compact_entities[-1].end = entity.end
-        else:
-            compact_entities.append(entity)
-    interactions = list()
-    # Iterate over all entities
-    for index, source in enumerate(compact_entities[:-1]):
-        # Compare with entities that come after the given one
-        for target in compact_entities[index + 1 :]:
-            if (source.string_id != target.string_id) and (
-                abs(source.end - target.start) < distance_threshold
-            ):
-                link = sorted([source.string_id[0], target.string_id[0]])
-                interactions.append(link)
-            else:
-                break
-    # Count the number of interactions
-    return Counter(map(tuple, interactions))
+    return get_interaction_distances(
+        results, distance_threshold, character_index
+    ).interactions(distance_threshold)
+
+
+def compare_coreference_quality(
+    reference_resolver,
+    candidate_resolver,
+    chapters: list[tuple[str, list[Character], dict[str, list[str]]]],
+    distance_threshold: int = 14,
+    seed: int = 0,
+) -> dict[str, float]:
+    """Compare a coreference resolver with a baseline on a sample of chapters.
+
+    This is used to check that an optimized setup, e.g. a quantized model, still resolves like the
+    full precision one. Both resolvers run every chapter through the whole matching pipeline and
+    the resolved texts and final interaction counts are compared.
+
+    Args:
+        reference_resolver (FastCoref | SpacyCoref): The baseline resolver
+        candidate_resolver (FastCoref | SpacyCoref): The resolver to check
+        chapters (list[tuple[str, list[Character], dict[str, list[str]]]]): The text, the characters seen till the chapter and the chapter specific options for ambiguous spans of every chapter
+        distance_threshold (int, optional): The distance threshold of the interactions. Defaults to 14.
+        seed (int, optional): Seed of the random disambiguation, which is reset for both resolvers. Defaults to 0.
+
+    Returns:
+        dict[str, float]: The fraction of chapters with identical resolved texts and interactions, the mean token similarity of the resolved texts, the relative error of the interaction counts and the time each resolver took
+    """
+    outputs = []
+    for resolver in (reference_resolver, candidate_resolver):
+        random.seed(seed)
+        start = time.perf_counter()
+        results = coref_resolve_and_get_characters_matches_in_chapters(
+            base_nlp=resolver.base_nlp,
+            nlp=resolver.nlp,
+            chapters=[
+                (chapter_text, characters, dict(options) if options else None)
+                for chapter_text, characters, options in chapters
+            ],
+            batch_coref_resolver=resolver.resolve_batch,
+        )
+        outputs.append((results, time.perf_counter() - start))
+
+    (reference, reference_seconds), (candidate, candidate_seconds) = outputs
+    identical_texts = identical_interactions = 0
+    similarities = []
+    count_error = count_total = 0
+    for (reference_matches, reference_doc), (candidate_matches, candidate_doc) in zip(
+        reference, candidate
+    ):
+        identical_texts += reference_doc.text == candidate_doc.text
+        similarities.append(
+            SequenceMatcher(
+                None,
+                [token.text for token in reference_doc],
+                [token.text for token in candidate_doc],
+                autojunk=False,
+            ).ratio()
+        )
+        reference_interactions = get_interactions(reference_matches, distance_threshold)
+        candidate_interactions = get_interactions(candidate_matches, distance_threshold)
+        identical_interactions += reference_interactions == candidate_interactions
+        count_error += sum(
+            abs(reference_interactions[pair] - candidate_interactions[pair])
+            for pair in reference_interactions.keys() | candidate_interactions.keys()
+        )
+        count_total += sum(reference_interactions.values())
+    n_chapters = max(len(chapters), 1)
+    return {
+        "identical_resolved_texts": identical_texts / n_chapters,
+        "resolved_text_similarity": sum(similarities) / n_chapters,
+        "identical_interactions": identical_interactions / n_chapters,
+        "interaction_count_error": count_error / max(count_total, 1),
+        "reference_seconds": reference_seconds,
+        "candidate_seconds": candidate_seconds,
+    }
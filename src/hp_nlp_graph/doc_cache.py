@@ -0,0 +1,136 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import tempfile
+
+from spacy.tokens import Doc, DocBin
+
+from .language import SPACY_MODEL
+
+# Bump when the windowing or the resolution logic changes, which invalidates all cached docs
+RESOLVED_DOC_CACHE_VERSION = 2
+# Settings of the fastcoref component that do not change the resolved docs
+IGNORED_CONFIG_KEYS = ("enable_progress_bar", "num_threads", "device")
+# Packages whose versions change the resolved docs, next to the spaCy model
+RESOLVER_PACKAGES = ("spacy", "fastcoref", "transformers", "torch")
+
+
+def get_package_versions(packages: tuple[str, ...]) -> dict[str, str | None]:
+    """Get the installed versions of packages from their metadata, without importing them.
+
+    Args:
+        packages (tuple[str, ...]): The distribution names, e.g. RESOLVER_PACKAGES and the spaCy model
+
+    Returns:
+        dict[str, str | None]: The version of every package, None if it is not installed
+    """
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def get_resolver_fingerprint(resolver) -> dict:
+    """Describe everything about a coreference resolver that changes the docs it resolves.
+
+    Args:
+        resolver (FastCoref | SpacyCoref): The coreference resolver
+
+    Returns:
+        dict: The package, pipeline and coreference model versions and the settings of the resolver
+    """
+    components = {}
+    for name, component in resolver.nlp.components:
+        config = getattr(component, "config", None)
+        coref_model = getattr(component, "coref_model", None)
+        components[name] = {
+            "factory": resolver.nlp.get_pipe_meta(name).factory,
+            "config": {
+                key: value
+                for key, value in config.items()
+                if key not in IGNORED_CONFIG_KEYS
+            }
+            if isinstance(config, dict)
+            else None,
+            "model": getattr(coref_model, "model_name_or_path", None),
+            "quantize": getattr(component, "quantize", None),
+        }
+    return {
+        "version": RESOLVED_DOC_CACHE_VERSION,
+        "packages": get_package_versions((*RESOLVER_PACKAGES, SPACY_MODEL)),
+        "pipeline": f"{resolver.nlp.meta.get('name')}-{resolver.nlp.meta.get('version')}",
+        "components": components,
+        "base_components": resolver.base_nlp.pipe_names,
+        "resolver": type(resolver).__name__,
+        "direct": getattr(resolver, "direct", False),
+        "head_only_clusters": getattr(resolver, "head_only_clusters", None),
+    }
+
+
+class ResolvedDocCache:
+    """A persistent cache of coreference resolved chapter docs.
+
+    The docs are stored as DocBins keyed by the hash of the chapter text and the fingerprint of the
+    resolver, so changing the matching rules, the hardcoded options or the interaction threshold
+    reuses them, while another model, pipeline or resolution mode misses the cache.
+
+    Args:
+        directory (str): The directory to store the cache in.
+        resolver (FastCoref | SpacyCoref): The coreference resolver whose docs are cached.
+    """
+
+    def __init__(self, directory: str, resolver) -> None:
+        self.directory = directory
+        self.vocab = resolver.base_nlp.vocab
+        self.fingerprint = hashlib.sha256(
+            json.dumps(get_resolver_fingerprint(resolver), sort_keys=True).encode(
+                "utf-8"
+            )
+        ).hexdigest()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chapter_text: str) -> str:
+        key = hashlib.sha256(
+            (self.fingerprint + chapter_text).encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.directory, key[:2], key + ".spacy")
+
+    def get(self, chapter_text: str) -> Doc | None:
+        """Gets the resolved doc of a chapter.
+
+        Args:
+            chapter_text (str): The text of the chapter.
+
+        Returns:
+            Doc | None: The resolved doc, or None if it is not cached.
+        """
+        try:
+            with open(self._path(chapter_text), "rb") as f:
+                doc_bin = DocBin().from_bytes(f.read())
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return next(doc_bin.get_docs(self.vocab))
+
+    def put(self, chapter_text: str, resolved_doc: Doc) -> None:
+        """Stores the resolved doc of a chapter.
+
+        Args:
+            chapter_text (str): The text of the chapter.
+            resolved_doc (Doc): The resolved doc.
+        """
+        doc_bin = DocBin(store_user_data=True)
+        doc_bin.add(resolved_doc)
+        path = self._path(chapter_text)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(doc_bin.to_bytes())
+        os.replace(tmp_path, path)
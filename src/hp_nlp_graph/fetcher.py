@@ -0,0 +1,163 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import CacheMissError, ResponseCache
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """A thread-safe token bucket used to rate limit outgoing requests.
+
+    Args:
+        rate (float): Number of tokens added to the bucket per second.
+        capacity (int, optional): Maximum number of tokens the bucket can hold, i.e. the allowed burst size. Defaults to 1.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError("The rate of the token bucket must be positive.")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a token is available and consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    """Fetches pages over a pooled HTTP session with rate limiting and retries.
+
+    A single Fetcher can be shared between threads. Requests are throttled by a token bucket and
+    failed requests (connection errors, timeouts and the status codes in RETRY_STATUS_CODES) are
+    retried with exponential backoff. If a cache is given, pages are served from disk when possible,
+    stale entries are revalidated with conditional requests and, in offline mode, no request is sent.
+
+    Args:
+        requests_per_second (float, optional): Sustained request rate. Defaults to 4.0.
+        burst (int, optional): Number of requests that may be sent back to back. Defaults to 1.
+        max_retries (int, optional): Number of retries for a failed request. Defaults to 3.
+        backoff_factor (float, optional): Base delay in seconds of the exponential backoff. Defaults to 1.0.
+        pool_size (int, optional): Number of pooled connections per host. Defaults to 16.
+        timeout (float, optional): Timeout of a single request in seconds. Defaults to 30.
+        cache (ResponseCache, optional): The on-disk cache of responses. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        requests_per_second: float = 4.0,
+        burst: int = 1,
+        max_retries: int = 3,
+        backoff_factor: float = 1.0,
+        pool_size: int = 16,
+        timeout: float = 30,
+        cache: ResponseCache = None,
+    ) -> None:
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff(self, attempt: int, response: requests.Response = None) -> float:
+        retry_after = (
+            response.headers.get("Retry-After") if response is not None else None
+        )
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * 2**attempt
+
+    def request(self, url: str, headers: dict[str, str] = None) -> requests.Response:
+        """Sends a GET request, retrying on transient failures.
+
+        Args:
+            url (str): The url to fetch.
+            headers (dict[str, str], optional): Additional request headers. Defaults to None.
+
+        Raises:
+            requests.HTTPError: If the server still answers with a retryable status code after all retries.
+
+        Returns:
+            requests.Response: The response of the server.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            if attempt == self.max_retries:
+                response.raise_for_status()
+            time.sleep(self._backoff(attempt, response))
+        return response
+
+    def get(self, url: str) -> str:
+        """Gets the text of a page, going through the cache if there is one.
+
+        Args:
+            url (str): The url to fetch.
+
+        Raises:
+            CacheMissError: If the cache is offline and does not contain the url.
+
+        Returns:
+            str: The text of the page.
+        """
+        if self.cache is None:
+            return self.request(url).text
+        entry = self.cache.lookup(url)
+        if self.cache.offline:
+            if entry is None:
+                raise CacheMissError(f"{url} is not in the offline cache.")
+            return self.cache.read_text(entry)
+        if entry is not None and not self.cache.is_stale(entry):
+            return self.cache.read_text(entry)
+
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        response = self.request(url, headers=headers)
+        if entry is not None and response.status_code == 304:
+            self.cache.refresh(entry)
+            return self.cache.read_text(entry)
+        if response.ok:
+            self.cache.store(
+                url,
+                response.content,
+                encoding=response.encoding or response.apparent_encoding,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        return response.text
+
+    def close(self) -> None:
+        """Closes the pooled connections."""
+        self.session.close()
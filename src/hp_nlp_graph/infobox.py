@@ -0,0 +1,383 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+from bs4 import BeautifulSoup
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+
+@dataclass
+class InfoboxItem:
+    """A list item of an infobox field.
+
+    Args:
+        text (str): The text of the item including its nested items.
+        has_sublist (bool): Whether the item contains a nested list.
+        link_text (str, optional): The text of the first link in the item, if any.
+    """
+
+    text: str
+    has_sublist: bool
+    link_text: str = None
+
+
+@dataclass
+class InfoboxField:
+    """A field of a character's portable infobox, e.g. the `house` or `alias` field.
+
+    Args:
+        name (str): The data-source name of the field.
+        value_text (str, optional): The text of the value div of the field, if any.
+        items (list[InfoboxItem]): The list items of the field in document order.
+    """
+
+    name: str
+    value_text: str = None
+    items: list[InfoboxItem] = field(default_factory=list)
+
+
+@dataclass
+class InfoboxResult:
+    """The attributes extracted from an infobox.
+
+    Args:
+        values (dict): The parsed attributes by attribute name.
+        errors (dict[str, str]): The attributes whose field exists but could not be parsed, with the reason.
+        missing (list[str]): The attributes whose field does not exist on the page.
+    """
+
+    values: dict = field(default_factory=dict)
+    errors: dict[str, str] = field(default_factory=dict)
+    missing: list[str] = field(default_factory=list)
+
+
+def _clean(text: str) -> str:
+    return text.split("[")[0].split("(")[0].strip()
+
+
+def parse_aliases(infobox_field: InfoboxField) -> list[str]:
+    """Parses the aliases of a character, skipping disguises.
+
+    Args:
+        infobox_field (InfoboxField): The `alias` field.
+
+    Returns:
+        list[str]: A list of aliases for the character.
+    """
+    return [
+        _clean(item.text)
+        for item in infobox_field.items
+        if not ("disguise" in item.text or "the name he told" in item.text)
+    ]
+
+
+def parse_loyalties(infobox_field: InfoboxField) -> list[str]:
+    """Parses the loyalties of a character. Items with sub-lists are represented by their first link.
+
+    Args:
+        infobox_field (InfoboxField): The `loyalty` field.
+
+    Raises:
+        ValueError: If an item with a sub-list has no link.
+
+    Returns:
+        list[str]: A list of loyalties for the character.
+    """
+    loyalties_list = []
+    for item in infobox_field.items:
+        if not item.has_sublist:
+            loyalties_list.append(_clean(item.text))
+        elif item.link_text is None:
+            raise ValueError(f"Loyalty {item.text!r} has a sub-list but no link.")
+        else:
+            loyalties_list.append(_clean(item.link_text))
+    return loyalties_list
+
+
+def parse_family_relationships(infobox_field: InfoboxField) -> list[dict[str, str]]:
+    """Parses the family relationships of a character.
+
+    Args:
+        infobox_field (InfoboxField): The `family` field.
+
+    Returns:
+        list[dict[str, str]]: A list of family relationships for the character.
+    """
+    return [
+        {
+            "person": _clean(item.text),
+            "type": item.text.split("(")[-1].split(")")[0].split("[")[0],
+        }
+        for item in infobox_field.items
+    ]
+
+
+def parse_value(infobox_field: InfoboxField) -> str:
+    """Parses a single valued field.
+
+    Args:
+        infobox_field (InfoboxField): The field to parse.
+
+    Raises:
+        ValueError: If the field has no value.
+
+    Returns:
+        str: The value of the field.
+    """
+    if infobox_field.value_text is None:
+        raise ValueError(f"Field {infobox_field.name!r} has no value.")
+    return _clean(infobox_field.value_text)
+
+
+# (attribute name, data-source name, parser)
+INFOBOX_FIELDS = [
+    ("aliases", "alias", parse_aliases),
+    ("loyalties", "loyalty", parse_loyalties),
+    ("family_relations", "family", parse_family_relationships),
+    ("blood_status", "blood", parse_value),
+    ("nationality", "nationality", parse_value),
+    ("species", "species", parse_value),
+    ("house", "house", parse_value),
+    ("gender", "gender", parse_value),
+]
+DATA_SOURCES = {data_source for _, data_source, _ in INFOBOX_FIELDS}
+
+
+def _iter_field_divs(roots: list, find_divs: callable, fields: dict[str, InfoboxField]):
+    # The infobox is searched first since it is a small part of the page, and the whole page only
+    # for the fields that are not in it, as the per-attribute scraper functions search the page
+    for root in roots:
+        if root is None:
+            continue
+        yield from find_divs(root)
+        if len(fields) == len(DATA_SOURCES):
+            return
+
+
+def _bs4_fields(html: str, features: str) -> dict[str, InfoboxField]:
+    soup = BeautifulSoup(html, features)
+    aside = soup.find("aside", class_="portable-infobox")
+    fields = {}
+    for div in _iter_field_divs(
+        [aside, soup],
+        lambda root: root.find_all(
+            "div", attrs={"data-source": DATA_SOURCES.__contains__}
+        ),
+        fields,
+    ):
+        name = div["data-source"]
+        if name in fields:
+            continue
+        value = div.find("div")
+        items = []
+        for li in div.find_all("li"):
+            link = li.find("a")
+            items.append(
+                InfoboxItem(
+                    text=li.text,
+                    has_sublist=li.find("ul") is not None,
+                    link_text=link.text if link is not None else None,
+                )
+            )
+        fields[name] = InfoboxField(
+            name=name,
+            value_text=value.text if value is not None else None,
+            items=items,
+        )
+    return fields
+
+
+def _lxml_fields(html: str) -> dict[str, InfoboxField]:
+    import lxml.html
+
+    tree = lxml.html.fromstring(html)
+    asides = tree.xpath(
+        '//aside[contains(concat(" ", normalize-space(@class), " "), " portable-infobox ")]'
+    )
+    fields = {}
+    for div in _iter_field_divs(
+        [asides[0] if asides else None, tree], lambda root: root.iter("div"), fields
+    ):
+        name = div.get("data-source")
+        if name not in DATA_SOURCES or name in fields:
+            continue
+        value = next(div.iterdescendants("div"), None)
+        items = []
+        for li in div.iterdescendants("li"):
+            link = next(li.iterdescendants("a"), None)
+            items.append(
+                InfoboxItem(
+                    text=li.text_content(),
+                    has_sublist=next(li.iterdescendants("ul"), None) is not None,
+                    link_text=link.text_content() if link is not None else None,
+                )
+            )
+        fields[name] = InfoboxField(
+            name=name,
+            value_text=value.text_content() if value is not None else None,
+            items=items,
+        )
+    return fields
+
+
+def _selectolax_fields(html: str) -> dict[str, InfoboxField]:
+    from selectolax.parser import HTMLParser
+
+    tree = HTMLParser(html)
+    fields = {}
+    for div in _iter_field_divs(
+        [tree.css_first("aside.portable-infobox"), tree.root],
+        lambda root: root.css("div[data-source]"),
+        fields,
+    ):
+        name = div.attributes.get("data-source")
+        if name not in DATA_SOURCES or name in fields:
+            continue
+        value = div.css_first("div")
+        items = []
+        for li in div.css("li"):
+            link = li.css_first("a")
+            items.append(
+                InfoboxItem(
+                    text=li.text(deep=True),
+                    has_sublist=li.css_first("ul") is not None,
+                    link_text=link.text(deep=True) if link is not None else None,
+                )
+            )
+        fields[name] = InfoboxField(
+            name=name,
+            value_text=value.text(deep=True) if value is not None else None,
+            items=items,
+        )
+    return fields
+
+
+def _default_backend() -> str:
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+
+DEFAULT_PARSER_BACKEND = _default_backend()
+
+
+def get_infobox_fields(
+    html: str, backend: str = DEFAULT_PARSER_BACKEND
+) -> dict[str, InfoboxField]:
+    """Collects the fields of a character's portable infobox in a single walk over it.
+
+    Args:
+        html (str): The html of the character's page.
+        backend (str, optional): The html parser to use, one of PARSER_BACKENDS. Defaults to lxml if it is installed, html.parser otherwise.
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        dict[str, InfoboxField]: The first field of every data-source name of interest.
+    """
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Invalid parser backend {backend}")
+    if backend == "lxml":
+        return _lxml_fields(html)
+    if backend == "selectolax":
+        return _selectolax_fields(html)
+    return _bs4_fields(html, backend)
+
+
+def extract_infobox(html: str, backend: str = DEFAULT_PARSER_BACKEND) -> InfoboxResult:
+    """Extracts every attribute of INFOBOX_FIELDS from a character's page.
+
+    Args:
+        html (str): The html of the character's page.
+        backend (str, optional): The html parser to use, one of PARSER_BACKENDS. Defaults to lxml if it is installed, html.parser otherwise.
+
+    Returns:
+        InfoboxResult: The parsed attributes together with the per-field failures.
+    """
+    fields = get_infobox_fields(html, backend)
+    result = InfoboxResult()
+    for attr_name, data_source, parser in INFOBOX_FIELDS:
+        if data_source not in fields:
+            result.missing.append(attr_name)
+            continue
+        try:
+            result.values[attr_name] = parser(fields[data_source])
+        except Exception as e:
+            result.errors[attr_name] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def load_pages(directory_path: str) -> list[str]:
+    """Loads a corpus of saved character pages, e.g. the objects of a ResponseCache.
+
+    Args:
+        directory_path (str): The directory containing the pages. It is searched recursively.
+
+    Returns:
+        list[str]: The html of the pages.
+    """
+    pages = []
+    for root, _, names in os.walk(directory_path):
+        for name in sorted(names):
+            with open(os.path.join(root, name), "rb") as f:
+                pages.append(f.read().decode("utf-8", errors="replace"))
+    return pages
+
+
+def benchmark_infobox_extraction(
+    pages: list[str], backends: list[str] = None, repeat: int = 3
+) -> dict[str, dict[str, float]]:
+    """Compares the single-pass extractor with the per-attribute scraper functions.
+
+    Args:
+        pages (list[str]): The html of the character pages to extract from.
+        backends (list[str], optional): The parser backends to benchmark. Defaults to all installed backends.
+        repeat (int, optional): The number of runs to take the best time of. Defaults to 3.
+
+    Returns:
+        dict[str, dict[str, float]]: For the legacy functions and every backend, the best time per page in milliseconds and the fraction of pages whose attributes agree with the legacy functions.
+    """
+    from .scraper import ATTRIBUTES_TO_SCRAPE
+
+    def legacy(html):
+        soup = BeautifulSoup(html, "html.parser")
+        values = {}
+        for attr_name, scraper_func in ATTRIBUTES_TO_SCRAPE:
+            try:
+                values[attr_name] = scraper_func(soup)
+            except Exception:
+                pass
+        return values
+
+    if backends is None:
+        backends = []
+        for backend in PARSER_BACKENDS:
+            try:
+                get_infobox_fields("<html></html>", backend)
+            except ImportError:
+                continue
+            backends.append(backend)
+    candidates = {"legacy": legacy}
+    for backend in backends:
+        candidates[backend] = lambda html, backend=backend: extract_infobox(
+            html, backend
+        ).values
+
+    expected = [legacy(html) for html in pages]
+    report = {}
+    for name, extract in candidates.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            values = [extract(html) for html in pages]
+            best = min(best, time.perf_counter() - start)
+        report[name] = {
+            "ms_per_page": 1000 * best / max(len(pages), 1),
+            "agreement": sum(v == e for v, e in zip(values, expected))
+            / max(len(pages), 1),
+        }
+    return report
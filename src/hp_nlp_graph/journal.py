@@ -0,0 +1,89 @@
+import json
+import os
+import threading
+
+
+class ScrapeJournal:
+    """An append-only journal of scraping progress, stored as json lines.
+
+    Every scraped character index and every enriched character is appended as soon as it is
+    available, so a crashed or throttled scrape can resume from the last checkpoint. Later records
+    supersede earlier ones, which lets a refresh append new versions of the characters whose pages
+    changed. A truncated last line, e.g. after a crash mid-write, is ignored.
+
+    Args:
+        path (str): The path of the journal file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.books: dict[int, list[dict]] = {}
+        self.completed_books: set[int] = set()
+        self.characters: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._apply(record)
+
+    def _apply(self, record: dict) -> None:
+        if record["type"] == "book":
+            self.books[record["book"]] = record["chapters"]
+            self.completed_books.discard(record["book"])
+        elif record["type"] == "book_done":
+            self.completed_books.add(record["book"])
+        elif record["type"] == "character":
+            self.characters[record["href"]] = record
+
+    def _append(self, record: dict) -> None:
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def record_book(self, book: int, chapters: list[dict]) -> None:
+        """Records the scraped character index of a book.
+
+        Args:
+            book (int): The book number.
+            chapters (list[dict]): The chapters of the book, as {"chapter": int, "characters": [[title, href], ...]}.
+        """
+        self._append({"type": "book", "book": book, "chapters": chapters})
+
+    def record_book_done(self, book: int) -> None:
+        """Records that every character of a book has been enriched.
+
+        Args:
+            book (int): The book number.
+        """
+        self._append({"type": "book_done", "book": book})
+
+    def record_character(
+        self, href: str, digest: str, attributes: dict, errors: dict[str, str]
+    ) -> None:
+        """Records an enriched character.
+
+        Args:
+            href (str): The href of the character.
+            digest (str): The hash of the character's page the attributes were extracted from.
+            attributes (dict): The extracted attributes.
+            errors (dict[str, str]): The fields that could not be parsed.
+        """
+        self._append(
+            {
+                "type": "character",
+                "href": href,
+                "digest": digest,
+                "attributes": attributes,
+                "errors": errors,
+            }
+        )
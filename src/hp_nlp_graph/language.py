@@ -1,58 +1,447 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
 from dataclasses import dataclass
 from typing import Literal, get_args
 
 import spacy
 from spacy.matcher import Matcher
-import spacy_experimental
-from fastcoref import LingMessCoref, spacy_component
+from spacy.pipeline import EntityRuler
 from spacy.language import Language
 from spacy.tokens import Doc
+from spacy.vocab import Vocab
 
 from .language_constants import REMOVE_WORDS, SHORT_FORMS, STOP_WORDS
 from .scraper import Character
 
 NLP_TYPES = Literal["spacy", "fastcoref"]
+REMOVE_WORDS_SET = frozenset(REMOVE_WORDS)
+MATCHER_STATE_VERSION = 1
+ENTITY_RULER_BUNDLE_VERSION = 1
+# Files EntityRuler.to_disk writes, which have to be complete before meta.json is written
+ENTITY_RULER_BUNDLE_FILES = ("patterns.jsonl", "cfg")
+SPACY_MODEL = "en_core_web_sm"
+# Components of SPACY_MODEL that nothing downstream uses. The tagger and attribute ruler are kept
+# because fastcoref picks cluster heads by part of speech and possessives by tag.
+UNUSED_COMPONENTS = ["parser", "lemmatizer", "senter"]
+FASTCOREF_CONFIG = {
+    "model_architecture": "LingMessCoref",
+    "model_path": "biu-nlp/lingmess-coref",
+    "enable_progress_bar": False,
+}
+
+
+# Resident memory of a worker process with spaCy and the fastcoref model loaded
+RESOLVE_WORKER_MEMORY_MB = 3072
+
+
+def get_rss_mb() -> float:
+    """Get the resident memory of the current process.
+
+    Returns:
+        float: Resident set size in MiB
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        import resource
+
+        # Peak instead of current memory where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _StartupTimer:
+    def __init__(self, report: list[dict], stage: str):
+        self.report = report
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.rss = get_rss_mb()
+
+    def __exit__(self, *exc_info):
+        if self.report is not None:
+            self.report.append(
+                {
+                    "stage": self.stage,
+                    "seconds": time.perf_counter() - self.start,
+                    "rss_mb": get_rss_mb() - self.rss,
+                }
+            )
+
+
+def select_device(device: str = "auto", quantize: bool = False) -> str:
+    """Select the device to run coreference resolution on.
+
+    Args:
+        device (str, optional): The requested device. Defaults to "auto", in which case the first GPU is used if CUDA is available and the CPU otherwise.
+        quantize (bool, optional): Whether the model is to be quantized, which is only supported on the CPU, so "auto" selects the CPU. Defaults to False.
+
+    Returns:
+        str: The device
+    """
+    if device != "auto":
+        return device
+    if quantize:
+        return "cpu"
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    return "cuda:0" if torch.cuda.is_available() else "cpu"
+
+
+def get_available_memory_mb() -> float | None:
+    """Get the memory available to new processes without swapping.
+
+    Returns:
+        float | None: Available memory in MiB, or None where /proc/meminfo is not available
+    """
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def get_default_resolve_workers() -> int:
+    """Get the number of coreference worker processes that fit into the available memory.
+
+    Every worker loads its own spaCy and fastcoref models, so one worker per CPU can run out of
+    memory. A worker is started for every RESOLVE_WORKER_MEMORY_MB of available memory, but not
+    more than one per CPU, and a single one if the available memory is unknown.
+
+    Returns:
+        int: Number of worker processes, at least 1
+    """
+    available_mb = get_available_memory_mb()
+    if available_mb is None:
+        return 1
+    return max(
+        1, min(get_default_num_threads(), int(available_mb // RESOLVE_WORKER_MEMORY_MB))
+    )
+
+
+def get_default_num_threads() -> int:
+    """Get the number of CPUs this process may run on.
+
+    Returns:
+        int: Number of usable CPUs
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def optimize_coref_resolver(
+    resolver, quantize: bool = False, num_threads: int = None
+) -> None:
+    """Tune a loaded fastcoref component for CPU inference.
+
+    Dynamic quantization stores the weights of the linear layers of the model as int8 and
+    quantizes the activations on the fly, which speeds up inference on CPUs with little effect on
+    the clusters. Use compare_coreference_quality to check it on a sample of chapters.
+
+    Args:
+        resolver (FastCorefResolver): The fastcoref component
+        quantize (bool, optional): Whether to quantize the model to int8. Defaults to False.
+        num_threads (int, optional): Number of intra-op threads of torch. Defaults to None, in which case it is left as it is.
+
+    Raises:
+        ValueError: If the model is to be quantized but does not run on the CPU
+    """
+    import torch
+
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+    if not quantize:
+        return
+    coref_model = resolver.coref_model
+    if coref_model.device.type != "cpu":
+        raise ValueError(
+            f"Dynamic quantization is only supported on the CPU, not on {coref_model.device}"
+        )
+    coref_model.model = torch.quantization.quantize_dynamic(
+        coref_model.model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+class LazyFastCoref:
+    """Pipeline component that loads the fastcoref model on first use.
+
+    It forwards to fastcoref's FastCorefResolver, which is created with the same configuration the
+    first time a document is processed. Until then neither torch nor the model weights are loaded.
+    The time and resident memory the loading took are kept in load_report.
+
+    Args:
+        nlp (Language): The pipeline the component is added to
+        name (str): The name of the component
+        quantize (bool, optional): Whether to quantize the model to int8 once it is loaded. Defaults to False.
+        num_threads (int, optional): Number of intra-op threads of torch. Defaults to None, in which case it is left as it is.
+        **config: The configuration of the fastcoref component
+    """
+
+    def __init__(
+        self,
+        nlp: Language,
+        name: str,
+        quantize: bool = False,
+        num_threads: int = None,
+        **config,
+    ):
+        self.nlp = nlp
+        self.name = name
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.config = config
+        self.load_report = []
+        self._resolver = None
+        if not Doc.has_extension("resolved_text"):
+            Doc.set_extension("resolved_text", default="")
+        if not Doc.has_extension("coref_clusters"):
+            Doc.set_extension("coref_clusters", default=None)
+
+    @property
+    def resolver(self):
+        if self._resolver is None:
+            with _StartupTimer(self.load_report, self.name):
+                from fastcoref.spacy_component import FastCorefResolver
+
+                self._resolver = FastCorefResolver(self.nlp, self.name, **self.config)
+                optimize_coref_resolver(
+                    self._resolver, quantize=self.quantize, num_threads=self.num_threads
+                )
+        return self._resolver
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._resolver is not None
+
+    def __call__(self, doc: Doc, resolve_text: bool = False) -> Doc:
+        return self.resolver(doc, resolve_text=resolve_text)
+
+    def pipe(self, stream, batch_size: int = 512, resolve_text: bool = False):
+        return self.resolver.pipe(
+            stream, batch_size=batch_size, resolve_text=resolve_text
+        )
+
+
+@Language.factory(
+    "lazy_fastcoref",
+    assigns=["doc._.resolved_text", "doc._.coref_clusters"],
+    default_config={
+        "model_architecture": "FCoref",
+        "model_path": "biu-nlp/f-coref",
+        "device": None,
+        "max_tokens_in_batch": 10000,
+        "enable_progress_bar": True,
+        "quantize": False,
+        "num_threads": None,
+    },
+)
+def create_lazy_fastcoref(
+    nlp: Language,
+    name: str,
+    model_architecture: str,
+    model_path: str,
+    device: str,
+    max_tokens_in_batch: int,
+    enable_progress_bar: bool,
+    quantize: bool,
+    num_threads: int,
+) -> LazyFastCoref:
+    return LazyFastCoref(
+        nlp,
+        name,
+        quantize=quantize,
+        num_threads=num_threads,
+        model_architecture=model_architecture,
+        model_path=model_path,
+        device=device,
+        max_tokens_in_batch=max_tokens_in_batch,
+        enable_progress_bar=enable_progress_bar,
+    )
+
+
+def _get_base_components(nlp: Language) -> list[str]:
+    components = ["ner"]
+    if "tok2vec" in nlp.pipe_names and (
+        "ner" in nlp.get_pipe("tok2vec").listening_components
+    ):
+        components.insert(0, "tok2vec")
+    return components
 
 
 def get_coref_resolver_nlp(
-    type: NLP_TYPES = "fastcoref", device: str = "cpu"
+    type: NLP_TYPES = "fastcoref",
+    device: str = "auto",
+    lean: bool = True,
+    lazy: bool = True,
+    report: list[dict] = None,
+    max_tokens_in_batch: int = 10000,
+    quantize: bool = False,
+    num_threads: int = None,
 ) -> tuple[Language, Language]:
     """Get Spacy NLP object with coreference resolution.
 
+    In lean mode SPACY_MODEL is loaded once without its UNUSED_COMPONENTS, and the base NLP object
+    shares its vocab, tokenizer and NER component instead of loading the model a second time.
+
     Args:
         type (NLP_TYPES, optional): Type of NLP to use. Defaults to "fastcoref".
-        device (str, optional): Device to run coreference resolution on. Defaults to "cpu".
+        device (str, optional): Device to run coreference resolution on. Defaults to "auto", see select_device, which picks the CPU if quantize is set.
+        lean (bool, optional): Whether to load a single, stripped down model. Defaults to True.
+        lazy (bool, optional): Whether to load the fastcoref model on first use. Defaults to True.
+        report (list[dict], optional): List to append the time and resident memory of every startup stage to. Defaults to None.
+        max_tokens_in_batch (int, optional): Token budget of a fastcoref batch, documents are padded to multiples of the model's segment length. Defaults to 10000.
+        quantize (bool, optional): Whether to quantize the fastcoref model to int8 for CPU inference. Defaults to False.
+        num_threads (int, optional): Number of intra-op threads of torch, e.g. get_default_num_threads(). Defaults to None, in which case it is left as it is.
 
     Raises:
-        ValueError: If type is not "spacy" or "fastcoref"
+        ValueError: If type is not "spacy" or "fastcoref", or the model is to be quantized but does not run on the CPU
 
     Returns:
         tuple[Language, Language]: Tuple of Spacy NLP objects. 1. Base NLP object, 2. NLP object with coreference resolution
     """
     if type not in get_args(NLP_TYPES):
         raise ValueError(f"Invalid type {type} for NLP")
-    base_nlp = spacy.load("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
+    device = select_device(device, quantize=quantize)
+    if quantize and not device.startswith("cpu"):
+        raise ValueError(f"Quantization is only supported on the CPU, not on {device}")
+    if lean:
+        with _StartupTimer(report, SPACY_MODEL):
+            nlp = spacy.load(SPACY_MODEL, exclude=UNUSED_COMPONENTS)
+        with _StartupTimer(report, "base_nlp"):
+            base_nlp = spacy.blank(nlp.lang, vocab=nlp.vocab)
+            base_nlp.tokenizer = nlp.tokenizer
+            for name in _get_base_components(nlp):
+                base_nlp.add_pipe(name, source=nlp)
+    else:
+        with _StartupTimer(report, SPACY_MODEL):
+            base_nlp = spacy.load(SPACY_MODEL)
+            nlp = spacy.load(SPACY_MODEL)
     if type == "spacy":
+        import spacy_experimental
+
         nlp_coref = spacy.load("en_coreference_web_trf")
         nlp_coref.replace_listeners("transformer", "coref", ["model.tok2vec"])
         nlp_coref.replace_listeners("transformer", "span_resolver", ["model.tok2vec"])
 
-        nlp.add_pipe("coref", source=nlp_coref)
-        nlp.add_pipe("span_resolver", source=nlp_coref)
-    else:
+        with _StartupTimer(report, "coref"):
+            nlp.add_pipe("coref", source=nlp_coref)
+            nlp.add_pipe("span_resolver", source=nlp_coref)
+    elif lazy:
         nlp.add_pipe(
-            "fastcoref",
+            "lazy_fastcoref",
+            name="fastcoref",
             config={
-                "model_architecture": "LingMessCoref",
-                "model_path": "biu-nlp/lingmess-coref",
+                **FASTCOREF_CONFIG,
                 "device": device,
-                "enable_progress_bar": False,
+                "max_tokens_in_batch": max_tokens_in_batch,
+                "quantize": quantize,
+                "num_threads": num_threads,
             },
         )
+    else:
+        with _StartupTimer(report, "fastcoref"):
+            from fastcoref import spacy_component
+
+            nlp.add_pipe(
+                "fastcoref",
+                config={
+                    **FASTCOREF_CONFIG,
+                    "device": device,
+                    "max_tokens_in_batch": max_tokens_in_batch,
+                },
+            )
+            optimize_coref_resolver(
+                nlp.get_pipe("fastcoref"), quantize=quantize, num_threads=num_threads
+            )
     return base_nlp, nlp
 
 
+def get_pipeline_report(nlp: Language) -> list[dict]:
+    """Get the size of every component of a pipeline.
+
+    The serialized size of a component approximates the memory its weights and tables take.
+    Components that are loaded lazily are only reported once they are loaded.
+
+    Args:
+        nlp (Language): Spacy NLP object
+
+    Returns:
+        list[dict]: Name, whether it is enabled and serialized size in MiB of every component
+    """
+    rows = []
+    for name, component in nlp.components:
+        if isinstance(component, LazyFastCoref):
+            rows.extend(
+                {"component": name, "enabled": name in nlp.pipe_names, **load}
+                for load in component.load_report
+            )
+            continue
+        try:
+            size_mb = len(component.to_bytes()) / 2**20
+        except (AttributeError, NotImplementedError, TypeError, ValueError):
+            size_mb = None
+        rows.append(
+            {"component": name, "enabled": name in nlp.pipe_names, "size_mb": size_mb}
+        )
+    return rows
+
+
+# Replacement text and source character span of a token of a resolved document
+Replacement = tuple[str, tuple[int, int]]
+
+if not Doc.has_extension("source_offsets"):
+    Doc.set_extension("source_offsets", default=None)
+
+
+def build_resolved_doc(
+    base_nlp: Language, doc: Doc, replacements: dict[int, Replacement]
+) -> Doc:
+    """Build the resolved document from the tokens of the original one and the substitutions.
+
+    Tokens without a replacement are copied as they are, an empty replacement removes the token and
+    only the replacement texts are tokenized. The components of base_nlp are then run on the new
+    document, so it is annotated like base_nlp(resolved_text) without tokenizing the whole text
+    again. doc._.source_offsets holds the character span of every token in the original text;
+    substituted tokens point at the whole mention they replace.
+
+    Args:
+        base_nlp (Language): Spacy Language object without coref and span_resolver
+        doc (Doc): The document the coreference clusters were found in
+        replacements (dict[int, Replacement]): Replacement text, including trailing whitespace, and mention span by token index
+
+    Returns:
+        Doc: Spacy Doc with resolved coreferences
+    """
+    words, spaces, source_offsets = [], [], []
+    for token in doc:
+        if token.i not in replacements:
+            words.append(token.text)
+            spaces.append(bool(token.whitespace_))
+            source_offsets.append((token.idx, token.idx + len(token)))
+            continue
+        text, source_offset = replacements[token.i]
+        for piece in base_nlp.tokenizer(text) if text else []:
+            words.append(piece.text)
+            spaces.append(bool(piece.whitespace_))
+            source_offsets.append(source_offset)
+    resolved_doc = Doc(base_nlp.vocab, words=words, spaces=spaces)
+    for _, component in base_nlp.pipeline:
+        resolved_doc = component(resolved_doc)
+    resolved_doc._.source_offsets = source_offsets
+    return resolved_doc
+
+
 class SpacyCoref:
     """Spacy coreference resolver.
 
@@ -60,14 +449,20 @@ class SpacyCoref:
         base_nlp (Language): Spacy Language object without coref and span_resolver
         nlp (Language): Spacy Language object with coref and span_resolver
         head_only_clusters (str, optional): Whether to use only the head of the coreference clusters. Defaults to False.
+        direct (bool, optional): Whether to build the resolved Doc from the tokens of the original one instead of parsing the resolved text again. Defaults to False.
     """
 
     def __init__(
-        self, base_nlp: Language, nlp: Language, head_only_clusters: bool = False
+        self,
+        base_nlp: Language,
+        nlp: Language,
+        head_only_clusters: bool = False,
+        direct: bool = False,
     ):
         self.nlp = nlp
         self.base_nlp = base_nlp
         self.head_only_clusters = head_only_clusters
+        self.direct = direct
 
     def resolve(self, text: str) -> Doc:
         """Resolve coreference clusters in document.
@@ -79,10 +474,31 @@ class SpacyCoref:
         Returns:
             Doc: Spacy Doc with resolved coreferences
         """
-        doc = self.nlp(text)
+        return self._resolve_doc(self.nlp(text))
+
+    def resolve_batch(self, texts: list[str]) -> list[Doc]:
+        """Resolve coreference clusters in several documents at once.
+
+        Args:
+            texts (list[str]): Texts to resolve coreferences in
+
+        Returns:
+            list[Doc]: Spacy Docs with resolved coreferences, in the order of the texts
+        """
+        return [self._resolve_doc(doc) for doc in self.nlp.pipe(texts)]
+
+    def get_replacements(self, doc: Doc) -> dict[int, Replacement]:
+        """Get the substitutions of the coreference clusters of a document.
 
-        token_mention_mapper = {}  # token_id: reference_text
-        output_string = ""
+        Every mention but the first of a cluster is replaced by the first mention.
+
+        Args:
+            doc (Doc): Spacy Doc processed by coref and span_resolver
+
+        Returns:
+            dict[int, Replacement]: Replacement text and mention span by token index
+        """
+        replacements = {}
         clusters = [
             val
             for key, val in doc.spans.items()
@@ -94,18 +510,23 @@ class SpacyCoref:
         for cluster in clusters:
             first_mention = cluster[0]
             for mentions in list(cluster)[1:]:
-                # Set the first_span.text for the first token in the token_mention_mapper
-                token_mention_mapper[mentions[0].idx] = first_mention.text
+                source_offset = (mentions.start_char, mentions.end_char)
+                replacements[mentions[0].i] = (
+                    first_mention.text + mentions[0].whitespace_,
+                    source_offset,
+                )
                 for token in mentions[1:]:
-                    token_mention_mapper[token.idx] = ""
-
-        # Loop through every token in the document
-        for token in doc:
-            if token.idx in token_mention_mapper:
-                output_string += token_mention_mapper[token.idx] + token.whitespace_
-            else:
-                output_string += token.text + token.whitespace_
+                    replacements[token.i] = (token.whitespace_, source_offset)
+        return replacements
 
+    def _resolve_doc(self, doc: Doc) -> Doc:
+        replacements = self.get_replacements(doc)
+        if self.direct:
+            return build_resolved_doc(self.base_nlp, doc, replacements)
+        output_string = "".join(
+            replacements[token.i][0] if token.i in replacements else token.text_with_ws
+            for token in doc
+        )
         return self.nlp(output_string)
 
 
@@ -115,11 +536,13 @@ class FastCoref:
     Args:
         base_nlp (Language): Spacy Language object without coref and span_resolver
         nlp (Language): Spacy Language object with coref and span_resolver
+        direct (bool, optional): Whether to build the resolved Doc from the tokens of the original one instead of parsing the resolved text again. Defaults to False.
     """
 
-    def __init__(self, base_nlp: Language, nlp: Language):
+    def __init__(self, base_nlp: Language, nlp: Language, direct: bool = False):
         self.nlp = nlp
         self.base_nlp = base_nlp
+        self.direct = direct
 
     def resolve(self, text: str) -> Doc:
         """Resolve coreference clusters in document.
@@ -130,8 +553,88 @@ class FastCoref:
         Returns:
             Doc: Spacy Doc with resolved coreferences
         """
-        doc = self.nlp(text, component_cfg={"fastcoref": {"resolve_text": True}})
-        return self.base_nlp(doc._.resolved_text)
+        return self.resolve_batch([text])[0]
+
+    def resolve_batch(self, texts: list[str]) -> list[Doc]:
+        """Resolve coreference clusters in several documents at once.
+
+        The texts go through the coreference model together. fastcoref sorts them by length and
+        packs them into dynamic batches of at most max_tokens_in_batch padded tokens, instead of
+        running one forward pass per text. The resolved texts are the same as with resolve.
+
+        Args:
+            texts (list[str]): Texts to resolve coreferences in
+
+        Returns:
+            list[Doc]: Spacy Docs with resolved coreferences, in the order of the texts
+        """
+        docs = self.nlp.pipe(
+            texts,
+            batch_size=max(len(texts), 1),
+            component_cfg={"fastcoref": {"resolve_text": not self.direct}},
+        )
+        if self.direct:
+            return [
+                build_resolved_doc(self.base_nlp, doc, self.get_replacements(doc))
+                for doc in docs
+            ]
+        return list(self.base_nlp.pipe(doc._.resolved_text for doc in docs))
+
+    @staticmethod
+    def get_replacements(doc: Doc) -> dict[int, Replacement]:
+        """Get the substitutions of the coreference clusters of a document.
+
+        This follows the resolve_text logic of fastcoref: the head of a cluster is its first
+        mention containing a noun, mentions containing other mentions are kept and the others are
+        replaced by the head, possessive mentions by the possessive of the head. Mentions that do
+        not start and end at token boundaries, e.g. only part of a word, are left as they are.
+
+        Args:
+            doc (Doc): Spacy Doc processed by fastcoref
+
+        Returns:
+            dict[int, Replacement]: Replacement text and mention span by token index
+        """
+        replacements = {}
+        clusters = doc._.coref_clusters or []
+        all_spans = [span for cluster in clusters for span in cluster]
+        for cluster in clusters:
+            mentions = [
+                (coref, span)
+                for coref in cluster
+                if (span := doc.char_span(coref[0], coref[1])) is not None
+            ]
+            noun_indices = [
+                i
+                for i, (_, span) in enumerate(mentions)
+                if any(token.pos_ in ("NOUN", "PROPN") for token in span)
+            ]
+            if not noun_indices:
+                continue
+            head_text = mentions[noun_indices[0]][1].text
+            # fastcoref compares the mentions with a list copy of the head, so the head is
+            # substituted like any other mention
+            for coref, span in mentions:
+                if any(
+                    other[0] >= coref[0] and other[1] <= coref[1] and other != coref
+                    for other in all_spans
+                ):
+                    continue
+                final_token = span[-1]
+                final_token_tag = final_token.tag_.lower()
+                is_possessive = any(
+                    option in final_token_tag for option in ("prp$", "pos", "bez")
+                )
+                source_offset = (coref[0], coref[1])
+                replacements[span.start] = (
+                    head_text
+                    + ("'s" if is_possessive else "")
+                    + final_token.whitespace_,
+                    source_offset,
+                )
+                for i in range(span.start + 1, span.end):
+                    replacements[i] = ("", source_offset)
+        return replacements
 
 
 @dataclass(frozen=True)
@@ -182,17 +685,15 @@ def get_entity_ruler_patterns(character: Character) -> list[EntityRulePattern]:
     return ruler_patterns
 
 
-def add_entity_ruler(nlp: Language, characters: list[Character]) -> Language:
-    """Add entity ruler to NLP object.
+def get_entity_ruler_pattern_dicts(characters: list[Character]) -> list[dict]:
+    """Get all entity ruler patterns for the given characters.
 
     Args:
-        nlp (Language): Spacy NLP object
-        characters (list[Character]): List of characters to add patterns for
+        characters (list[Character]): List of characters to get patterns for
 
     Returns:
-        Language: Spacy NLP object with entity ruler
+        list[dict]: Entity ruler patterns, without duplicates and in a deterministic order
     """
-    ruler = nlp.add_pipe("entity_ruler", before="ner")
     patterns = [
         {
             "label": "PERSON",
@@ -206,15 +707,131 @@ def add_entity_ruler(nlp: Language, characters: list[Character]) -> Language:
         {"label": "PERSON", "pattern": "Mr. Mason", "id": "Mr. Mason"},
         {"label": "PERSON", "pattern": "Mrs. Mason", "id": "Mrs. Mason"},
     ]
-    ruler.add_patterns(patterns)
     ruler_patterns = []
     for character in characters:
-        if (
-            not set(character.title.split(" ")).isdisjoint(set(REMOVE_WORDS))
-        ) or "'" in character.title:
+        if not is_matchable(character):
             continue
         ruler_patterns.extend(get_entity_ruler_patterns(character))
-    ruler.add_patterns([pattern.__dict__ for pattern in set(ruler_patterns)])
+    patterns.extend(pattern.__dict__ for pattern in dict.fromkeys(ruler_patterns))
+    return patterns
+
+
+def get_entity_ruler_bundle_hash(nlp: Language, characters: list[Character]) -> str:
+    """Get the content hash deciding whether an entity ruler bundle is up to date.
+
+    Args:
+        nlp (Language): Spacy NLP object whose tokenizer the bundle is built with
+        characters (list[Character]): Characters the bundle is built for
+
+    Returns:
+        str: Hash of the bundle version, the spacy and pipeline versions and the character titles
+    """
+    content = {
+        "version": ENTITY_RULER_BUNDLE_VERSION,
+        "spacy": spacy.__version__,
+        "pipeline": f"{nlp.meta.get('name')}-{nlp.meta.get('version')}",
+        "titles": list(dict.fromkeys(character.title for character in characters)),
+    }
+    return hashlib.sha256(json.dumps(content).encode("utf-8")).hexdigest()
+
+
+def build_entity_ruler_bundle(
+    nlp: Language, characters: list[Character], path: str
+) -> str:
+    """Compile the entity ruler patterns for the given characters into an on-disk bundle.
+
+    The phrase patterns are tokenized once at build time and stored as token patterns, so loading
+    the bundle only adds them to the ruler's matcher without running the tokenizer again.
+
+    Args:
+        nlp (Language): Spacy NLP object whose tokenizer is used
+        characters (list[Character]): Characters to build the bundle for
+        path (str): Directory to write the bundle to
+
+    Returns:
+        str: Content hash of the bundle
+    """
+    patterns = []
+    for pattern in get_entity_ruler_pattern_dicts(characters):
+        patterns.append(
+            {
+                **pattern,
+                "pattern": [
+                    {"ORTH": token.text} for token in nlp.tokenizer(pattern["pattern"])
+                ],
+            }
+        )
+    ruler = EntityRuler(nlp, name="entity_ruler")
+    ruler.add_patterns(patterns)
+    os.makedirs(path, exist_ok=True)
+    # The bundle is not current while it is rebuilt, so an interrupted build is built again
+    try:
+        os.remove(os.path.join(path, "meta.json"))
+    except FileNotFoundError:
+        pass
+    ruler.to_disk(os.path.join(path, "entity_ruler"))
+    bundle_hash = get_entity_ruler_bundle_hash(nlp, characters)
+    # meta.json is written last and atomically, it marks the bundle as complete
+    fd, tmp_path = tempfile.mkstemp(dir=path)
+    with os.fdopen(fd, "w") as f:
+        json.dump(
+            {
+                "version": ENTITY_RULER_BUNDLE_VERSION,
+                "hash": bundle_hash,
+                "patterns": len(patterns),
+            },
+            f,
+        )
+    os.replace(tmp_path, os.path.join(path, "meta.json"))
+    return bundle_hash
+
+
+def is_entity_ruler_bundle_current(
+    nlp: Language, characters: list[Character], path: str
+) -> bool:
+    """Check whether the bundle at the given path was built for the given characters.
+
+    Args:
+        nlp (Language): Spacy NLP object the bundle is loaded into
+        characters (list[Character]): Characters the bundle should be built for
+        path (str): Directory of the bundle
+
+    Returns:
+        bool: Whether the bundle is complete and its content hash matches
+    """
+    try:
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    if not all(
+        os.path.isfile(os.path.join(path, "entity_ruler", name))
+        for name in ENTITY_RULER_BUNDLE_FILES
+    ):
+        return False
+    return meta.get("hash") == get_entity_ruler_bundle_hash(nlp, characters)
+
+
+def add_entity_ruler(
+    nlp: Language, characters: list[Character], bundle_path: str = None
+) -> Language:
+    """Add entity ruler to NLP object.
+
+    Args:
+        nlp (Language): Spacy NLP object
+        characters (list[Character]): List of characters to add patterns for
+        bundle_path (str, optional): Directory of a precompiled pattern bundle. It is (re)built if it is missing or was built for other characters. Defaults to None, in which case the patterns are computed on the fly.
+
+    Returns:
+        Language: Spacy NLP object with entity ruler
+    """
+    ruler = nlp.add_pipe("entity_ruler", before="ner")
+    if bundle_path is None:
+        ruler.add_patterns(get_entity_ruler_pattern_dicts(characters))
+        return nlp
+    if not is_entity_ruler_bundle_current(nlp, characters, bundle_path):
+        build_entity_ruler_bundle(nlp, characters, bundle_path)
+    ruler.from_disk(os.path.join(bundle_path, "entity_ruler"))
     return nlp
 
 
@@ -306,6 +923,21 @@ def get_matcher_patterns(character: Character) -> list:
     return matcher_patterns
 
 
+def is_matchable(character: Character) -> bool:
+    """Check whether a character should be matched in the text.
+
+    Args:
+        character (Character): The character to check
+
+    Returns:
+        bool: False for titles containing one of REMOVE_WORDS or an apostrophe (e.g. "Hagrid's wife")
+    """
+    return (
+        REMOVE_WORDS_SET.isdisjoint(character.title.split(" "))
+        and "'" not in character.title
+    )
+
+
 def get_matcher(nlp: Language, chapter_characters: list[Character]) -> Matcher:
     """Get matcher object for the given characters.
 
@@ -320,12 +952,89 @@ def get_matcher(nlp: Language, chapter_characters: list[Character]) -> Matcher:
 
     # Prepare character matcher
     for character in chapter_characters:
-        if set(character.title.split(" ")).isdisjoint(set(REMOVE_WORDS)) and (
-            "'" not in character.title
-        ):
+        if is_matchable(character):
             matcher_pattern = get_matcher_patterns(character)
             if len(matcher_pattern) == 0:
                 continue
             matcher.add(character.title, matcher_pattern)
 
     return matcher
+
+
+class CharacterMatcher:
+    """Matcher that is built incrementally as chapters introduce new characters.
+
+    The patterns of every character are generated and added to the underlying spacy Matcher once.
+    Updating it for the next chapter only adds the characters it has not seen yet, and removes
+    characters that are no longer requested, e.g. when an earlier chapter is rerun.
+
+    Args:
+        vocab (Vocab): Spacy vocab of the documents to match
+    """
+
+    def __init__(self, vocab: Vocab):
+        self.vocab = vocab
+        self.matcher = Matcher(vocab)
+        self.patterns: dict[str, list] = {}
+
+    def update(self, characters: list[Character]) -> Matcher:
+        """Bring the matcher in sync with the given characters.
+
+        Args:
+            characters (list[Character]): Characters seen till the chapter to match
+
+        Returns:
+            Matcher: Spacy matcher for exactly the given characters
+        """
+        titles = {
+            character.title: character
+            for character in characters
+            if is_matchable(character)
+        }
+        for title in [title for title in self.patterns if title not in titles]:
+            self.matcher.remove(title)
+            del self.patterns[title]
+        for title, character in titles.items():
+            if title in self.patterns:
+                continue
+            matcher_pattern = get_matcher_patterns(character)
+            if len(matcher_pattern) == 0:
+                continue
+            self.matcher.add(title, matcher_pattern)
+            self.patterns[title] = matcher_pattern
+        return self.matcher
+
+    def to_disk(self, path: str) -> None:
+        """Save the compiled patterns.
+
+        Args:
+            path (str): File to save the patterns to
+        """
+        with open(path, "wb") as f:
+            pickle.dump(
+                {"version": MATCHER_STATE_VERSION, "patterns": self.patterns}, f
+            )
+
+    @classmethod
+    def from_disk(cls, vocab: Vocab, path: str) -> "CharacterMatcher":
+        """Load a matcher saved with to_disk.
+
+        Args:
+            vocab (Vocab): Spacy vocab of the documents to match
+            path (str): File the patterns were saved to
+
+        Raises:
+            ValueError: If the file was written by an incompatible version
+
+        Returns:
+            CharacterMatcher: The matcher with all saved patterns added
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state["version"] != MATCHER_STATE_VERSION:
+            raise ValueError(f"Invalid matcher state version {state['version']}")
+        character_matcher = cls(vocab)
+        for title, matcher_pattern in state["patterns"].items():
+            character_matcher.matcher.add(title, matcher_pattern)
+        character_matcher.patterns = state["patterns"]
+        return character_matcher
@@ -0,0 +1,405 @@
+import io
+import json
+import os
+import pickle
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Iterator, Mapping
+
+import numpy as np
+
+from .character_index import CharacterIndex
+
+# Bump when the layout of the files changes
+MATCH_STORE_VERSION = 1
+# The integer columns of a store, stored as one .npy file each
+COLUMNS = (
+    "chapter_numbers",
+    "chapter_offsets",
+    "id_offsets",
+    "character_ids",
+    "starts",
+    "ends",
+    "span_ids",
+    "source_starts",
+    "source_ends",
+)
+
+
+class ChapterMatches:
+    """A read-only view of the match results of one chapter in a MatchStore.
+
+    The columns are slices of the arrays of the store, so nothing is copied. The string ids of the
+    i-th match are character_ids[id_offsets[i] - id_offsets[0] : id_offsets[i + 1] - id_offsets[0]].
+    Iterating over the view yields MatchResult objects, so code written for lists of them keeps
+    working.
+
+    Args:
+        store (MatchStore): The store the chapter belongs to
+        start (int): The index of the first match of the chapter
+        end (int): The index after the last match of the chapter
+    """
+
+    def __init__(self, store: "MatchStore", start: int, end: int) -> None:
+        self.character_index = store.character_index
+        self.names = store.names
+        self.spans = store.spans
+        self.starts = store.starts[start:end]
+        self.ends = store.ends[start:end]
+        self.span_ids = store.span_ids[start:end]
+        self.source_starts = store.source_starts[start:end]
+        self.source_ends = store.source_ends[start:end]
+        self.id_offsets = store.id_offsets[start : end + 1]
+        self.character_ids = store.character_ids[
+            self.id_offsets[0] : self.id_offsets[-1]
+        ]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def id_counts(self) -> np.ndarray:
+        """The number of string ids of every match."""
+        return np.diff(self.id_offsets)
+
+    @property
+    def is_flat(self) -> bool:
+        """Whether every match has a single string id."""
+        return len(self.character_ids) == len(self) and bool(
+            np.all(self.id_counts == 1)
+        )
+
+    def __iter__(self):
+        # Imported here because coreference depends on this module
+        from .coreference import MatchResult
+
+        base = int(self.id_offsets[0]) if len(self.id_offsets) else 0
+        id_offsets = self.id_offsets.tolist()
+        character_ids = self.character_ids.tolist()
+        for i, (start, end, span_id, source_start, source_end) in enumerate(
+            zip(
+                self.starts.tolist(),
+                self.ends.tolist(),
+                self.span_ids.tolist(),
+                self.source_starts.tolist(),
+                self.source_ends.tolist(),
+            )
+        ):
+            yield MatchResult(
+                string_id=[
+                    self.names[character_id]
+                    for character_id in character_ids[
+                        id_offsets[i] - base : id_offsets[i + 1] - base
+                    ]
+                ],
+                start=start,
+                end=end,
+                span=self.spans[span_id],
+                source_start=source_start if source_start >= 0 else None,
+                source_end=source_end if source_end >= 0 else None,
+            )
+
+    def _get_match(self, i: int):
+        from .coreference import MatchResult
+
+        base = int(self.id_offsets[0])
+        first, last = int(self.id_offsets[i]) - base, int(self.id_offsets[i + 1]) - base
+        source_start, source_end = int(self.source_starts[i]), int(self.source_ends[i])
+        return MatchResult(
+            string_id=[
+                self.names[character_id]
+                for character_id in self.character_ids[first:last].tolist()
+            ],
+            start=int(self.starts[i]),
+            end=int(self.ends[i]),
+            span=self.spans[int(self.span_ids[i])],
+            source_start=source_start if source_start >= 0 else None,
+            source_end=source_end if source_end >= 0 else None,
+        )
+
+    def __getitem__(self, index):
+        # Only the requested matches are built from the columns
+        if isinstance(index, slice):
+            return [self._get_match(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("match index out of range")
+        return self._get_match(index)
+
+    def __repr__(self) -> str:
+        return f"ChapterMatches({len(self)} matches)"
+
+    def flatten(self) -> "ChapterMatches":
+        """Flatten the matches to have a single string id per match, like flatten_results.
+
+        Returns:
+            ChapterMatches: The flat matches, sharing the character ids with this view
+        """
+        if self.is_flat:
+            return self
+        rows = np.repeat(np.arange(len(self)), self.id_counts)
+        store = MatchStore(
+            character_index=self.character_index,
+            spans=self.spans,
+            chapter_numbers=np.zeros(1, dtype=np.int32),
+            chapter_offsets=np.array([0, len(rows)], dtype=np.int64),
+            id_offsets=np.arange(len(rows) + 1, dtype=np.int64),
+            character_ids=self.character_ids,
+            starts=self.starts[rows],
+            ends=self.ends[rows],
+            span_ids=self.span_ids[rows],
+            source_starts=self.source_starts[rows],
+            source_ends=self.source_ends[rows],
+        )
+        return ChapterMatches(store, 0, len(rows))
+
+
+class MatchStore(Mapping):
+    """A columnar store of the match results of every chapter of a book.
+
+    The matches of all chapters are kept as arrays of start, end, span id and source positions,
+    delimited by an array of chapter offsets. The string ids of the matches are one array of
+    character ids of a CharacterIndex, delimited by an array of id offsets. The spans are numbered
+    by their sorted texts. Every array is saved as a .npy file in
+    the directory of the book, so the store is loaded with memory mapping and is only read from
+    disk when it is used.
+
+    The store maps the chapter numbers to ChapterMatches views, so it can replace the dict of lists
+    of MatchResult objects of Book.matches_by_chapter.
+
+    Args:
+        character_index (CharacterIndex): The index of the character ids
+        spans (list[str]): The sorted texts of the matched spans, indexed by the span ids
+        chapter_numbers (np.ndarray): The number of every chapter
+        chapter_offsets (np.ndarray): The index of the first match of every chapter, followed by the number of matches
+        id_offsets (np.ndarray): The index of the first character id of every match, followed by the number of character ids
+        character_ids (np.ndarray): The character ids of all matches
+        starts (np.ndarray): The start token of every match
+        ends (np.ndarray): The end token of every match
+        span_ids (np.ndarray): The span id of every match
+        source_starts (np.ndarray): The source start character of every match, -1 if unknown
+        source_ends (np.ndarray): The source end character of every match, -1 if unknown
+    """
+
+    def __init__(
+        self,
+        character_index: CharacterIndex,
+        spans: list[str],
+        chapter_numbers: np.ndarray,
+        chapter_offsets: np.ndarray,
+        id_offsets: np.ndarray,
+        character_ids: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        span_ids: np.ndarray,
+        source_starts: np.ndarray,
+        source_ends: np.ndarray,
+    ) -> None:
+        self.character_index = character_index
+        self.spans = spans
+        self.chapter_numbers = chapter_numbers
+        self.chapter_offsets = chapter_offsets
+        self.id_offsets = id_offsets
+        self.character_ids = character_ids
+        self.starts = starts
+        self.ends = ends
+        self.span_ids = span_ids
+        self.source_starts = source_starts
+        self.source_ends = source_ends
+        self._chapter_indices = {
+            chapter_number: i
+            for i, chapter_number in enumerate(chapter_numbers.tolist())
+        }
+
+    @property
+    def names(self) -> list[str]:
+        return self.character_index.names
+
+    @classmethod
+    def from_matches(
+        cls, matches_by_chapter: Mapping, character_index: CharacterIndex = None
+    ) -> "MatchStore":
+        """Builds a store from the match results of every chapter.
+
+        Args:
+            matches_by_chapter (Mapping): The list of MatchResult objects of every chapter number
+            character_index (CharacterIndex, optional): The index to number the characters with, names missing from it are added. Defaults to None, i.e. an index of the sorted names of the matches.
+
+        Returns:
+            MatchStore: The store
+        """
+        if character_index is None:
+            character_index = CharacterIndex.from_matches(matches_by_chapter)
+        spans = sorted(
+            {match.span for matches in matches_by_chapter.values() for match in matches}
+        )
+        span_ids = {span: i for i, span in enumerate(spans)}
+        chapter_numbers, chapter_offsets, id_offsets = [], [0], [0]
+        columns = {
+            "character_ids": [],
+            "starts": [],
+            "ends": [],
+            "span_ids": [],
+            "source_starts": [],
+            "source_ends": [],
+        }
+        for chapter_number, matches in matches_by_chapter.items():
+            chapter_numbers.append(chapter_number)
+            for match in matches:
+                columns["character_ids"].extend(
+                    character_index.add(string_id) for string_id in match.string_id
+                )
+                id_offsets.append(len(columns["character_ids"]))
+                columns["starts"].append(match.start)
+                columns["ends"].append(match.end)
+                columns["span_ids"].append(span_ids[match.span])
+                columns["source_starts"].append(
+                    match.source_start if match.source_start is not None else -1
+                )
+                columns["source_ends"].append(
+                    match.source_end if match.source_end is not None else -1
+                )
+            chapter_offsets.append(len(columns["starts"]))
+        return cls(
+            character_index=character_index,
+            spans=spans,
+            chapter_numbers=np.array(chapter_numbers, dtype=np.int32),
+            chapter_offsets=np.array(chapter_offsets, dtype=np.int64),
+            id_offsets=np.array(id_offsets, dtype=np.int64),
+            **{
+                name: np.array(values, dtype=np.int32)
+                for name, values in columns.items()
+            },
+        )
+
+    def __getitem__(self, chapter_number: int) -> ChapterMatches:
+        i = self._chapter_indices[chapter_number]
+        return ChapterMatches(
+            self, int(self.chapter_offsets[i]), int(self.chapter_offsets[i + 1])
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._chapter_indices)
+
+    def __len__(self) -> int:
+        return len(self._chapter_indices)
+
+    def save(self, directory: str) -> None:
+        """Saves the store as one .npy file per column and a JSON file with the names and spans.
+
+        Args:
+            directory (str): The directory of the book, e.g. book/1/matches
+        """
+        os.makedirs(directory, exist_ok=True)
+        for column in COLUMNS:
+            np.save(os.path.join(directory, f"{column}.npy"), getattr(self, column))
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "version": MATCH_STORE_VERSION,
+                    "names": self.names,
+                    "spans": self.spans,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "MatchStore":
+        """Loads a store saved with MatchStore.save.
+
+        Args:
+            directory (str): The directory of the book
+            mmap (bool, optional): Whether to memory map the columns instead of reading them. Defaults to True.
+
+        Returns:
+            MatchStore: The store
+        """
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+        if meta["version"] != MATCH_STORE_VERSION:
+            raise ValueError(
+                f"The match store in {directory} has version {meta['version']}, expected {MATCH_STORE_VERSION}"
+            )
+        return cls(
+            character_index=CharacterIndex(meta["names"]),
+            spans=meta["spans"],
+            **{
+                column: np.load(
+                    os.path.join(directory, f"{column}.npy"),
+                    mmap_mode="r" if mmap else None,
+                )
+                for column in COLUMNS
+            },
+        )
+
+
+def load_match_stores(
+    directory_path: str, book_numbers: list[int], mmap: bool = True
+) -> dict[int, MatchStore]:
+    """Loads the match stores of several books.
+
+    Args:
+        directory_path (str): The directory containing a `{book}/matches` store per book
+        book_numbers (list[int]): The books to load
+        mmap (bool, optional): Whether to memory map the columns. Defaults to True.
+
+    Returns:
+        dict[int, MatchStore]: The store of every book
+    """
+    return {
+        book_number: MatchStore.load(
+            os.path.join(directory_path, str(book_number), "matches"), mmap=mmap
+        )
+        for book_number in book_numbers
+    }
+
+
+def benchmark_match_storage(
+    directory_path: str, book_numbers: list[int], output_path: str = None
+) -> dict[str, dict[str, float]]:
+    """Compares the coreference resolution pickles with match stores of the same books.
+
+    The stores are read into memory instead of being memory mapped, since tracemalloc does not
+    see mapped files, so both formats are compared by the memory they take once fully loaded.
+
+    Args:
+        directory_path (str): The directory containing a `{book}/coreference_resolution_by_chapter.pkl` per book
+        book_numbers (list[int]): The books to compare
+        output_path (str, optional): The directory to write a `{book}/matches` store per book to. Defaults to None, in which case the stores are written to a temporary directory.
+
+    Returns:
+        dict[str, dict[str, float]]: For both formats, the load time in milliseconds and the memory allocated by the loaded books in bytes.
+    """
+    if output_path is None:
+        with tempfile.TemporaryDirectory() as temporary_path:
+            return benchmark_match_storage(directory_path, book_numbers, temporary_path)
+    payloads = {}
+    for book_number in book_numbers:
+        with open(
+            f"{directory_path}/{book_number}/coreference_resolution_by_chapter.pkl",
+            "rb",
+        ) as f:
+            payloads[book_number] = f.read()
+        MatchStore.from_matches(pickle.loads(payloads[book_number])).save(
+            os.path.join(output_path, str(book_number), "matches")
+        )
+    loaders = {
+        "pickle": lambda: {
+            book_number: pickle.load(io.BytesIO(data))
+            for book_number, data in payloads.items()
+        },
+        "store": lambda: load_match_stores(output_path, book_numbers, mmap=False),
+    }
+    report = {}
+    for name, loader in loaders.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        loaded = loader()
+        elapsed = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del loaded
+        report[name] = {"load_ms": 1000 * elapsed, "memory_bytes": memory}
+    return report
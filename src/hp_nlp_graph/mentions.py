@@ -0,0 +1,182 @@
+from spacy.tokenizer import Tokenizer
+from spacy.tokens import Doc
+from spacy.vocab import Vocab
+
+from .language import get_matcher_patterns, is_matchable
+from .scraper import Character
+
+
+def _pattern_keys(matcher_pattern: list[dict]) -> tuple:
+    keys = []
+    for token_pattern in matcher_pattern:
+        if "ORTH" in token_pattern:
+            keys.append(("ORTH", token_pattern["ORTH"]))
+        else:
+            keys.append(
+                ("LOWER", token_pattern["LOWER"], token_pattern.get("IS_TITLE"))
+            )
+    return tuple(keys)
+
+
+def _token_keys(text: str, lower: str, is_title: bool) -> tuple:
+    if is_title:
+        return (("LOWER", lower, None), ("LOWER", lower, True), ("ORTH", text))
+    return (("LOWER", lower, None), ("ORTH", text))
+
+
+class MentionMatcher:
+    """Character mention matcher built on a token automaton instead of spacy's Matcher.
+
+    The Matcher patterns of get_matcher_patterns (full names, name parts, SHORT_FORMS, the Mc/Mac
+    names and the Voldemort epithets) are compiled into a trie over normalized token keys. A
+    document is matched in one left-to-right pass that advances all partial matches at once, so
+    only the tokenizer is needed. The matches are returned as (match_id, start, end) tuples in the
+    same order as spacy's Matcher, so they produce the same MatchResult stream.
+
+    Args:
+        vocab (Vocab): Spacy vocab used to map character titles to match ids
+        tokenizer (Tokenizer, optional): Tokenizer used to match raw text and to compile aliases. Defaults to None.
+        include_aliases (bool, optional): Whether to also match the scraped aliases of the characters. Defaults to False.
+    """
+
+    def __init__(
+        self,
+        vocab: Vocab,
+        tokenizer: Tokenizer = None,
+        include_aliases: bool = False,
+    ):
+        if include_aliases and tokenizer is None:
+            raise ValueError("A tokenizer is required to match aliases")
+        self.vocab = vocab
+        self.tokenizer = tokenizer
+        self.include_aliases = include_aliases
+        self.patterns: dict[str, list[tuple]] = {}
+        self._reset()
+
+    def _reset(self) -> None:
+        # A node is a pair of its children by token key and its outputs (pattern index, match id)
+        self._root = ({}, [])
+        self._pattern_count = 0
+
+    def _insert(self, keys: tuple, match_id: int) -> None:
+        node = self._root
+        for key in keys:
+            node = node[0].setdefault(key, ({}, []))
+        node[1].append((self._pattern_count, match_id))
+        self._pattern_count += 1
+
+    def _alias_keys(self, alias: str) -> tuple:
+        return tuple(
+            ("LOWER", token.lower_, True if token.is_title else None)
+            for token in self.tokenizer(alias)
+        )
+
+    def _get_patterns(self, character: Character) -> list[tuple]:
+        patterns = [
+            _pattern_keys(matcher_pattern)
+            for matcher_pattern in get_matcher_patterns(character)
+        ]
+        if self.include_aliases and character.aliases:
+            patterns.extend(self._alias_keys(alias) for alias in character.aliases)
+        return [keys for keys in patterns if keys]
+
+    def update(self, characters: list[Character]) -> "MentionMatcher":
+        """Bring the matcher in sync with the given characters.
+
+        Args:
+            characters (list[Character]): Characters seen till the chapter to match
+
+        Returns:
+            MentionMatcher: The matcher itself, which is called like a spacy Matcher
+        """
+        titles = {
+            character.title: character
+            for character in characters
+            if is_matchable(character)
+        }
+        if any(title not in titles for title in self.patterns):
+            # Removing patterns from the trie is rare, so it is simply rebuilt
+            self.patterns = {
+                title: keys for title, keys in self.patterns.items() if title in titles
+            }
+            self._reset()
+            for title, patterns in self.patterns.items():
+                match_id = self.vocab.strings.add(title)
+                for keys in patterns:
+                    self._insert(keys, match_id)
+        for title, character in titles.items():
+            if title in self.patterns:
+                continue
+            patterns = self._get_patterns(character)
+            if not patterns:
+                continue
+            match_id = self.vocab.strings.add(title)
+            for keys in patterns:
+                self._insert(keys, match_id)
+            self.patterns[title] = patterns
+        return self
+
+    def match_tokens(
+        self, tokens: list[tuple[str, str, bool]]
+    ) -> list[tuple[int, int, int]]:
+        """Find all mentions in a sequence of tokens.
+
+        Args:
+            tokens (list[tuple[str, str, bool]]): The text, lowercase text and title-case flag of every token
+
+        Returns:
+            list[tuple[int, int, int]]: The (match_id, start, end) of every mention
+        """
+        matches = []
+        states = []  # (node, start) of the partial matches, oldest first
+        for i, (text, lower, is_title) in enumerate(tokens):
+            keys = _token_keys(text, lower, is_title)
+            next_states = []
+            completed = []
+            for node, start in states + [(self._root, i)]:
+                for key in keys:
+                    child = node[0].get(key)
+                    if child is None:
+                        continue
+                    if child[1]:
+                        completed.extend(
+                            (start, pattern_index, match_id)
+                            for pattern_index, match_id in child[1]
+                        )
+                    if child[0]:
+                        next_states.append((child, start))
+            states = next_states
+            seen = set()
+            for start, _, match_id in sorted(completed):
+                if (match_id, start) in seen:
+                    continue
+                seen.add((match_id, start))
+                matches.append((match_id, start, i + 1))
+        return matches
+
+    def __call__(self, doc: Doc) -> list[tuple[int, int, int]]:
+        """Find all mentions in a document.
+
+        Args:
+            doc (Doc): Spacy doc, only the tokenizer needs to have run
+
+        Returns:
+            list[tuple[int, int, int]]: The (match_id, start, end) of every mention
+        """
+        return self.match_tokens(
+            [(token.text, token.lower_, token.is_title) for token in doc]
+        )
+
+    def match_text(self, text: str) -> tuple[list[tuple[int, int, int]], Doc]:
+        """Tokenize a text and find all mentions in it.
+
+        Args:
+            text (str): The text to match
+
+        Returns:
+            tuple[list[tuple[int, int, int]], Doc]: The matches and the tokenized doc
+        """
+        if self.tokenizer is None:
+            raise ValueError("A tokenizer is required to match raw text")
+        doc = self.tokenizer(text)
+        return self(doc), doc
@@ -0,0 +1,276 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+import spacy
+
+from .coreference import (
+    MatchResult,
+    coref_resolve_and_get_characters_matches_in_chapters,
+    get_chapter_seed,
+)
+from .book_text import read_chapter
+from .doc_cache import ResolvedDocCache
+from .language import (
+    SPACY_MODEL,
+    CharacterMatcher,
+    FastCoref,
+    add_entity_ruler,
+    build_entity_ruler_bundle,
+    get_coref_resolver_nlp,
+    get_default_num_threads,
+    get_default_resolve_workers,
+    is_entity_ruler_bundle_current,
+    is_matchable,
+)
+from .scraper import Character
+
+# Pipeline of a worker process, set up once by _initialize_worker
+_worker = {}
+
+
+@dataclass
+class ChapterTask:
+    """A chapter to resolve and match in a worker process.
+
+    The task only points at the chapter in the book text, which is read when chapter_text is
+    accessed, so building the tasks of a book and sending them to the workers does not copy it.
+
+    Args:
+        book_number (int): The book number
+        chapter_number (int): The chapter number
+        book_text_path (str): The path of the book text
+        chapter_index (int): The index of the chapter in the book text, see BookText
+        characters (list[Character]): The characters seen till the chapter
+        chapter_hardcoded_options (dict[str, list[str]], optional): Chapter specific options for ambiguous spans. Defaults to None.
+    """
+
+    book_number: int
+    chapter_number: int
+    book_text_path: str
+    chapter_index: int
+    characters: list[Character]
+    chapter_hardcoded_options: dict[str, list[str]] = None
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return self.book_number, self.chapter_number
+
+    @property
+    def chapter_text(self) -> str:
+        return read_chapter(self.book_text_path, self.chapter_index)
+
+
+def _initialize_worker(
+    characters: list[Character],
+    device: str,
+    entity_ruler_bundle_path: str,
+    direct: bool,
+    quantize: bool,
+    threads_per_worker: int,
+    doc_cache_path: str,
+    seed: int,
+) -> None:
+    base_nlp, nlp = get_coref_resolver_nlp(
+        device=device, quantize=quantize, num_threads=threads_per_worker
+    )
+    base_nlp = add_entity_ruler(base_nlp, characters, entity_ruler_bundle_path)
+    nlp = add_entity_ruler(nlp, characters, entity_ruler_bundle_path)
+    _worker["base_nlp"] = base_nlp
+    _worker["nlp"] = nlp
+    _worker["coref"] = FastCoref(base_nlp, nlp, direct=direct)
+    _worker["doc_cache"] = (
+        ResolvedDocCache(doc_cache_path, _worker["coref"])
+        if doc_cache_path is not None
+        else None
+    )
+    _worker["character_matcher"] = CharacterMatcher(nlp.vocab)
+    _worker["titles"] = []
+    _worker["seed"] = seed
+
+
+def _get_worker_matcher(characters: list[Character]) -> CharacterMatcher:
+    # The order in which patterns were added decides the order of matches of the same span. A
+    # serial run only ever extends the characters, so the matcher is reused if that is the case
+    # here too, and rebuilt from scratch otherwise.
+    titles = list(
+        dict.fromkeys(
+            character.title for character in characters if is_matchable(character)
+        )
+    )
+    if titles[: len(_worker["titles"])] != _worker["titles"]:
+        _worker["character_matcher"] = CharacterMatcher(_worker["nlp"].vocab)
+    _worker["titles"] = titles
+    return _worker["character_matcher"]
+
+
+def _resolve_chapter(task: ChapterTask) -> list[MatchResult]:
+    ((match_results, _),) = coref_resolve_and_get_characters_matches_in_chapters(
+        base_nlp=_worker["base_nlp"],
+        nlp=_worker["nlp"],
+        chapters=[(task.chapter_text, task.characters, task.chapter_hardcoded_options)],
+        batch_coref_resolver=_worker["coref"].resolve_batch,
+        character_matcher=_get_worker_matcher(task.characters),
+        doc_cache=_worker["doc_cache"],
+        seeds=[
+            get_chapter_seed(task.book_number, task.chapter_number, _worker["seed"])
+        ],
+    )
+    return match_results
+
+
+def coreference_resolve_parallel(
+    tasks: list[ChapterTask],
+    characters: list[Character],
+    max_workers: int = None,
+    device: str = "cpu",
+    entity_ruler_bundle_path: str = None,
+    direct: bool = False,
+    quantize: bool = False,
+    max_retries: int = 2,
+    threads_per_worker: int = None,
+    doc_cache_path: str = None,
+    seed: int = None,
+) -> tuple[dict[tuple[int, int], list[MatchResult]], dict[tuple[int, int], str]]:
+    """Resolve coreferences and match the characters of chapters in a pool of worker processes.
+
+    Every worker loads the pipeline once and then takes chapters from the queue of the pool. Only
+    the match results are sent back, not the resolved docs. At most max_workers chapters are in
+    flight at a time. If a worker dies, the pool is restarted and the chapters that were in flight
+    are retried one at a time, so the chapter that crashed it can be told apart from the others. A
+    chapter that fails more than max_retries times is reported instead of stopping the run.
+
+    Args:
+        tasks (list[ChapterTask]): The chapters to resolve
+        characters (list[Character]): All characters, used for the entity rulers of the workers
+        max_workers (int, optional): Number of worker processes. Defaults to as many as fit into the available memory, see get_default_resolve_workers.
+        device (str, optional): Device to run coreference resolution on. Defaults to "cpu".
+        entity_ruler_bundle_path (str, optional): Directory of the precompiled entity ruler patterns. Defaults to None.
+        direct (bool, optional): Whether to build the resolved docs from the original tokens. Defaults to False.
+        quantize (bool, optional): Whether to quantize the coreference model of the workers to int8. Defaults to False.
+        max_retries (int, optional): Number of retries of a chapter that failed or crashed its worker. Defaults to 2.
+        threads_per_worker (int, optional): Number of torch threads of a worker. Defaults to the number of CPUs divided by max_workers.
+        doc_cache_path (str, optional): Directory of the cache of resolved docs shared by the workers. Defaults to None.
+        seed (int, optional): Seed of the random disambiguation, see get_chapter_seed. Defaults to None.
+
+    Returns:
+        tuple[dict[tuple[int, int], list[MatchResult]], dict[tuple[int, int], str]]: The match results by (book number, chapter number), sorted, and the reason of every chapter that failed
+    """
+    if max_workers is None:
+        max_workers = get_default_resolve_workers()
+    if threads_per_worker is None:
+        threads_per_worker = max(1, get_default_num_threads() // max_workers)
+    if entity_ruler_bundle_path is not None:
+        # Build the bundle once here instead of in every worker at the same time
+        tokenizer_nlp = spacy.load(
+            SPACY_MODEL,
+            exclude=[
+                "tok2vec",
+                "tagger",
+                "parser",
+                "attribute_ruler",
+                "lemmatizer",
+                "ner",
+                "senter",
+            ],
+        )
+        if not is_entity_ruler_bundle_current(
+            tokenizer_nlp, characters, entity_ruler_bundle_path
+        ):
+            build_entity_ruler_bundle(
+                tokenizer_nlp, characters, entity_ruler_bundle_path
+            )
+    initargs = (
+        characters,
+        device,
+        entity_ruler_bundle_path,
+        direct,
+        quantize,
+        threads_per_worker,
+        doc_cache_path,
+        seed,
+    )
+    return _run_tasks(
+        tasks,
+        _resolve_chapter,
+        max_workers=max_workers,
+        max_retries=max_retries,
+        initializer=_initialize_worker,
+        initargs=initargs,
+    )
+
+
+def _run_tasks(
+    tasks: list[ChapterTask],
+    function: callable,
+    max_workers: int,
+    max_retries: int,
+    initializer: callable = None,
+    initargs: tuple = (),
+) -> tuple[dict[tuple[int, int], object], dict[tuple[int, int], str]]:
+    # Runs function on every task in a pool of spawned workers, see coreference_resolve_parallel
+    # for how failed and crashed tasks are retried
+    def new_pool():
+        # Forking a process that has loaded torch is unsafe, so the workers are spawned
+        return ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer,
+            initargs=initargs,
+        )
+
+    pending = list(reversed(tasks))
+    suspects = []
+    attempts = {task.key: 0 for task in tasks}
+    results, failures = {}, {}
+
+    def fail(task, reason):
+        attempts[task.key] += 1
+        if attempts[task.key] > max_retries:
+            failures[task.key] = reason
+        else:
+            suspects.append(task)
+
+    pool = new_pool()
+    in_flight = {}
+    try:
+        while pending or suspects or in_flight:
+            # Suspected chapters run alone, the others fill all workers
+            while suspects and not in_flight:
+                task = suspects.pop()
+                in_flight[pool.submit(function, task)] = task
+            while pending and not suspects and len(in_flight) < max_workers:
+                task = pending.pop()
+                in_flight[pool.submit(function, task)] = task
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            crashed = []
+            for future in done:
+                task = in_flight.pop(future)
+                try:
+                    results[task.key] = future.result()
+                except BrokenProcessPool:
+                    crashed.append(task)
+                except Exception as e:
+                    fail(task, f"{type(e).__name__}: {e}")
+            if not crashed:
+                continue
+
+            # Every chapter in flight failed with the pool, but only a chapter that ran alone is
+            # known to have crashed it
+            for future, task in in_flight.items():
+                try:
+                    results[task.key] = future.result()
+                except Exception:
+                    crashed.append(task)
+            if len(crashed) == 1:
+                fail(crashed[0], "The worker process crashed")
+            else:
+                suspects.extend(crashed)
+            in_flight = {}
+            pool.shutdown(wait=False, cancel_futures=True)
+            pool = new_pool()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return dict(sorted(results.items())), dict(sorted(failures.items()))
@@ -0,0 +1,204 @@
+import queue
+import threading
+from collections.abc import Hashable, Iterable, Iterator
+
+from spacy.language import Language
+
+from .coreference import (
+    MatchResult,
+    get_chapter_windows,
+    get_characters_matches,
+    join_resolved_windows,
+    _get_matcher,
+)
+from .doc_cache import ResolvedDocCache
+from .language import CharacterMatcher, get_rss_mb
+from .mentions import MentionMatcher
+from .scraper import Character
+
+# Marks the end of the chapters in a queue
+_DONE = object()
+# Seconds to wait on a full or empty queue before checking whether the pipeline was stopped
+_POLL_SECONDS = 0.1
+
+
+class _StageError:
+    """An exception raised in a stage, passed down the queues to the consumer."""
+
+    def __init__(self, exception: BaseException) -> None:
+        self.exception = exception
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL_SECONDS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL_SECONDS)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _run_stage(target, output: queue.Queue, stop: threading.Event) -> None:
+    # Every stage ends with _DONE, after forwarding the exception if it failed
+    try:
+        target()
+    except BaseException as e:
+        _put(output, _StageError(e), stop)
+    _put(output, _DONE, stop)
+
+
+def stream_chapter_matches(
+    base_nlp: Language,
+    nlp: Language,
+    chapters: Iterable[tuple[Hashable, str, list[Character], dict[str, list[str]]]],
+    batch_coref_resolver: callable,
+    character_matcher: CharacterMatcher | MentionMatcher = None,
+    doc_cache: ResolvedDocCache = None,
+    chapters_per_batch: int = 1,
+    queue_size: int = 2,
+    report: dict = None,
+    get_seed: callable = None,
+) -> Iterator[tuple[Hashable, list[MatchResult]]]:
+    """Resolve coreferences and match the characters of a stream of chapters in overlapping stages.
+
+    Every stage runs in its own thread and hands the chapters to the next one through a bounded
+    queue:
+
+    1. parsing the chapter with base_nlp and cutting it into windows, or reading it from doc_cache
+    2. resolving the windows of chapters_per_batch chapters with the coreference model
+    3. matching and disambiguating the characters in the resolved doc
+
+    So the next chapter is parsed and the previous one matched while the coreference model, which
+    releases the GIL, resolves the current one. At most queue_size chapters wait between two stages,
+    and the docs of a chapter are dropped as soon as its matches are extracted, so the memory used
+    depends on the queue size and not on the length of the book. The chapters are matched one after
+    another in order, so the results are the same as with
+    coref_resolve_and_get_characters_matches_in_chapters.
+
+    Args:
+        base_nlp (Language): The base nlp object without the coref and span_resolver components
+        nlp (Language): The nlp object with the coref and span_resolver components
+        chapters (Iterable[tuple[Hashable, str, list[Character], dict[str, list[str]]]]): The key, the text, the characters seen till the chapter and the chapter specific options for ambiguous spans of every chapter. It is consumed lazily.
+        batch_coref_resolver (callable): The coreference resolver of a list of texts, e.g. FastCoref.resolve_batch
+        character_matcher (CharacterMatcher | MentionMatcher, optional): Matcher reused across chapters. Defaults to None, in which case a new matcher is built per chapter.
+        doc_cache (ResolvedDocCache, optional): Cache of resolved docs, only the chapters that miss it are resolved. Defaults to None.
+        chapters_per_batch (int, optional): Number of chapters whose windows are resolved in one batch. Defaults to 1.
+        queue_size (int, optional): Number of chapters that can wait between two stages. Defaults to 2.
+        report (dict, optional): If given, the peak resident set size in MB seen after every chapter is recorded under "peak_rss_mb". Defaults to None.
+        get_seed (callable, optional): Function of the key of a chapter returning the seed of its random disambiguation, see get_chapter_seed. Defaults to None, in which case the global random state is used.
+
+    Yields:
+        tuple[Hashable, list[MatchResult]]: The key and the match results of every chapter, in order
+    """
+    stop = threading.Event()
+    parsed = queue.Queue(maxsize=queue_size)
+    resolved = queue.Queue(maxsize=queue_size)
+    matched = queue.Queue(maxsize=queue_size)
+
+    def parse():
+        for key, chapter_text, characters, options in chapters:
+            resolved_doc = (
+                doc_cache.get(chapter_text) if doc_cache is not None else None
+            )
+            windows = (
+                get_chapter_windows(base_nlp, chapter_text)
+                if resolved_doc is None
+                else None
+            )
+            item = (key, chapter_text, characters, options, windows, resolved_doc)
+            if not _put(parsed, item, stop):
+                return
+
+    def resolve_batch(batch: list[tuple]) -> bool:
+        window_texts = [
+            window.text
+            for _, _, _, _, windows, _ in batch
+            if windows is not None
+            for window in windows
+        ]
+        resolved_windows = batch_coref_resolver(window_texts) if window_texts else []
+        offset = 0
+        while batch:
+            key, chapter_text, characters, options, windows, resolved_doc = batch.pop(0)
+            if windows is not None:
+                resolved_doc = join_resolved_windows(
+                    windows, resolved_windows[offset : offset + len(windows)]
+                )
+                offset += len(windows)
+                if doc_cache is not None:
+                    doc_cache.put(chapter_text, resolved_doc)
+            if not _put(resolved, (key, characters, options, resolved_doc), stop):
+                return False
+        return True
+
+    def resolve():
+        while True:
+            batch = []
+            while len(batch) < chapters_per_batch:
+                item = _get(parsed, stop)
+                if isinstance(item, _StageError):
+                    raise item.exception
+                if item is _DONE:
+                    break
+                batch.append(item)
+                # The batch is the only reference to the parsed windows, so resolve_batch can
+                # drop them chapter by chapter
+                del item
+            finished = len(batch) < chapters_per_batch
+            if batch and not resolve_batch(batch):
+                return
+            if finished:
+                return
+
+    def match():
+        while True:
+            item = _get(resolved, stop)
+            if isinstance(item, _StageError):
+                raise item.exception
+            if item is _DONE:
+                return
+            key, characters, options, resolved_doc = item
+            del item
+            matcher = _get_matcher(nlp, characters, character_matcher)
+            match_results = get_characters_matches(
+                nlp,
+                resolved_doc,
+                matcher,
+                options,
+                seed=get_seed(key) if get_seed is not None else None,
+            )
+            del resolved_doc
+            if not _put(matched, (key, match_results), stop):
+                return
+
+    threads = [
+        threading.Thread(target=_run_stage, args=(stage, output, stop), daemon=True)
+        for stage, output in ((parse, parsed), (resolve, resolved), (match, matched))
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = _get(matched, stop)
+            if isinstance(item, _StageError):
+                raise item.exception
+            if item is _DONE:
+                return
+            if report is not None:
+                report["peak_rss_mb"] = max(report.get("peak_rss_mb", 0), get_rss_mb())
+            yield item
+    finally:
+        # Also stops the stages if the consumer does not read all chapters
+        stop.set()
+        for thread in threads:
+            thread.join()
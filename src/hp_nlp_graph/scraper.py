@@ -1,11 +1,21 @@
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+import io
 import pickle
+import sys
+import time
+import tracemalloc
 
 import requests
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 import pandas as pd
 
+from .cache import hash_bytes
+from .fetcher import Fetcher
+from .infobox import DEFAULT_PARSER_BACKEND, InfoboxResult, extract_infobox
+from .journal import ScrapeJournal
+
 BASE_URL = "https://harrypotter.fandom.com"
 CHARACTERS_LIST_URL_EXAMPLE = (
     BASE_URL + "/wiki/Harry_Potter_and_the_Philosopher%27s_Stone_(character_index)"
@@ -101,7 +111,23 @@ ATTRIBUTES_TO_SCRAPE = [
 ]
 
 
-@dataclass
+# Attributes with few distinct values which are interned so that all characters share one copy
+CATEGORICAL_ATTRIBUTES = ("blood_status", "nationality", "species", "house", "gender")
+# List attributes whose items recur across characters, e.g. "Order of the Phoenix" or "son"
+INTERNED_LIST_ATTRIBUTES = ("loyalties", "family_relations")
+
+
+def _intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return [_intern(item) for item in value]
+    if isinstance(value, dict):
+        return {_intern(key): _intern(item) for key, item in value.items()}
+    return value
+
+
+@dataclass(slots=True)
 class Character:
     """Represents a Harry Potter character with associated attributes."""
 
@@ -109,13 +135,45 @@ class Character:
     href: str
     aliases: list = None
     loyalties: list = None
-    famliy_relations: list = None
+    family_relations: list = None
     blood_status: str = None
     nationality: str = None
     species: str = None
     house: str = None
     gender: str = None
 
+    def __post_init__(self):
+        for attr in CATEGORICAL_ATTRIBUTES + INTERNED_LIST_ATTRIBUTES:
+            setattr(self, attr, _intern(getattr(self, attr)))
+
+    def __getstate__(self) -> tuple:
+        # A tuple of the values in field order is smaller and faster to load than a dict
+        return tuple(getattr(self, name) for name in CHARACTER_FIELDS)
+
+    def __setstate__(self, state: tuple | dict) -> None:
+        if isinstance(state, dict):
+            # Pickles of the former dict-based class spell the field "famliy_relations"
+            # and hold the scraped relations in an extra "family_relations" attribute.
+            state = dict(state)
+            if state.get("family_relations") is None:
+                state["family_relations"] = state.pop("famliy_relations", None)
+            for name in CHARACTER_FIELDS:
+                setattr(self, name, state.get(name))
+            self.__post_init__()
+            return
+        # The values were interned when pickled, so the pickle memo already shares them
+        for name, value in zip(CHARACTER_FIELDS, state):
+            setattr(self, name, value)
+
+    @property
+    def famliy_relations(self) -> list:
+        """Former misspelt name of family_relations, kept for backwards compatibility."""
+        return self.family_relations
+
+    @famliy_relations.setter
+    def famliy_relations(self, value: list) -> None:
+        self.family_relations = value
+
     def set_attr(self, attr: str, value):
         """Sets the value of an attribute.
 
@@ -123,42 +181,233 @@ class Character:
             attr (str): The name of the attribute to set.
             value (_type_): The value to set the attribute to.
         """
+        if attr in CATEGORICAL_ATTRIBUTES or attr in INTERNED_LIST_ATTRIBUTES:
+            value = _intern(value)
         setattr(self, attr, value)
 
-    def enrich(self) -> None:
+    def to_dict(self) -> dict:
+        """Gets the attributes of the character as a dictionary, e.g. to add it to Neo4j.
+
+        Returns:
+            dict: The attributes of the character.
+        """
+        return {name: getattr(self, name) for name in CHARACTER_FIELDS}
+
+    def enrich(
+        self,
+        fetcher: Fetcher = None,
+        base_url: str = BASE_URL,
+        backend: str = DEFAULT_PARSER_BACKEND,
+    ) -> InfoboxResult:
         """Adds additional information to a character.
 
         Args:
-            character (Character): The character to add information to.
+            fetcher (Fetcher, optional): The fetcher to download the character's page with. Defaults to None, in which case a plain request is sent.
+            base_url (str, optional): The url the character's href is relative to. Defaults to BASE_URL.
+            backend (str, optional): The html parser backend to use. Defaults to DEFAULT_PARSER_BACKEND.
+
+        Returns:
+            InfoboxResult: The extracted attributes and the fields that could not be parsed.
+        """
+        if fetcher is None:
+            res = requests.get(base_url + self.href).text
+        else:
+            res = fetcher.get(base_url + self.href)
+        return self.enrich_from_html(res, backend)
+
+    def enrich_from_html(
+        self, html: str, backend: str = DEFAULT_PARSER_BACKEND
+    ) -> InfoboxResult:
+        """Adds additional information to a character from the html of its page.
+
+        Args:
+            html (str): The html of the character's page.
+            backend (str, optional): The html parser backend to use. Defaults to DEFAULT_PARSER_BACKEND.
+
+        Returns:
+            InfoboxResult: The extracted attributes and the fields that could not be parsed.
         """
-        res = requests.get(BASE_URL + self.href).text
-        soup = BeautifulSoup(res, "html.parser")
-        for attr_name, scraper_func in ATTRIBUTES_TO_SCRAPE:
-            try:
-                value = scraper_func(soup)
-                self.set_attr(attr_name, value)
-            except Exception as e:
-                pass
+        result = extract_infobox(html, backend)
+        for attr_name, value in result.values.items():
+            self.set_attr(attr_name, value)
+        return result
 
 
-@dataclass
+CHARACTER_FIELDS = tuple(field.name for field in fields(Character))
+
+
+@dataclass(slots=True)
 class Chapter:
     """Represents a chapter in a Harry Potter book and the characters mentioned in it."""
 
     chapter: int
     characters: list[Character]
 
+    def __getstate__(self) -> dict:
+        return {"chapter": self.chapter, "characters": self.characters}
+
+    def __setstate__(self, state: dict) -> None:
+        self.chapter = state["chapter"]
+        self.characters = state["characters"]
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Loads pickles of characters into the former dict-based classes, for benchmarking."""
+
+    def find_class(self, module: str, name: str):
+        if module == __name__ and name in ("Character", "Chapter"):
+            return {"Character": _LegacyCharacter, "Chapter": _LegacyChapter}[name]
+        return super().find_class(module, name)
+
+
+class _LegacyCharacter:
+    pass
+
+
+class _LegacyChapter:
+    pass
+
+
+def benchmark_character_storage(
+    directory_path: str = "./data/processed",
+) -> dict[str, dict[str, float]]:
+    """Compares the character pickles as written before the characters were slotted and interned with the current ones.
+
+    The legacy pickles are loaded into plain classes holding their attributes in a __dict__, like
+    the former Character and Chapter dataclasses, and the current ones are written from them like
+    save_characters_by_chapter does.
+
+    Args:
+        directory_path (str, optional): The directory containing a `{book}/chapter_characters.pkl` per book in the legacy format. Defaults to "./data/processed".
+
+    Returns:
+        dict[str, dict[str, float]]: For both formats, the pickle size in bytes, the load time in milliseconds and the memory allocated by the loaded books in bytes.
+    """
+    payloads = {"legacy": {}, "slotted": {}}
+    for book in range(1, NUMBER_OF_BOOKS + 1):
+        with open(f"{directory_path}/{book}/chapter_characters.pkl", "rb") as f:
+            payloads["legacy"][book] = f.read()
+        payloads["slotted"][book] = pickle.dumps(pickle.loads(payloads["legacy"][book]))
+    loaders = {"legacy": lambda data: _LegacyUnpickler(io.BytesIO(data)).load()}
+    report = {}
+    for name, payload in payloads.items():
+        load = loaders.get(name, pickle.loads)
+        tracemalloc.start()
+        start = time.perf_counter()
+        loaded = {book: load(data) for book, data in payload.items()}
+        elapsed = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del loaded
+        report[name] = {
+            "bytes": sum(len(data) for data in payload.values()),
+            "load_ms": 1000 * elapsed,
+            "memory_bytes": memory,
+        }
+    return report
+
+
+def enrich_characters(
+    characters: list[Character],
+    fetcher: Fetcher = None,
+    max_workers: int = 8,
+    base_url: str = BASE_URL,
+    journal: ScrapeJournal = None,
+    refresh: bool = False,
+) -> dict[str, dict[str, str]]:
+    """Enriches characters concurrently.
+
+    The pages are downloaded by a pool of threads sharing one fetcher, so the number of requests in
+    flight is bounded by max_workers and their rate by the fetcher's token bucket. Every character is
+    enriched in place exactly as a serial call to Character.enrich would.
+
+    With a journal, characters that were enriched in a previous run are restored from it without
+    any request, and every newly enriched character is checkpointed. With refresh, the pages are
+    fetched again but only the ones whose content changed since they were journaled are re-parsed.
+
+    Args:
+        characters (list[Character]): The characters to enrich.
+        fetcher (Fetcher, optional): The fetcher to download the pages with. Defaults to None, in which case a new one is created.
+        max_workers (int, optional): The number of concurrent requests. Defaults to 8.
+        base_url (str, optional): The url the characters' hrefs are relative to. Defaults to BASE_URL.
+        journal (ScrapeJournal, optional): The journal to resume from and checkpoint to. Defaults to None.
+        refresh (bool, optional): Whether to check journaled characters for changed pages. Defaults to False.
 
-def get_characters_by_chapter(url: str = CHARACTERS_LIST_URL_EXAMPLE) -> list[Chapter]:
+    Returns:
+        dict[str, dict[str, str]]: The infobox fields that could not be parsed, by character href.
+    """
+    if fetcher is None:
+        fetcher = Fetcher(pool_size=max_workers)
+
+    def enrich(character: Character) -> dict[str, str]:
+        record = journal.characters.get(character.href) if journal is not None else None
+        if record is not None and not refresh:
+            _restore_character(character, record)
+            return record["errors"]
+        html = fetcher.get(base_url + character.href)
+        digest = hash_bytes(html.encode("utf-8"))
+        if record is not None and record["digest"] == digest:
+            _restore_character(character, record)
+            return record["errors"]
+        result = character.enrich_from_html(html)
+        if journal is not None:
+            journal.record_character(
+                character.href, digest, result.values, result.errors
+            )
+        return result.errors
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        errors = list(executor.map(enrich, characters))
+    return {
+        character.href: character_errors
+        for character, character_errors in zip(characters, errors)
+        if character_errors
+    }
+
+
+def _restore_character(character: Character, record: dict) -> None:
+    for attr_name, value in record["attributes"].items():
+        character.set_attr(attr_name, value)
+
+
+def _chapters_to_records(chapters: list[Chapter]) -> list[dict]:
+    return [
+        {
+            "chapter": chapter.chapter,
+            "characters": [
+                [character.title, character.href] for character in chapter.characters
+            ],
+        }
+        for chapter in chapters
+    ]
+
+
+def _chapters_from_records(records: list[dict]) -> list[Chapter]:
+    return [
+        Chapter(
+            chapter=record["chapter"],
+            characters=[
+                Character(title=title, href=href)
+                for title, href in record["characters"]
+            ],
+        )
+        for record in records
+    ]
+
+
+def get_characters_by_chapter(
+    url: str = CHARACTERS_LIST_URL_EXAMPLE, fetcher: Fetcher = None
+) -> list[Chapter]:
     """Gets a list of chapters and the characters mentioned in them.
-    
+
     Args:
         url (str, optional): The url of the page to scrape. Defaults to CHARACTERS_LIST_URL_EXAMPLE.
+        fetcher (Fetcher, optional): The fetcher to download the page with. Defaults to None, in which case a plain request is sent.
 
     Returns:
         list[Chapter]: A list of chapters and the characters mentioned in them.
     """
-    res = requests.get(url).text
+    res = requests.get(url).text if fetcher is None else fetcher.get(url)
     soup = BeautifulSoup(res, "html.parser")
     div = soup.find_all("div", class_="mw-parser-output")
     chapter_sections = div[0].find_all("h2")
@@ -210,22 +459,194 @@ def get_characters_by_chapter(url: str = CHARACTERS_LIST_URL_EXAMPLE) -> list[Ch
     return chapters
 
 
+class CharacterRegistry:
+    """A registry of characters keyed by their href.
+
+    Recurring characters are listed in many chapters of many books. The registry keeps a single
+    Character object per href, shares it across all the Chapter lists registered with it and
+    enriches it only once.
+    """
+
+    def __init__(self) -> None:
+        self.characters: dict[str, Character] = {}
+        # Registering the same chapter again, e.g. after scraping it again, replaces its count
+        self.occurrences_by_chapter: dict[tuple[int, int], int] = {}
+        self.parse_errors: dict[str, dict[str, str]] = {}
+        self._enriched: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self.characters)
+
+    def __contains__(self, href: str) -> bool:
+        return href in self.characters
+
+    def register(self, character: Character) -> Character:
+        """Registers a character and returns the shared instance for its href.
+
+        Args:
+            character (Character): The character to register.
+
+        Returns:
+            Character: The shared character with the same href.
+        """
+        return self.characters.setdefault(character.href, character)
+
+    def register_chapters(
+        self, chapters: list[Chapter], book_number: int = None
+    ) -> list[Chapter]:
+        """Replaces the characters of the chapters by their shared instances.
+
+        Args:
+            chapters (list[Chapter]): The chapters to register the characters of.
+            book_number (int, optional): The book of the chapters, which tells apart chapters with the same number in different books. Defaults to None.
+
+        Returns:
+            list[Chapter]: The same chapters, now holding the shared characters.
+        """
+        for chapter in chapters:
+            chapter.characters = [
+                self.register(character) for character in chapter.characters
+            ]
+            self.occurrences_by_chapter[(book_number, chapter.chapter)] = len(
+                chapter.characters
+            )
+        return chapters
+
+    def enrich(
+        self,
+        fetcher: Fetcher = None,
+        max_workers: int = 8,
+        base_url: str = BASE_URL,
+        journal: ScrapeJournal = None,
+        refresh: bool = False,
+    ) -> None:
+        """Enriches the registered characters that have not been enriched yet.
+
+        Args:
+            fetcher (Fetcher, optional): The fetcher to download the pages with. Defaults to None.
+            max_workers (int, optional): The number of concurrent requests. Defaults to 8.
+            base_url (str, optional): The url the characters' hrefs are relative to. Defaults to BASE_URL.
+            journal (ScrapeJournal, optional): The journal to resume from and checkpoint to. Defaults to None.
+            refresh (bool, optional): Whether to check journaled characters for changed pages. Defaults to False.
+        """
+        pending = [
+            character
+            for href, character in self.characters.items()
+            if href not in self._enriched
+        ]
+        self.parse_errors.update(
+            enrich_characters(
+                pending,
+                fetcher=fetcher,
+                max_workers=max_workers,
+                base_url=base_url,
+                journal=journal,
+                refresh=refresh,
+            )
+        )
+        self._enriched.update(character.href for character in pending)
+
+    def restore(self, journal: ScrapeJournal) -> None:
+        """Restores the registered characters that have been enriched in a journaled run, without any request.
+
+        Args:
+            journal (ScrapeJournal): The journal to restore from.
+        """
+        for href, character in self.characters.items():
+            record = journal.characters.get(href)
+            if href in self._enriched or record is None:
+                continue
+            _restore_character(character, record)
+            if record["errors"]:
+                self.parse_errors[href] = record["errors"]
+            self._enriched.add(href)
+
+    @property
+    def occurrences(self) -> int:
+        """The number of characters listed in all registered chapters."""
+        return sum(self.occurrences_by_chapter.values())
+
+    @property
+    def fetches_saved(self) -> int:
+        """The number of page fetches saved by enriching every href only once."""
+        return self.occurrences - len(self.characters)
+
+
 class CharacterScraper:
-    def __init__(self, url: dict[int, str]) -> None:
+    def __init__(
+        self,
+        url: dict[int, str],
+        fetcher: Fetcher = None,
+        max_workers: int = 8,
+        base_url: str = BASE_URL,
+    ) -> None:
         self.url = url
+        self.fetcher = (
+            fetcher if fetcher is not None else Fetcher(pool_size=max_workers)
+        )
+        self.max_workers = max_workers
+        self.base_url = base_url
+        self.registry = CharacterRegistry()
         self.books = None
         self.data_frame = None
 
-    def scrape(self, books_to_scrape: list[int] = list(range(1, 8))) -> None:
+    def scrape(
+        self,
+        books_to_scrape: list[int] = list(range(1, 8)),
+        journal_path: str = None,
+        refresh: bool = False,
+    ) -> dict[str, int]:
+        """Scrapes and enriches the characters of the given books.
+
+        Args:
+            books_to_scrape (list[int], optional): The books to scrape. Defaults to all books.
+            journal_path (str, optional): The path of a ScrapeJournal to resume from and checkpoint to. Defaults to None.
+            refresh (bool, optional): Whether to scrape the character indices again and re-enrich the characters whose pages changed since the journaled run. Defaults to False.
+
+        Returns:
+            dict[str, int]: The number of unique characters, of fetches saved by enriching every character once and of characters with unparsable fields.
+        """
+        journal = ScrapeJournal(journal_path) if journal_path is not None else None
         books = {}
         for book in tqdm(books_to_scrape):
-            characters_by_chapter = get_characters_by_chapter(self.url[book])
-            for chapter in characters_by_chapter:
-                for character in chapter.characters:
-                    character.enrich()
+            if journal is not None and book in journal.books and not refresh:
+                characters_by_chapter = _chapters_from_records(journal.books[book])
+            else:
+                characters_by_chapter = get_characters_by_chapter(
+                    self.url[book], self.fetcher
+                )
+                if journal is not None:
+                    journal.record_book(
+                        book, _chapters_to_records(characters_by_chapter)
+                    )
+            characters_by_chapter = self.registry.register_chapters(
+                characters_by_chapter, book
+            )
+            completed = (
+                journal is not None and book in journal.completed_books and not refresh
+            )
+            if completed:
+                # Every character of a finished book is in the journal, so they are restored
+                # directly instead of going through the pool of fetching threads
+                self.registry.restore(journal)
+            # Enriches only what the journal did not have
+            self.registry.enrich(
+                fetcher=self.fetcher,
+                max_workers=self.max_workers,
+                base_url=self.base_url,
+                journal=journal,
+                refresh=refresh,
+            )
+            if journal is not None and not completed:
+                journal.record_book_done(book)
             books[book] = characters_by_chapter
         self.books = books
         self.data_frame = self._to_dataframe()
+        return {
+            "characters": len(self.registry),
+            "fetches_saved": self.registry.fetches_saved,
+            "parse_errors": len(self.registry.parse_errors),
+        }
 
     def set_books(self, directory_path: str = "./data/processed"):
         books = {}
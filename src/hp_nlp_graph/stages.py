@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from collections.abc import Hashable
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+def hash_key(*parts) -> str:
+    """Gets the sha256 hex digest of JSON serializable parts, e.g. texts, titles and parameters.
+
+    Args:
+        *parts: The parts to hash, dict keys are sorted and other objects are converted to strings.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ArtifactStore:
+    """A persistent store of the artefacts of stages, keyed by the stage name and an input hash.
+
+    Every artefact is pickled to `{directory}/{stage}/{key[:2]}/{key}.pkl`, so an artefact is
+    recomputed only when one of the inputs or parameters its key is built from changes.
+
+    Args:
+        directory (str): The directory to store the artefacts in.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, stage: str, key: str) -> str:
+        return os.path.join(self.directory, stage, key[:2], key + ".pkl")
+
+    def has(self, stage: str, key: str) -> bool:
+        return os.path.exists(self._path(stage, key))
+
+    def get(self, stage: str, key: str) -> Any:
+        with open(self._path(stage, key), "rb") as f:
+            return pickle.load(f)
+
+    def put(self, stage: str, key: str, value: Any) -> None:
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class StageOutput:
+    """The artefacts of a stage.
+
+    Args:
+        keys (dict[Hashable, str]): The key of every part, e.g. of every chapter.
+        values (dict[Hashable, Any]): The artefact of every part.
+    """
+
+    keys: dict[Hashable, str]
+    values: dict[Hashable, Any]
+
+
+@dataclass
+class Stage:
+    """A stage of a pipeline whose artefacts are split into parts, e.g. one per chapter.
+
+    Args:
+        name (str): The name of the stage.
+        get_keys (Callable[[dict[str, StageOutput]], dict[Hashable, str]]): Gets the key of every part from the outputs of the inputs. A key has to hash everything the artefact depends on, usually the keys of the input parts and the parameters of the stage.
+        compute (Callable[[list[Hashable], dict[str, StageOutput]], dict[Hashable, Any]]): Computes the artefacts of the given stale parts from the outputs of the inputs.
+        inputs (tuple[str, ...], optional): The names of the stages this one depends on. Defaults to ().
+        cache (bool, optional): Whether to store the artefacts, stages with side effects only store a marker. Defaults to True.
+        force (bool, optional): Whether to compute every part even if its key is in the store, replacing the stored artefacts, e.g. to fetch data that changed outside the pipeline. Defaults to False.
+    """
+
+    name: str
+    get_keys: Callable[[dict[str, StageOutput]], dict[Hashable, str]]
+    compute: Callable[[list[Hashable], dict[str, StageOutput]], dict[Hashable, Any]]
+    inputs: tuple[str, ...] = ()
+    cache: bool = True
+    force: bool = False
+
+
+@dataclass
+class StageRunner:
+    """Runs a DAG of stages, recomputing only the parts whose keys are not in the store.
+
+    Args:
+        store (ArtifactStore): The store of the artefacts.
+        stages (list[Stage]): The stages, in any order.
+        report (dict[str, dict[str, int]]): The number of reused and computed parts of every stage that ran.
+    """
+
+    store: ArtifactStore
+    stages: list[Stage]
+    report: dict[str, dict[str, int]] = field(default_factory=dict)
+
+    def _get_order(self, targets: list[str]) -> list[Stage]:
+        stages = {stage.name: stage for stage in self.stages}
+        order, visiting, visited = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"The stages have a cycle through {name}")
+            if name not in stages:
+                raise ValueError(f"Unknown stage {name}")
+            visiting.add(name)
+            for input_name in stages[name].inputs:
+                visit(input_name)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(stages[name])
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def run(self, targets: list[str]) -> dict[str, StageOutput]:
+        """Runs the given stages and the stages they depend on.
+
+        Args:
+            targets (list[str]): The names of the stages to run.
+
+        Returns:
+            dict[str, StageOutput]: The output of every stage that ran.
+        """
+        outputs = {}
+        for stage in self._get_order(targets):
+            inputs = {name: outputs[name] for name in stage.inputs}
+            keys = stage.get_keys(inputs)
+            values = {}
+            stale = []
+            for part, key in keys.items():
+                if not stage.force and self.store.has(stage.name, key):
+                    values[part] = (
+                        self.store.get(stage.name, key) if stage.cache else None
+                    )
+                else:
+                    stale.append(part)
+            if stale:
+                computed = stage.compute(stale, inputs)
+                for part in stale:
+                    values[part] = computed[part]
+                    self.store.put(
+                        stage.name, keys[part], computed[part] if stage.cache else True
+                    )
+            outputs[stage.name] = StageOutput(
+                keys=keys, values={part: values[part] for part in keys}
+            )
+            self.report[stage.name] = {
+                "reused": len(keys) - len(stale),
+                "computed": len(stale),
+            }
+        return outputs
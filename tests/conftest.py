@@ -0,0 +1,87 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+@dataclass
+class Route:
+    """A canned response of the local server.
+
+    Args:
+        responses (list[tuple[int, dict[str, str], bytes]]): The status, headers and body of every response, the last one is repeated.
+        delay (float, optional): Seconds to wait before answering. Defaults to 0.
+    """
+
+    responses: list[tuple[int, dict[str, str], bytes]]
+    delay: float = 0
+    requests: list[dict[str, str]] = field(default_factory=list)
+
+
+class LocalServer:
+    """A local stand-in for the wiki, serving canned responses and recording the requests."""
+
+    def __init__(self) -> None:
+        self.routes: dict[str, Route] = {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.request_times: list[float] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def route(
+        self,
+        path: str,
+        *responses: tuple[int, dict[str, str], bytes],
+        delay: float = 0,
+    ) -> Route:
+        self.routes[path] = Route(list(responses), delay)
+        return self.routes[path]
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            self.request_times.append(time.monotonic())
+        try:
+            route = self.routes.get(handler.path)
+            if route is None:
+                status, headers, body = 404, {}, b""
+            else:
+                with self.lock:
+                    route.requests.append(dict(handler.headers))
+                    status, headers, body = route.responses[
+                        min(len(route.requests), len(route.responses)) - 1
+                    ]
+                time.sleep(route.delay)
+            handler.send_response(status)
+            for name, value in headers.items():
+                handler.send_header(name, value)
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def server():
+    local_server = LocalServer()
+    local_server.thread.start()
+    yield local_server
+    local_server.httpd.shutdown()
+    local_server.httpd.server_close()
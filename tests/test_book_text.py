@@ -0,0 +1,96 @@
+import os
+import pickle
+
+import pytest
+
+from hp_nlp_graph.book_text import BookText, read_chapter
+from hp_nlp_graph.parallel import ChapterTask
+
+BOOK = (
+    "HARRY POTTER\n\n"
+    "CHAPTER ONE\nThe Boy Who Lived\n\nMr and Mrs Dursley were proud.\n\n"
+    "CHAPTER TWO\nThe Vanishing Glass\n\nNearly ten years had passed, café.\n"
+    "CHAPTER THREE\nThe Letters from No One\n"
+)
+
+
+def write_book(tmp_path, text: str = BOOK, newline: str = "\n") -> str:
+    path = str(tmp_path / "1 Philosopher's Stone.txt")
+    with open(path, "w", encoding="utf-8", newline=newline) as f:
+        f.write(text)
+    return path
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_chapters_are_cut_like_splitting_the_text(tmp_path, newline):
+    path = write_book(tmp_path, newline=newline)
+    with open(path, "r", encoding="utf-8") as f:
+        expected = f.read().split("CHAPTER ")[1:]
+    with BookText(path) as book_text:
+        assert list(book_text) == expected
+        assert book_text[1] == expected[1]
+        assert book_text[-1] == expected[-1]
+        assert book_text[:2] == expected[:2]
+        assert book_text.titles == ["ONE", "TWO", "THREE"]
+
+
+def test_the_index_is_reused_until_the_book_changes(tmp_path, monkeypatch):
+    path = write_book(tmp_path)
+    BookText(path).close()
+    assert os.path.exists(path + ".chapters.json")
+
+    def fail():
+        raise AssertionError("The index was rebuilt")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(BookText, "_build_index", lambda self: fail())
+        with BookText(path) as book_text:
+            assert len(book_text) == 3
+
+    write_book(tmp_path, BOOK + "CHAPTER FOUR\nThe Keeper of the Keys\n")
+    with BookText(path) as book_text:
+        assert book_text.titles[-1] == "FOUR"
+
+
+def test_a_corrupt_index_is_rebuilt(tmp_path):
+    path = write_book(tmp_path)
+    BookText(path).close()
+    with open(path + ".chapters.json", "w") as f:
+        f.write('{"version": ')
+    with BookText(path) as book_text:
+        assert len(book_text) == 3
+
+
+def test_closing_unmaps_the_file_and_reading_maps_it_again(tmp_path):
+    book_text = BookText(write_book(tmp_path))
+    book_text[0]
+    assert book_text._mmap is not None
+    book_text.close()
+    assert book_text._mmap is None and book_text._file is None
+    assert book_text[2].startswith("THREE")
+    book_text.close()
+
+
+def test_pickles_carry_only_the_offsets(tmp_path):
+    path = write_book(tmp_path)
+    with BookText(path) as book_text:
+        book_text[0]
+        data = pickle.dumps(book_text)
+    assert b"Dursley" not in data
+    loaded = pickle.loads(data)
+    assert loaded[0].startswith("ONE\nThe Boy Who Lived")
+    loaded.close()
+
+
+def test_read_chapter(tmp_path):
+    path = write_book(tmp_path)
+    with BookText(path) as book_text:
+        assert read_chapter(path, 1) == book_text[1]
+
+
+def test_chapter_tasks_read_their_chapter_when_it_is_needed(tmp_path):
+    path = write_book(tmp_path)
+    task = ChapterTask(1, 2, path, 1, characters=[])
+    data = pickle.dumps(task)
+    assert "café".encode("utf-8") not in data
+    assert pickle.loads(data).chapter_text == read_chapter(path, 1)
@@ -0,0 +1,148 @@
+import os
+
+import pytest
+
+from hp_nlp_graph.cache import CacheMissError, ResponseCache, hash_bytes
+from hp_nlp_graph.fetcher import Fetcher
+
+
+def object_count(cache: ResponseCache) -> int:
+    return len(cache._object_paths())
+
+
+def test_store_and_lookup(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    entry = cache.store("https://example.org/a", "héllo".encode("utf-8"), "utf-8")
+    assert cache.lookup("https://example.org/a") == entry
+    assert cache.read_text(entry) == "héllo"
+    assert cache.lookup("https://example.org/b") is None
+
+
+def test_identical_bodies_are_stored_once(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("https://example.org/a", b"same")
+    cache.store("https://example.org/b", b"same")
+    assert object_count(cache) == 1
+    assert cache.total_bytes == 4
+
+
+def test_restoring_changed_content_drops_the_old_body(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=1000)
+    url = "https://example.org/page"
+    for version in range(5):
+        entry = cache.store(url, bytes([version]) * 300)
+        assert cache.lookup(url) == entry
+    assert object_count(cache) == 1
+    assert cache.total_bytes == 300
+    assert ResponseCache(str(tmp_path)).total_bytes == 300
+
+
+def test_restoring_keeps_a_body_shared_with_another_url(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("https://example.org/a", b"shared")
+    cache.store("https://example.org/b", b"shared")
+    cache.store("https://example.org/a", b"changed")
+    entry = cache.lookup("https://example.org/b")
+    assert cache.read(entry) == b"shared"
+    assert cache.total_bytes == len(b"shared") + len(b"changed")
+
+
+def test_reopened_cache_keeps_a_body_shared_with_another_url(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("https://example.org/a", b"shared")
+    cache.store("https://example.org/b", b"shared")
+    cache = ResponseCache(str(tmp_path))
+    cache.store("https://example.org/a", b"changed")
+    cache.store("https://example.org/a", b"changed")
+    assert cache.read(cache.lookup("https://example.org/a")) == b"changed"
+    assert cache.read(cache.lookup("https://example.org/b")) == b"shared"
+    assert object_count(cache) == 2
+
+
+def test_offline_lookup_does_not_touch_entries(tmp_path):
+    ResponseCache(str(tmp_path)).store("https://example.org/a", b"a")
+    cache = ResponseCache(str(tmp_path), offline=True)
+    index_path = cache._index_path("https://example.org/a")
+    os.utime(index_path, (0, 1))
+    assert cache.lookup("https://example.org/a") is not None
+    assert os.path.getmtime(index_path) == 1
+
+
+def test_lookup_ignores_entries_evicted_while_touching(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+    cache.store("https://example.org/a", b"a")
+    utime = os.utime
+
+    def evict_then_touch(path, *args, **kwargs):
+        os.remove(path)
+        utime(path, *args, **kwargs)
+
+    monkeypatch.setattr("hp_nlp_graph.cache.os.utime", evict_then_touch)
+    assert cache.lookup("https://example.org/a") is not None
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    for name in "abc":
+        cache.store(f"https://example.org/{name}", name.encode() * 100)
+        # Make sure the modification times differ
+        index_path = cache._index_path(f"https://example.org/{name}")
+        os.utime(index_path, (0, {"a": 1, "b": 2, "c": 3}[name]))
+    assert cache.lookup("https://example.org/a") is None
+    assert cache.lookup("https://example.org/b") is not None
+    assert cache.lookup("https://example.org/c") is not None
+    assert cache.total_bytes == 200
+
+
+def test_eviction_adjusts_total_bytes_of_missing_objects(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    entry = cache.store("https://example.org/a", b"a" * 100)
+    os.utime(cache._index_path(entry.url), (0, 1))
+    os.remove(cache._object_path(entry.digest))
+    cache.store("https://example.org/b", b"b" * 200)
+    assert cache.total_bytes == 200
+
+
+def test_eviction_removes_orphaned_objects(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    cache._write_atomic(cache._object_path(hash_bytes(b"x" * 100)), b"x" * 100)
+    cache = ResponseCache(str(tmp_path), max_bytes=250)
+    cache.store("https://example.org/b", b"b" * 200)
+    assert cache.lookup("https://example.org/b") is not None
+    assert object_count(cache) == 1
+    assert cache.total_bytes == 200
+
+
+def test_fetcher_revalidates_stale_entries(server, tmp_path):
+    route = server.route(
+        "/page",
+        (200, {"ETag": '"v1"', "Content-Type": "text/plain"}, b"first"),
+        (304, {"ETag": '"v1"'}, b""),
+    )
+    cache = ResponseCache(str(tmp_path), max_age=0)
+    fetcher = Fetcher(requests_per_second=100, cache=cache)
+    assert fetcher.get(server.url + "/page") == "first"
+    assert fetcher.get(server.url + "/page") == "first"
+    fetcher.close()
+    assert len(route.requests) == 2
+    assert route.requests[1]["If-None-Match"] == '"v1"'
+
+
+def test_fetcher_serves_fresh_entries_from_the_cache(server, tmp_path):
+    route = server.route("/page", (200, {"Content-Type": "text/plain"}, b"body"))
+    fetcher = Fetcher(requests_per_second=100, cache=ResponseCache(str(tmp_path)))
+    assert fetcher.get(server.url + "/page") == "body"
+    assert fetcher.get(server.url + "/page") == "body"
+    fetcher.close()
+    assert len(route.requests) == 1
+
+
+def test_offline_cache_does_not_send_requests(server, tmp_path):
+    route = server.route("/page", (200, {"Content-Type": "text/plain"}, b"body"))
+    fetcher = Fetcher(requests_per_second=100, cache=ResponseCache(str(tmp_path)))
+    fetcher.get(server.url + "/page")
+    offline = Fetcher(cache=ResponseCache(str(tmp_path), offline=True))
+    assert offline.get(server.url + "/page") == "body"
+    with pytest.raises(CacheMissError):
+        offline.get(server.url + "/other")
+    assert len(route.requests) == 1
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+
+from hp_nlp_graph.character_index import CharacterIndex
+from hp_nlp_graph.coreference import MatchResult
+from hp_nlp_graph.scraper import Character
+
+CHARACTERS = [
+    Character("Ron Weasley", "/wiki/Ron_Weasley"),
+    Character("Harry Potter", "/wiki/Harry_Potter"),
+    Character("Ron Weasley", "/wiki/Ron_Weasley"),
+]
+
+
+def test_characters_are_numbered_in_name_order():
+    index = CharacterIndex.from_characters(CHARACTERS)
+    assert index.names == ["Harry Potter", "Ron Weasley"]
+    assert index.get_id("Ron Weasley") == 1
+    assert index.get_name(0) == "Harry Potter"
+    assert "Harry Potter" in index
+    assert len(index) == 2
+
+
+def test_matched_names_are_numbered_in_name_order():
+    index = CharacterIndex.from_matches(
+        {
+            1: [MatchResult(["Ron Weasley"], 0, 1, "Ron")],
+            2: [
+                MatchResult(["Harry Potter", "James Potter"], 3, 4, "Potter"),
+                MatchResult(["Ron Weasley"], 5, 6, "Ron"),
+            ],
+        }
+    )
+    assert index.names == ["Harry Potter", "James Potter", "Ron Weasley"]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "index" / "character_index.json")
+    index = CharacterIndex.from_characters(CHARACTERS)
+    index.save(path)
+    loaded = CharacterIndex.load(path)
+    assert loaded.names == index.names
+    assert loaded.ids == index.ids
+
+
+def test_ids_are_stable_once_saved(tmp_path):
+    path = str(tmp_path / "character_index.json")
+    index = CharacterIndex.from_characters(CHARACTERS)
+    index.save(path)
+    loaded = CharacterIndex.load(path)
+    # New names get the next free id even if they sort before the others
+    assert loaded.add("Albus Dumbledore") == 2
+    assert loaded.add("Harry Potter") == 0
+    loaded.save(path)
+    assert CharacterIndex.load(path).names == [
+        "Harry Potter",
+        "Ron Weasley",
+        "Albus Dumbledore",
+    ]
+    assert list(loaded.ranks) == [1, 2, 0]
+
+
+def test_ids_map_to_another_index():
+    index = CharacterIndex(["Ron Weasley", "Harry Potter"])
+    other = CharacterIndex(["Harry Potter"])
+    assert np.array_equal(index.map_to(other), [1, 0])
+    assert other.names == ["Harry Potter", "Ron Weasley"]
+
+
+def test_other_versions_are_rejected(tmp_path):
+    path = tmp_path / "character_index.json"
+    path.write_text(json.dumps({"version": -1, "names": []}))
+    with pytest.raises(ValueError):
+        CharacterIndex.load(str(path))
@@ -0,0 +1,59 @@
+import argparse
+
+import pytest
+
+from hp_nlp_graph import language
+from hp_nlp_graph.cli import EXIT_USAGE, get_parser, main, parse_books
+
+
+def test_parse_books():
+    assert parse_books("1,3,5-7") == [1, 3, 5, 6, 7]
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_books("0-3")
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["interactions", "--books", "1-3", "--workers", "2"],
+        ["--books", "1-3", "--workers", "2", "interactions"],
+    ],
+)
+def test_common_options_are_accepted_before_and_after_the_command(argv):
+    args = get_parser().parse_args(argv)
+    assert args.books == [1, 2, 3]
+    assert args.workers == 2
+
+
+def test_common_options_default_after_every_command():
+    for command in ("scrape", "resolve", "interactions", "metrics", "ingest", "all"):
+        args = get_parser().parse_args([command])
+        assert args.books == list(range(1, 8))
+        assert args.workers is None
+        assert args.device == "auto"
+
+
+def test_resolve_options():
+    args = get_parser().parse_args(["resolve", "--seed", "3", "--device", "cpu"])
+    assert args.seed == 3
+    assert args.device == "cpu"
+
+
+def test_invalid_workers_are_a_usage_error():
+    assert main(["metrics", "--workers", "0"]) == EXIT_USAGE
+
+
+def test_resolve_workers_fit_into_the_available_memory(monkeypatch):
+    monkeypatch.setattr(language, "get_default_num_threads", lambda: 16)
+    monkeypatch.setattr(
+        language,
+        "get_available_memory_mb",
+        lambda: 2.5 * language.RESOLVE_WORKER_MEMORY_MB,
+    )
+    assert language.get_default_resolve_workers() == 2
+    monkeypatch.setattr(language, "get_available_memory_mb", lambda: 100)
+    assert language.get_default_resolve_workers() == 1
+    monkeypatch.setattr(language, "get_available_memory_mb", lambda: None)
+    assert language.get_default_resolve_workers() == 1
+    monkeypatch.setattr(language, "get_available_memory_mb", lambda: 10**9)
+    assert language.get_default_resolve_workers() == 16
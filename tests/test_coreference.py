@@ -0,0 +1,291 @@
+import random
+from collections import Counter
+from dataclasses import replace
+
+import pytest
+import spacy
+
+from hp_nlp_graph.coreference import (
+    MatchResult,
+    MentionIndex,
+    _merge_match_candidates_naive,
+    benchmark_match_merging,
+    coref_resolve_and_get_characters_matches_in_chapters,
+    get_chapter_seed,
+    get_chapter_windows,
+    get_interaction_distances,
+    get_interactions,
+    handle_multiple_options,
+    join_resolved_windows,
+    merge_match_candidates,
+)
+from hp_nlp_graph.scraper import Character
+
+SURNAMES = ["Abbott", "Bones", "Crabbe", "Dursley", "Finnigan", "Goyle", "Jordan"]
+GEORGES = [f"George {surname}" for surname in SURNAMES]
+CHARACTERS = [Character(title, f"/wiki/{title}") for title in GEORGES]
+
+
+def match(string_id: str, start: int, end: int) -> MatchResult:
+    return MatchResult([string_id], start, end, f"{start}-{end}")
+
+
+def copy_matches(matches: list[MatchResult]) -> list[MatchResult]:
+    return [replace(m, string_id=list(m.string_id)) for m in matches]
+
+
+def random_match_streams(count: int, seed: int = 0) -> list[list[MatchResult]]:
+    rng = random.Random(seed)
+    streams = []
+    for _ in range(count):
+        stream = []
+        for _ in range(rng.randint(0, 30)):
+            start = rng.randint(0, 20)
+            end = start + rng.randint(1, 3)
+            stream.append(match(rng.choice("ABCD"), start, end))
+        streams.append(stream)
+    return streams
+
+
+def make_chapter(text: str) -> str:
+    # The first line is dropped and the second one is the title
+    return f"\nChapter\n{text}"
+
+
+def resolve(nlp, chapters, seeds):
+    return coref_resolve_and_get_characters_matches_in_chapters(
+        base_nlp=nlp,
+        nlp=nlp,
+        chapters=[
+            (chapter_text, CHARACTERS, {"George": GEORGES}) for chapter_text in chapters
+        ],
+        # Leaves the text as it is, like a resolver that finds no clusters
+        batch_coref_resolver=lambda texts: [nlp.make_doc(text) for text in texts],
+        seeds=seeds,
+    )
+
+
+def test_seeded_chapters_are_disambiguated_the_same_way_alone_and_in_a_batch():
+    nlp = spacy.blank("en")
+    chapters = [make_chapter(f"George said {i}.") for i in range(8)]
+    seeds = [get_chapter_seed(1, chapter_number) for chapter_number in range(8)]
+    batch = resolve(nlp, chapters, seeds)
+    for chapter_text, seed, (matches, _) in zip(chapters, seeds, batch):
+        ((alone, _),) = resolve(nlp, [chapter_text], [seed])
+        assert [match.string_id for match in matches] == [
+            match.string_id for match in alone
+        ]
+        assert len(matches[0].string_id) == 1
+    assert len({matches[0].string_id[0] for matches, _ in batch}) > 1
+
+
+def test_matches_of_the_same_span_are_merged():
+    merged = merge_match_candidates([match("Harry", 0, 2), match("Potter", 0, 2)])
+    assert [(m.string_id, m.start, m.end) for m in merged] == [
+        (["Harry", "Potter"], 0, 2)
+    ]
+
+
+def test_matches_inside_a_longer_one_are_dropped():
+    merged = merge_match_candidates(
+        [match("Harry Potter", 0, 2), match("Harry", 0, 1), match("Potter", 1, 2)]
+    )
+    assert [m.string_id for m in merged] == [["Harry Potter"]]
+
+
+def test_match_ending_where_a_kept_one_starts_replaces_it():
+    merged = merge_match_candidates([match("Potter", 1, 2), match("Harry", 0, 1)])
+    assert [(m.string_id, m.start, m.end) for m in merged] == [(["Harry"], 0, 1)]
+
+
+def test_indexed_merge_agrees_with_the_naive_merge():
+    for stream in random_match_streams(500):
+        expected = _merge_match_candidates_naive(copy_matches(stream))
+        assert merge_match_candidates(copy_matches(stream)) == expected
+
+
+def test_benchmark_match_merging_reports_full_agreement():
+    report = benchmark_match_merging(random_match_streams(20), repeat=1)
+    assert report["naive"]["agreement"] == 1
+    assert report["indexed"]["agreement"] == 1
+
+
+def test_mention_index_finds_the_nearest_unambiguous_mention():
+    index = MentionIndex(
+        [
+            match("Harry", 0, 1),
+            MatchResult(["Harry", "Ron"], 3, 4, "?"),
+            match("Ron", 9, 10),
+        ]
+    )
+    assert index.nearest(["Harry", "Ron"], 4) == "Harry"
+    assert index.nearest(["Harry", "Ron"], 8) == "Ron"
+    assert index.nearest(["Hermione"], 4) is None
+    index.add("Hermione", 5, 3)
+    assert index.nearest(["Harry", "Hermione"], 4) == "Hermione"
+
+
+def test_mention_index_breaks_ties_by_the_first_result():
+    index = MentionIndex([match("Ron", 2, 3), match("Harry", 6, 7)])
+    assert index.nearest(["Harry", "Ron"], 4) == "Ron"
+
+
+def test_ambiguous_spans_take_the_nearest_character():
+    nlp = spacy.blank("en")
+    doc = nlp.make_doc("George Abbott met George Bones and later George")
+    results = [
+        match("George Abbott", 0, 2),
+        match("George Bones", 3, 5),
+        MatchResult(["George Abbott", "George Bones"], 7, 8, "George"),
+    ]
+    handle_multiple_options(results, doc)
+    assert results[2].string_id == ["George Bones"]
+
+
+def test_seeded_disambiguation_is_deterministic():
+    nlp = spacy.blank("en")
+    doc = nlp.make_doc("George said hello")
+
+    def disambiguate(seed):
+        results = [MatchResult(list(GEORGES), 0, 1, "George")]
+        handle_multiple_options(results, doc, {"George": GEORGES}, seed=seed)
+        (title,) = results[0].string_id
+        return title
+
+    assert disambiguate("1-1") == disambiguate("1-1")
+    choices = {disambiguate(get_chapter_seed(1, chapter)) for chapter in range(20)}
+    assert len(choices) > 1
+    assert choices <= set(GEORGES)
+
+
+def test_run_seed_changes_the_seed_of_every_chapter():
+    assert get_chapter_seed(1, 2) == get_chapter_seed(1, 2, None)
+    assert get_chapter_seed(1, 2, 7) != get_chapter_seed(1, 2)
+    assert get_chapter_seed(1, 2, 7) != get_chapter_seed(2, 1, 7)
+
+
+def reference_interactions(
+    results: list[MatchResult], distance_threshold: int
+) -> Counter:
+    # The original pair loop of get_interactions
+    results = sorted(copy_matches(results), key=lambda k: k.start)
+    compact_entities = []
+    for entity in results:
+        if compact_entities and compact_entities[-1].string_id == entity.string_id:
+            compact_entities[-1].end = entity.end
+        else:
+            compact_entities.append(entity)
+    interactions = []
+    for index, source in enumerate(compact_entities[:-1]):
+        for target in compact_entities[index + 1 :]:
+            if source.string_id != target.string_id and (
+                abs(source.end - target.start) < distance_threshold
+            ):
+                interactions.append(sorted([source.string_id[0], target.string_id[0]]))
+            else:
+                break
+    return Counter(map(tuple, interactions))
+
+
+def random_chapter_matches(seed: int) -> list[MatchResult]:
+    rng = random.Random(seed)
+    results, position = [], 0
+    for _ in range(rng.randint(0, 60)):
+        position += rng.randint(0, 12)
+        string_id = rng.sample("ABCDE", 2 if rng.random() < 0.1 else 1)
+        length = rng.randint(1, 3)
+        results.append(
+            MatchResult(string_id, position, position + length, "".join(string_id))
+        )
+    rng.shuffle(results)
+    return results
+
+
+def test_interactions_agree_with_the_pair_loop():
+    for seed in range(200):
+        results = random_chapter_matches(seed)
+        for threshold in (1, 5, 14, 30):
+            expected = reference_interactions(results, threshold)
+            interactions = get_interactions(copy_matches(results), threshold)
+            # Also in the order in which the pairs first occur
+            assert list(interactions.items()) == list(expected.items())
+
+
+def test_interaction_distances_cover_every_threshold():
+    for seed in range(50):
+        results = random_chapter_matches(seed)
+        distances = get_interaction_distances(results, max_distance_threshold=30)
+        histogram = distances.histogram()
+        for threshold in range(1, 31):
+            expected = reference_interactions(results, threshold)
+            assert distances.interactions(threshold) == expected
+            assert {
+                pair: int(counts[:threshold].sum())
+                for pair, counts in histogram.items()
+                if counts[:threshold].sum()
+            } == dict(expected)
+
+
+def test_interactions_leave_the_results_unchanged():
+    results = [match("A", 0, 1), match("A", 2, 3), match("B", 4, 5)]
+    before = copy_matches(results)
+    assert get_interactions(results) == Counter({("A", "B"): 1})
+    assert results == before
+
+
+def test_interactions_skip_results_without_a_string_id():
+    results = [match("A", 0, 1), MatchResult([], 2, 3, "?"), match("B", 4, 5)]
+    assert get_interactions(results) == Counter({("A", "B"): 1})
+
+
+def test_interactions_above_the_maximum_threshold_are_rejected():
+    distances = get_interaction_distances([match("A", 0, 1)], max_distance_threshold=5)
+    with pytest.raises(ValueError):
+        distances.interactions(6)
+
+
+def test_windows_cover_the_chapter_without_its_title():
+    nlp = spacy.blank("en")
+    chapter_text = "\nThe Boy Who Lived\n\nMr Dursley was proud.\nHe had a son.\n"
+    windows = get_chapter_windows(nlp, chapter_text)
+    assert [window.text for window in windows] == [
+        "Mr Dursley was proud. He had a son."
+    ]
+
+
+def test_windows_hold_whole_sentences():
+    nlp = spacy.blank("en")
+    sentences = [f"Harry saw {'an owl ' * (i % 4)}number {i}." for i in range(40)]
+    windows = get_chapter_windows(nlp, make_chapter(" ".join(sentences)), 20)
+    doc = windows[0].doc
+    assert [token.text for window in windows for token in window] == [
+        token.text for token in doc
+    ]
+    sentence_ends = {sentence.end for sentence in doc.sents}
+    for window in windows:
+        assert len(window) <= 20
+        assert window.end in sentence_ends
+    # A window only ends early if the next sentence does not fit
+    for window, following in zip(windows, windows[1:]):
+        next_sentence = next(s for s in doc.sents if s.start == following.start)
+        assert len(window) + len(next_sentence) > 20
+
+
+def test_sentences_longer_than_a_window_are_cut():
+    nlp = spacy.blank("en")
+    long_sentence = " ".join(["word"] * 45) + "."
+    windows = get_chapter_windows(nlp, make_chapter(f"Short one. {long_sentence}"), 20)
+    assert [len(window) for window in windows] == [3, 20, 20, 6]
+    assert all(len(window) <= 20 for window in windows)
+
+
+def test_joined_windows_keep_the_tokens_of_the_chapter():
+    nlp = spacy.blank("en")
+    sentences = " ".join(f"Ron said {i}." for i in range(30))
+    windows = get_chapter_windows(nlp, make_chapter(sentences), 16)
+    resolved = join_resolved_windows(
+        windows, [nlp.make_doc(window.text) for window in windows]
+    )
+    assert [token.text for token in resolved] == [
+        token.text for token in windows[0].doc
+    ]
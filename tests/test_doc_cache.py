@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+import spacy
+from spacy.language import Language
+
+from hp_nlp_graph.doc_cache import (
+    ResolvedDocCache,
+    get_package_versions,
+    get_resolver_fingerprint,
+)
+from hp_nlp_graph.language import SPACY_MODEL
+
+TEXT = "Harry Potter said that he saw Ron."
+
+
+class FakeCoref:
+    def __init__(self, config: dict):
+        self.config = config
+
+    def __call__(self, doc):
+        return doc
+
+
+@Language.factory("fake_coref")
+def create_fake_coref(nlp, name, device: str, num_threads: int, max_length: int):
+    return FakeCoref(
+        {"device": device, "num_threads": num_threads, "max_length": max_length}
+    )
+
+
+def fake_resolver(direct: bool = True, **config) -> SimpleNamespace:
+    nlp = spacy.blank("en")
+    nlp.add_pipe(
+        "fake_coref",
+        config={"device": "cpu", "num_threads": 1, "max_length": 512, **config},
+    )
+    return SimpleNamespace(nlp=nlp, base_nlp=spacy.blank("en"), direct=direct)
+
+
+def test_package_versions_are_read_from_the_metadata():
+    versions = get_package_versions(("spacy", "not-an-installed-package"))
+    assert versions == {"spacy": spacy.__version__, "not-an-installed-package": None}
+
+
+def test_fingerprint_covers_the_packages_and_the_spacy_model():
+    packages = get_resolver_fingerprint(fake_resolver())["packages"]
+    assert packages["spacy"] == spacy.__version__
+    assert SPACY_MODEL in packages
+
+
+def test_fingerprint_ignores_the_device_and_threads():
+    fingerprint = get_resolver_fingerprint(fake_resolver())
+    assert (
+        get_resolver_fingerprint(fake_resolver(device="cuda:0", num_threads=8))
+        == fingerprint
+    )
+    assert get_resolver_fingerprint(fake_resolver(max_length=128)) != fingerprint
+    assert get_resolver_fingerprint(fake_resolver(direct=False)) != fingerprint
+
+
+def test_resolved_docs_round_trip(tmp_path):
+    resolver = fake_resolver()
+    cache = ResolvedDocCache(str(tmp_path), resolver)
+    assert cache.get(TEXT) is None
+    doc = resolver.base_nlp(TEXT)
+    doc._.source_offsets = [(token.idx, token.idx + len(token)) for token in doc]
+    cache.put(TEXT, doc)
+
+    cache = ResolvedDocCache(str(tmp_path), fake_resolver())
+    cached_doc = cache.get(TEXT)
+    assert [token.text for token in cached_doc] == [token.text for token in doc]
+    assert list(cached_doc._.source_offsets) == doc._.source_offsets
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_other_texts_and_resolvers_miss(tmp_path):
+    resolver = fake_resolver()
+    ResolvedDocCache(str(tmp_path), resolver).put(TEXT, resolver.base_nlp(TEXT))
+    cache = ResolvedDocCache(str(tmp_path), resolver)
+    assert cache.get(TEXT + " Ron waved.") is None
+    other_cache = ResolvedDocCache(str(tmp_path), fake_resolver(direct=False))
+    assert other_cache.get(TEXT) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert (other_cache.hits, other_cache.misses) == (0, 1)
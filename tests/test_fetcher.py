@@ -0,0 +1,130 @@
+import time
+
+import pytest
+import requests
+
+from hp_nlp_graph.fetcher import Fetcher, TokenBucket
+from hp_nlp_graph.scraper import Character, enrich_characters
+
+HTML = "text/html; charset=utf-8"
+
+
+def infobox_page(house: str) -> bytes:
+    return (
+        '<aside class="portable-infobox">'
+        f'<div data-source="house"><h3>House</h3><div>{house}</div></div>'
+        '<div data-source="species"><h3>Species</h3><div>Human</div></div>'
+        "</aside>"
+    ).encode("utf-8")
+
+
+def test_token_bucket_allows_burst_then_throttles():
+    bucket = TokenBucket(rate=20, capacity=3)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(4):
+        bucket.acquire()
+    # 4 tokens at 20 per second
+    assert time.monotonic() - start >= 0.19
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_fetcher_rate_limits_requests(server):
+    server.route("/page", (200, {"Content-Type": HTML}, b"ok"))
+    fetcher = Fetcher(requests_per_second=10, burst=1)
+    for _ in range(6):
+        assert fetcher.get(server.url + "/page") == "ok"
+    fetcher.close()
+    gaps = [b - a for a, b in zip(server.request_times, server.request_times[1:])]
+    assert len(server.request_times) == 6
+    assert server.request_times[-1] - server.request_times[0] >= 0.45
+    assert min(gaps) >= 0.08
+
+
+def test_fetcher_waits_for_retry_after(server):
+    route = server.route(
+        "/limited",
+        (429, {"Retry-After": "1"}, b""),
+        (200, {"Content-Type": HTML}, b"finally"),
+    )
+    fetcher = Fetcher(requests_per_second=100, backoff_factor=0)
+    start = time.monotonic()
+    assert fetcher.get(server.url + "/limited") == "finally"
+    fetcher.close()
+    assert len(route.requests) == 2
+    assert time.monotonic() - start >= 1
+
+
+def test_fetcher_backs_off_exponentially_without_retry_after(server):
+    route = server.route(
+        "/flaky",
+        (503, {}, b""),
+        (503, {}, b""),
+        (200, {"Content-Type": HTML}, b"up"),
+    )
+    fetcher = Fetcher(requests_per_second=100, backoff_factor=0.1)
+    start = time.monotonic()
+    assert fetcher.get(server.url + "/flaky") == "up"
+    fetcher.close()
+    assert len(route.requests) == 3
+    # 0.1 and 0.2 seconds
+    assert time.monotonic() - start >= 0.3
+
+
+def test_fetcher_raises_after_max_retries(server):
+    route = server.route("/down", (503, {}, b""))
+    fetcher = Fetcher(requests_per_second=100, max_retries=2, backoff_factor=0)
+    with pytest.raises(requests.HTTPError):
+        fetcher.get(server.url + "/down")
+    fetcher.close()
+    assert len(route.requests) == 3
+
+
+def test_fetcher_does_not_retry_client_errors(server):
+    route = server.route("/missing", (404, {}, b"not found"))
+    fetcher = Fetcher(requests_per_second=100, backoff_factor=0)
+    assert fetcher.request(server.url + "/missing").status_code == 404
+    fetcher.close()
+    assert len(route.requests) == 1
+
+
+def test_enrich_characters_concurrently(server):
+    houses = ["Gryffindor", "Slytherin", "Ravenclaw", "Hufflepuff"]
+    characters = []
+    for i in range(12):
+        server.route(
+            f"/wiki/Character_{i}",
+            (200, {"Content-Type": HTML}, infobox_page(houses[i % 4])),
+            delay=0.05,
+        )
+        characters.append(Character(f"Character {i}", f"/wiki/Character_{i}"))
+    fetcher = Fetcher(requests_per_second=1000, burst=12, pool_size=4)
+    errors = enrich_characters(
+        characters, fetcher=fetcher, max_workers=4, base_url=server.url
+    )
+    fetcher.close()
+    assert errors == {}
+    assert [character.house for character in characters] == [
+        houses[i % 4] for i in range(12)
+    ]
+    assert all(character.species == "Human" for character in characters)
+    assert 1 < server.peak_in_flight <= 4
+
+
+def test_enrich_characters_matches_serial_enrich(server):
+    server.route(
+        "/wiki/Harry", (200, {"Content-Type": HTML}, infobox_page("Gryffindor"))
+    )
+    fetcher = Fetcher(requests_per_second=1000)
+    concurrent = Character("Harry Potter", "/wiki/Harry")
+    serial = Character("Harry Potter", "/wiki/Harry")
+    enrich_characters([concurrent], fetcher=fetcher, base_url=server.url)
+    serial.enrich(fetcher=fetcher, base_url=server.url)
+    fetcher.close()
+    assert concurrent.to_dict() == serial.to_dict()
@@ -0,0 +1,139 @@
+import pytest
+from bs4 import BeautifulSoup
+
+from hp_nlp_graph.infobox import extract_infobox
+from hp_nlp_graph.scraper import ATTRIBUTES_TO_SCRAPE
+
+FULL_PAGE = """
+<html><body>
+<p>Harry James Potter was an English half-blood wizard.</p>
+<aside class="portable-infobox pi-theme-character">
+  <div data-source="alias"><h3>Alias</h3><div><ul>
+    <li>The Boy Who Lived[1]</li>
+    <li>Barny Weasley (disguise)</li>
+    <li>The Chosen One (by the press)</li>
+  </ul></div></div>
+  <div data-source="blood"><h3>Blood status</h3><div>Half-blood[2]</div></div>
+  <div data-source="nationality"><h3>Nationality</h3><div>English</div></div>
+  <div data-source="family"><h3>Family</h3><div><ul>
+    <li>James Potter (father)[3]</li>
+    <li>Lily Potter (mother)</li>
+  </ul></div></div>
+  <div data-source="species"><h3>Species</h3><div>Human</div></div>
+  <div data-source="gender"><h3>Gender</h3><div>Male</div></div>
+  <div data-source="house"><h3>House</h3><div>Gryffindor</div></div>
+  <div data-source="loyalty"><h3>Loyalty</h3><div><ul>
+    <li><a href="/wiki/Dumbledore%27s_Army">Dumbledore's Army</a><ul>
+      <li>Order of the Phoenix</li>
+    </ul></li>
+    <li>Hogwarts School (formerly)</li>
+  </ul></div></div>
+</aside>
+</body></html>
+"""
+
+# Older pages have their fields in a plain table instead of a portable infobox
+PAGE_WITHOUT_INFOBOX = """
+<html><body><table>
+  <tr><td><div data-source="species"><b>Species</b><div>House-elf</div></div></td></tr>
+  <tr><td><div data-source="gender"><b>Gender</b><div>Male</div></div></td></tr>
+</table></body></html>
+"""
+
+# The house is in a second box below the infobox
+PAGE_WITH_FIELD_OUTSIDE_INFOBOX = """
+<html><body>
+<aside class="portable-infobox">
+  <div data-source="species"><h3>Species</h3><div>Human</div></div>
+</aside>
+<section><div data-source="house"><h3>House</h3><div>Ravenclaw</div></div></section>
+</body></html>
+"""
+
+# The loyalty with a sub-list has no link and the house has no value
+MALFORMED_PAGE = """
+<html><body><aside class="portable-infobox">
+  <div data-source="loyalty"><h3>Loyalty</h3><div><ul>
+    <li>Death Eaters<ul><li>Inner circle</li></ul></li>
+  </ul></div></div>
+  <div data-source="house"><h3>House</h3></div>
+  <div data-source="gender"><h3>Gender</h3><div>Female</div></div>
+</aside></body></html>
+"""
+
+PAGES = {
+    "full": FULL_PAGE,
+    "without_infobox": PAGE_WITHOUT_INFOBOX,
+    "field_outside_infobox": PAGE_WITH_FIELD_OUTSIDE_INFOBOX,
+    "malformed": MALFORMED_PAGE,
+}
+
+
+def legacy_extract(html: str) -> dict:
+    soup = BeautifulSoup(html, "html.parser")
+    values = {}
+    for attr_name, scraper_func in ATTRIBUTES_TO_SCRAPE:
+        try:
+            values[attr_name] = scraper_func(soup)
+        except Exception:
+            pass
+    return values
+
+
+@pytest.fixture(params=["html.parser", "lxml", "selectolax"])
+def backend(request):
+    if request.param != "html.parser":
+        pytest.importorskip(request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("html", PAGES.values(), ids=PAGES.keys())
+def test_backends_agree_with_the_scraper_functions(backend, html):
+    assert extract_infobox(html, backend).values == legacy_extract(html)
+
+
+def test_full_page(backend):
+    result = extract_infobox(FULL_PAGE, backend)
+    assert result.values["aliases"] == ["The Boy Who Lived", "The Chosen One"]
+    # Items of a sub-list are loyalties of their own
+    assert result.values["loyalties"] == [
+        "Dumbledore's Army",
+        "Order of the Phoenix",
+        "Hogwarts School",
+    ]
+    assert result.values["family_relations"] == [
+        {"person": "James Potter", "type": "father"},
+        {"person": "Lily Potter", "type": "mother"},
+    ]
+    assert result.values["blood_status"] == "Half-blood"
+    assert result.errors == {}
+    assert result.missing == []
+
+
+def test_page_without_infobox(backend):
+    result = extract_infobox(PAGE_WITHOUT_INFOBOX, backend)
+    assert result.values == {"species": "House-elf", "gender": "Male"}
+    assert result.errors == {}
+    assert result.missing == [
+        "aliases",
+        "loyalties",
+        "family_relations",
+        "blood_status",
+        "nationality",
+        "house",
+    ]
+
+
+def test_fields_outside_the_infobox_are_found(backend):
+    result = extract_infobox(PAGE_WITH_FIELD_OUTSIDE_INFOBOX, backend)
+    assert result.values == {"species": "Human", "house": "Ravenclaw"}
+
+
+def test_malformed_fields_are_reported(backend):
+    result = extract_infobox(MALFORMED_PAGE, backend)
+    assert result.values == {"gender": "Female"}
+    assert set(result.errors) == {"loyalties", "house"}
+    assert result.errors["house"].startswith("ValueError")
+    assert "loyalties" not in result.missing
+    assert "house" not in result.missing
+    assert "aliases" in result.missing
@@ -0,0 +1,105 @@
+from hp_nlp_graph.fetcher import Fetcher
+from hp_nlp_graph.journal import ScrapeJournal
+from hp_nlp_graph.scraper import CharacterScraper
+
+CHAPTERS = [
+    {"chapter": 1, "characters": [["Harry Potter", "/wiki/Harry"]]},
+    {
+        "chapter": 2,
+        "characters": [["Harry Potter", "/wiki/Harry"], ["Ron", "/wiki/Ron"]],
+    },
+]
+
+
+def record_characters(journal: ScrapeJournal) -> None:
+    journal.record_character("/wiki/Harry", "digest-harry", {"house": "Gryffindor"}, {})
+    journal.record_character(
+        "/wiki/Ron", "digest-ron", {"house": "Gryffindor"}, {"loyalty": "empty"}
+    )
+
+
+def test_journal_replays_records(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ScrapeJournal(path)
+    journal.record_book(1, CHAPTERS)
+    record_characters(journal)
+    journal.record_book_done(1)
+    resumed = ScrapeJournal(path)
+    assert resumed.books == {1: CHAPTERS}
+    assert resumed.completed_books == {1}
+    assert resumed.characters["/wiki/Ron"]["errors"] == {"loyalty": "empty"}
+
+
+def test_journal_ignores_truncated_last_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = ScrapeJournal(str(path))
+    journal.record_book(1, CHAPTERS)
+    with open(path, "a") as f:
+        f.write('{"type": "character", "href": "/wiki/Ha')
+    resumed = ScrapeJournal(str(path))
+    assert resumed.books == {1: CHAPTERS}
+    assert resumed.characters == {}
+
+
+def test_later_records_supersede_earlier_ones(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ScrapeJournal(path)
+    journal.record_character("/wiki/Harry", "old", {"house": None}, {})
+    journal.record_book(1, CHAPTERS)
+    journal.record_book_done(1)
+    journal.record_character("/wiki/Harry", "new", {"house": "Gryffindor"}, {})
+    # Scraping the index again means the book has to be enriched again
+    journal.record_book(1, CHAPTERS)
+    resumed = ScrapeJournal(path)
+    assert resumed.characters["/wiki/Harry"]["digest"] == "new"
+    assert resumed.completed_books == set()
+
+
+def test_scrape_restores_completed_books_without_requests(server, tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ScrapeJournal(path)
+    journal.record_book(1, CHAPTERS)
+    record_characters(journal)
+    journal.record_book_done(1)
+    scraper = CharacterScraper(
+        {1: server.url + "/index"},
+        fetcher=Fetcher(requests_per_second=100),
+        base_url=server.url,
+    )
+    stats = scraper.scrape(books_to_scrape=[1], journal_path=path)
+    assert server.request_times == []
+    assert stats == {"characters": 2, "fetches_saved": 1, "parse_errors": 1}
+    chapters = scraper.books[1]
+    assert [character.house for character in chapters[1].characters] == [
+        "Gryffindor",
+        "Gryffindor",
+    ]
+    assert scraper.registry.parse_errors == {"/wiki/Ron": {"loyalty": "empty"}}
+    # A resumed book is not marked as done a second time
+    with open(path) as f:
+        assert sum('"book_done"' in line for line in f) == 1
+
+
+def test_scrape_resumes_unfinished_books_from_the_last_character(server, tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    journal = ScrapeJournal(path)
+    journal.record_book(1, CHAPTERS)
+    journal.record_character("/wiki/Harry", "digest", {"house": "Gryffindor"}, {})
+    route = server.route(
+        "/wiki/Ron",
+        (
+            200,
+            {"Content-Type": "text/html"},
+            b'<aside class="portable-infobox"><div data-source="house">'
+            b"<h3>House</h3><div>Gryffindor</div></div></aside>",
+        ),
+    )
+    scraper = CharacterScraper(
+        {1: server.url + "/index"},
+        fetcher=Fetcher(requests_per_second=100),
+        base_url=server.url,
+    )
+    scraper.scrape(books_to_scrape=[1], journal_path=path)
+    assert len(route.requests) == 1
+    assert len(server.request_times) == 1
+    assert ScrapeJournal(path).completed_books == {1}
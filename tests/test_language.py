@@ -0,0 +1,205 @@
+import os
+import pickle
+import shutil
+import sys
+from types import SimpleNamespace
+
+import pytest
+import spacy
+from spacy.tokens import Doc
+
+from hp_nlp_graph.language import (
+    CharacterMatcher,
+    FastCoref,
+    add_entity_ruler,
+    build_entity_ruler_bundle,
+    build_resolved_doc,
+    get_matcher,
+    is_entity_ruler_bundle_current,
+    select_device,
+)
+from hp_nlp_graph.scraper import Character
+
+CHARACTERS = [
+    Character("Harry Potter", "/wiki/Harry_Potter"),
+    Character("Hermione Granger", "/wiki/Hermione_Granger"),
+]
+
+
+def blank_nlp():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("ner")
+    return nlp
+
+
+def test_bundle_is_current_for_the_characters_it_was_built_for(tmp_path):
+    path = str(tmp_path / "bundle")
+    nlp = blank_nlp()
+    assert not is_entity_ruler_bundle_current(nlp, CHARACTERS, path)
+    build_entity_ruler_bundle(nlp, CHARACTERS, path)
+    assert is_entity_ruler_bundle_current(nlp, CHARACTERS, path)
+    assert not is_entity_ruler_bundle_current(nlp, CHARACTERS[:1], path)
+
+
+def test_bundle_without_ruler_files_is_not_current(tmp_path):
+    path = str(tmp_path / "bundle")
+    nlp = blank_nlp()
+    build_entity_ruler_bundle(nlp, CHARACTERS, path)
+    os.remove(os.path.join(path, "entity_ruler", "patterns.jsonl"))
+    assert not is_entity_ruler_bundle_current(nlp, CHARACTERS, path)
+    shutil.rmtree(os.path.join(path, "entity_ruler"))
+    assert not is_entity_ruler_bundle_current(nlp, CHARACTERS, path)
+
+
+def test_bundle_with_truncated_meta_is_not_current(tmp_path):
+    path = str(tmp_path / "bundle")
+    nlp = blank_nlp()
+    build_entity_ruler_bundle(nlp, CHARACTERS, path)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        f.write('{"version": 1, "ha')
+    assert not is_entity_ruler_bundle_current(nlp, CHARACTERS, path)
+
+
+def test_incomplete_bundle_is_rebuilt_when_loaded(tmp_path):
+    path = str(tmp_path / "bundle")
+    build_entity_ruler_bundle(blank_nlp(), CHARACTERS, path)
+    shutil.rmtree(os.path.join(path, "entity_ruler"))
+    with_bundle = add_entity_ruler(blank_nlp(), CHARACTERS, path)
+    on_the_fly = add_entity_ruler(blank_nlp(), CHARACTERS)
+    assert is_entity_ruler_bundle_current(with_bundle, CHARACTERS, path)
+    assert len(with_bundle.get_pipe("entity_ruler").patterns) == len(
+        on_the_fly.get_pipe("entity_ruler").patterns
+    )
+
+
+def test_quantize_selects_the_cpu_when_the_device_is_auto(monkeypatch):
+    cuda = SimpleNamespace(is_available=lambda: True)
+    monkeypatch.setitem(sys.modules, "torch", SimpleNamespace(cuda=cuda))
+    assert select_device("auto") == "cuda:0"
+    assert select_device("auto", quantize=True) == "cpu"
+    assert select_device("cuda:1", quantize=True) == "cuda:1"
+
+
+MATCHER_CHAPTERS = [
+    [Character("Harry Potter", "/wiki/Harry_Potter")],
+    [
+        Character("Harry Potter", "/wiki/Harry_Potter"),
+        Character("Ron Weasley", "/wiki/Ron_Weasley"),
+        Character("Tom Riddle", "/wiki/Tom_Riddle"),
+    ],
+    [
+        Character("Harry Potter", "/wiki/Harry_Potter"),
+        Character("Ginny Weasley", "/wiki/Ginny_Weasley"),
+        Character("Hagrid's wife", "/wiki/Hagrids_wife"),
+    ],
+]
+MATCHER_TEXT = (
+    "Harry Potter and Ron Weasley saw Ginny Weasley. Lord Voldemort, "
+    "You-Know-Who, was Tom Riddle. Harry and Ginny left."
+)
+
+
+def get_matches(matcher, doc) -> list[tuple]:
+    return sorted(matcher(doc))
+
+
+def test_character_matcher_updates_match_a_full_rebuild():
+    nlp = spacy.blank("en")
+    doc = nlp(MATCHER_TEXT)
+    character_matcher = CharacterMatcher(nlp.vocab)
+    # The last update reruns the second chapter, removing the characters of the third
+    for characters in MATCHER_CHAPTERS + [MATCHER_CHAPTERS[1]]:
+        matcher = character_matcher.update(characters)
+        assert get_matches(matcher, doc) == get_matches(
+            get_matcher(nlp, characters), doc
+        )
+    assert len(matcher) == len(MATCHER_CHAPTERS[1])
+
+
+def test_character_matcher_round_trips_through_disk(tmp_path):
+    nlp = spacy.blank("en")
+    doc = nlp(MATCHER_TEXT)
+    path = str(tmp_path / "matcher.pkl")
+    character_matcher = CharacterMatcher(nlp.vocab)
+    character_matcher.update(MATCHER_CHAPTERS[1])
+    character_matcher.to_disk(path)
+    loaded = CharacterMatcher.from_disk(nlp.vocab, path)
+    assert loaded.patterns == character_matcher.patterns
+    assert get_matches(loaded.matcher, doc) == get_matches(
+        character_matcher.matcher, doc
+    )
+    # Loaded matchers keep updating incrementally
+    loaded.update(MATCHER_CHAPTERS[2])
+    assert get_matches(loaded.matcher, doc) == get_matches(
+        get_matcher(nlp, MATCHER_CHAPTERS[2]), doc
+    )
+
+
+def test_character_matcher_rejects_other_state_versions(tmp_path):
+    path = str(tmp_path / "matcher.pkl")
+    with open(path, "wb") as f:
+        pickle.dump({"version": -1, "patterns": {}}, f)
+    with pytest.raises(ValueError):
+        CharacterMatcher.from_disk(spacy.blank("en").vocab, path)
+
+
+def coref_doc(nlp, text: str, clusters: list[list[tuple[int, int]]]) -> Doc:
+    # Stands in for a document processed by fastcoref, with every capitalized word a proper noun
+    if not Doc.has_extension("coref_clusters"):
+        Doc.set_extension("coref_clusters", default=None)
+    doc = nlp(text)
+    for token in doc:
+        token.pos_ = "PROPN" if token.is_title else "PRON"
+    doc._.coref_clusters = clusters
+    return doc
+
+
+def mention(text: str, word: str, occurrence: int = 0) -> tuple[int, int]:
+    start = -1
+    for _ in range(occurrence + 1):
+        start = text.index(word, start + 1)
+    return start, start + len(word)
+
+
+def test_direct_build_matches_parsing_the_resolved_text():
+    nlp = spacy.blank("en")
+    text = "Harry Potter said that he saw Ron. Ron waved at him and his owl."
+    clusters = [
+        [
+            mention(text, "Harry Potter"),
+            mention(text, "he"),
+            mention(text, "him"),
+            mention(text, "his"),
+        ],
+        [mention(text, "Ron"), mention(text, "Ron", 1)],
+    ]
+    doc = coref_doc(nlp, text, clusters)
+    replacements = FastCoref.get_replacements(doc)
+    resolved_text = "".join(
+        replacements[token.i][0] if token.i in replacements else token.text_with_ws
+        for token in doc
+    )
+    assert resolved_text == (
+        "Harry Potter said that Harry Potter saw Ron. Ron waved at Harry Potter and "
+        "Harry Potter owl."
+    )
+    resolved_doc = build_resolved_doc(nlp, doc, replacements)
+    assert resolved_doc.text == resolved_text
+    assert [token.text for token in resolved_doc] == [
+        token.text for token in nlp(resolved_text)
+    ]
+    assert len(resolved_doc._.source_offsets) == len(resolved_doc)
+
+
+def test_mentions_off_token_boundaries_are_left_as_they_are():
+    nlp = spacy.blank("en")
+    text = "Harry met the Weasleys. Harry waved."
+    clusters = [
+        # "Weasley" is only part of the token "Weasleys"
+        [mention(text, "Harry"), mention(text, "Weasley")],
+        [mention(text, "easleys"), mention(text, "Harry", 1)],
+    ]
+    doc = coref_doc(nlp, text, clusters)
+    assert doc.char_span(*mention(text, "Weasley")) is None
+    resolved_doc = build_resolved_doc(nlp, doc, FastCoref.get_replacements(doc))
+    assert resolved_doc.text == text
@@ -0,0 +1,89 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from hp_nlp_graph.coreference import MatchResult, flatten_results, get_interactions
+from hp_nlp_graph.match_store import MatchStore, benchmark_match_storage
+
+MATCHES_BY_CHAPTER = {
+    1: [
+        MatchResult(["Harry Potter"], 0, 2, "Harry Potter", 0, 12),
+        MatchResult(["Ron Weasley"], 5, 6, "Ron"),
+        MatchResult(["Fred Weasley", "George Weasley"], 9, 10, "Weasley"),
+        MatchResult(["Harry Potter"], 12, 13, "Harry", 60, 65),
+    ],
+    2: [],
+    3: [
+        MatchResult(["Hermione Granger"], 3, 4, "Hermione"),
+        MatchResult(["Harry Potter"], 7, 8, "Harry"),
+    ],
+}
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_store_round_trip(tmp_path, mmap):
+    MatchStore.from_matches(MATCHES_BY_CHAPTER).save(str(tmp_path))
+    store = MatchStore.load(str(tmp_path), mmap=mmap)
+    assert list(store) == [1, 2, 3]
+    assert {
+        chapter_number: list(matches) for chapter_number, matches in store.items()
+    } == MATCHES_BY_CHAPTER
+
+
+def test_chapter_matches_are_indexed_like_lists():
+    matches = MatchStore.from_matches(MATCHES_BY_CHAPTER)[1]
+    expected = MATCHES_BY_CHAPTER[1]
+    assert [matches[i] for i in range(len(matches))] == expected
+    assert matches[-1] == expected[-1]
+    assert matches[1:3] == expected[1:3]
+    assert matches[::-2] == expected[::-2]
+    with pytest.raises(IndexError):
+        matches[len(expected)]
+
+
+def test_chapter_matches_flatten_and_count_like_lists():
+    store = MatchStore.from_matches(MATCHES_BY_CHAPTER)
+    for chapter_number, expected in MATCHES_BY_CHAPTER.items():
+        assert list(store[chapter_number].flatten()) == flatten_results(expected)
+        assert get_interactions(store[chapter_number]) == get_interactions(expected)
+
+
+def test_store_rejects_other_versions(tmp_path):
+    MatchStore.from_matches(MATCHES_BY_CHAPTER).save(str(tmp_path))
+    with open(tmp_path / "meta.json") as f:
+        meta = f.read()
+    with open(tmp_path / "meta.json", "w") as f:
+        f.write(meta.replace('"version": 1', '"version": 0'))
+    with pytest.raises(ValueError):
+        MatchStore.load(str(tmp_path))
+
+
+def test_benchmark_counts_the_columns_of_the_stores(tmp_path):
+    matches_by_chapter = {
+        chapter_number: [
+            MatchResult(["Harry Potter"], i, i + 1, "Harry") for i in range(2000)
+        ]
+        for chapter_number in range(1, 11)
+    }
+    os.makedirs(tmp_path / "1")
+    with open(tmp_path / "1" / "coreference_resolution_by_chapter.pkl", "wb") as f:
+        pickle.dump(matches_by_chapter, f)
+    report = benchmark_match_storage(str(tmp_path), [1], str(tmp_path / "stores"))
+    store = MatchStore.load(str(tmp_path / "stores" / "1" / "matches"))
+    column_bytes = sum(
+        np.asarray(getattr(store, column)).nbytes
+        for column in ("starts", "ends", "span_ids", "character_ids", "id_offsets")
+    )
+    assert report["store"]["memory_bytes"] >= column_bytes
+    assert report["store"]["memory_bytes"] < report["pickle"]["memory_bytes"]
+
+
+def test_benchmark_leaves_the_data_directory_untouched(tmp_path):
+    os.makedirs(tmp_path / "1")
+    with open(tmp_path / "1" / "coreference_resolution_by_chapter.pkl", "wb") as f:
+        pickle.dump({1: [MatchResult(["Harry Potter"], 0, 1, "Harry")]}, f)
+    report = benchmark_match_storage(str(tmp_path), [1])
+    assert set(report) == {"pickle", "store"}
+    assert os.listdir(tmp_path / "1") == ["coreference_resolution_by_chapter.pkl"]
@@ -0,0 +1,85 @@
+import spacy
+
+from hp_nlp_graph.language import CharacterMatcher
+from hp_nlp_graph.mentions import MentionMatcher
+from hp_nlp_graph.scraper import Character
+
+CHARACTERS = [
+    # Overlapping names sharing the surname
+    Character("Harry Potter", "/wiki/Harry_Potter"),
+    Character("James Potter", "/wiki/James_Potter"),
+    Character("Lily Potter", "/wiki/Lily_Potter"),
+    # Short forms and the Mc names
+    Character("Ronald Weasley", "/wiki/Ronald_Weasley"),
+    Character("Minerva McGonagall", "/wiki/Minerva_McGonagall"),
+    # The epithets of Voldemort
+    Character("Tom Riddle", "/wiki/Tom_Riddle", aliases=["The Dark Lord"]),
+    Character(
+        "Albus Dumbledore",
+        "/wiki/Albus_Dumbledore",
+        aliases=["Professor Dumbledore", "the headmaster"],
+    ),
+]
+TEXT = (
+    "Harry Potter met James Potter and Lily Potter. Ron and Ronald Weasley saw "
+    "Professor McGonagall and Minerva McGonagall. Lord Voldemort, You-Know-Who, "
+    "He-Who-Must-Not-Be-Named and The Dark Lord were Tom Riddle. Professor Dumbledore, "
+    "the headmaster, was Albus Dumbledore. potter and POTTER are not names."
+)
+
+
+def test_matches_equal_the_spacy_matcher():
+    nlp = spacy.blank("en")
+    doc = nlp(TEXT)
+    expected = CharacterMatcher(nlp.vocab).update(CHARACTERS)(doc)
+    matches = MentionMatcher(nlp.vocab).update(CHARACTERS)(doc)
+    assert len(matches) > len(CHARACTERS)
+    assert matches == expected
+
+
+def test_alias_matches_equal_the_spacy_matcher():
+    nlp = spacy.blank("en")
+    doc = nlp(TEXT)
+    character_matcher = CharacterMatcher(nlp.vocab)
+    character_matcher.update(CHARACTERS)
+    for character in CHARACTERS:
+        if character.aliases:
+            character_matcher.matcher.add(
+                character.title,
+                [
+                    [
+                        {"LOWER": token.lower_, "IS_TITLE": True}
+                        if token.is_title
+                        else {"LOWER": token.lower_}
+                        for token in nlp.tokenizer(alias)
+                    ]
+                    for alias in character.aliases
+                ],
+            )
+    mention_matcher = MentionMatcher(
+        nlp.vocab, tokenizer=nlp.tokenizer, include_aliases=True
+    )
+    matches, _ = mention_matcher.update(CHARACTERS).match_text(TEXT)
+    assert matches == character_matcher.matcher(doc)
+
+
+def test_updates_match_a_new_matcher():
+    nlp = spacy.blank("en")
+    doc = nlp(TEXT)
+    mention_matcher = MentionMatcher(nlp.vocab)
+    for characters in (CHARACTERS[:2], CHARACTERS, CHARACTERS[1:4]):
+        mention_matcher.update(characters)
+        assert mention_matcher(doc) == MentionMatcher(nlp.vocab).update(characters)(doc)
+
+
+def test_empty_pattern_set_matches_nothing():
+    nlp = spacy.blank("en")
+    doc = nlp(TEXT)
+    assert MentionMatcher(nlp.vocab)(doc) == []
+    # Unmatchable characters add no patterns
+    mention_matcher = MentionMatcher(nlp.vocab).update(
+        [Character("Hagrid's wife", "/wiki/Hagrids_wife")]
+    )
+    assert mention_matcher.patterns == {}
+    assert mention_matcher(doc) == []
+    assert MentionMatcher(nlp.vocab).match_tokens([]) == []
@@ -0,0 +1,41 @@
+import os
+
+from hp_nlp_graph.parallel import ChapterTask, _run_tasks
+
+CRASHING_CHAPTER = 2
+FAILING_CHAPTER = 3
+
+
+def resolve_or_crash(task: ChapterTask) -> list[tuple[int, int]]:
+    # Runs in the spawned workers, so it has to be importable from this module
+    if task.chapter_number == CRASHING_CHAPTER:
+        os._exit(1)
+    if task.chapter_number == FAILING_CHAPTER:
+        raise ValueError("unparsable chapter")
+    return [task.key]
+
+
+def get_tasks(chapter_numbers: list[int]) -> list[ChapterTask]:
+    return [
+        ChapterTask(1, chapter_number, "book.txt", chapter_number - 1, [])
+        for chapter_number in chapter_numbers
+    ]
+
+
+def test_a_crashing_chapter_fails_without_losing_the_others():
+    results, failures = _run_tasks(
+        get_tasks([1, 2, 3, 4, 5]), resolve_or_crash, max_workers=2, max_retries=1
+    )
+    assert results == {(1, 1): [(1, 1)], (1, 4): [(1, 4)], (1, 5): [(1, 5)]}
+    assert failures == {
+        (1, 2): "The worker process crashed",
+        (1, 3): "ValueError: unparsable chapter",
+    }
+
+
+def test_chapters_without_failures_all_resolve():
+    results, failures = _run_tasks(
+        get_tasks([1, 4, 5]), resolve_or_crash, max_workers=2, max_retries=0
+    )
+    assert list(results) == [(1, 1), (1, 4), (1, 5)]
+    assert failures == {}
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+import spacy
+
+from hp_nlp_graph.coreference import (
+    coref_resolve_and_get_characters_matches_in_chapters,
+    get_chapter_seed,
+)
+from hp_nlp_graph.language import get_rss_mb
+from hp_nlp_graph.pipeline import stream_chapter_matches
+from hp_nlp_graph.scraper import Character
+
+CHARACTERS = [
+    Character(title, f"/wiki/{title}")
+    for title in ("Harry Potter", "Ron Weasley", "George Weasley", "Fred Weasley")
+]
+OPTIONS = {"Weasley": ["Ron Weasley", "George Weasley", "Fred Weasley"]}
+
+
+def make_chapter(number: int, sentences: int = 20) -> str:
+    sentence = f"Harry met Weasley in room {number}. Ron laughed. "
+    return f"\nChapter {number}\n" + sentence * sentences
+
+
+def identity_resolver(nlp):
+    # Leaves the text as it is, like a resolver that finds no clusters
+    return lambda texts: [nlp.make_doc(text) for text in texts]
+
+
+def stream(nlp, chapters, **kwargs):
+    return stream_chapter_matches(
+        base_nlp=nlp,
+        nlp=nlp,
+        chapters=(
+            (number, chapter_text, CHARACTERS, OPTIONS)
+            for number, chapter_text in chapters
+        ),
+        batch_coref_resolver=kwargs.pop("resolver", identity_resolver(nlp)),
+        get_seed=lambda number: get_chapter_seed(1, number),
+        **kwargs,
+    )
+
+
+def test_stream_matches_like_the_batch_function():
+    nlp = spacy.blank("en")
+    chapters = [(number, make_chapter(number)) for number in range(1, 8)]
+    streamed = list(stream(nlp, chapters, chapters_per_batch=3))
+    expected = coref_resolve_and_get_characters_matches_in_chapters(
+        base_nlp=nlp,
+        nlp=nlp,
+        chapters=[(chapter_text, CHARACTERS, OPTIONS) for _, chapter_text in chapters],
+        batch_coref_resolver=identity_resolver(nlp),
+        seeds=[get_chapter_seed(1, number) for number, _ in chapters],
+    )
+    assert [number for number, _ in streamed] == [number for number, _ in chapters]
+    assert [matches for _, matches in streamed] == [matches for matches, _ in expected]
+
+
+def test_stream_reads_chapters_only_a_few_ahead():
+    nlp = spacy.blank("en")
+    read = []
+
+    def chapters():
+        for number in range(1, 201):
+            read.append(number)
+            yield number, make_chapter(number, sentences=2)
+
+    ahead = []
+    for consumed, (number, _) in enumerate(stream(nlp, chapters(), queue_size=2), 1):
+        ahead.append(len(read) - consumed)
+    assert len(ahead) == 200
+    # Three queues of two chapters and one chapter in every stage
+    assert max(ahead) <= 3 * 2 + 3
+
+
+def test_stream_memory_does_not_grow_with_the_number_of_chapters():
+    nlp = spacy.blank("en")
+
+    def peak_growth(count):
+        before = get_rss_mb()
+        report = {}
+        chapters = (
+            (number, make_chapter(number, sentences=300))
+            for number in range(1, count + 1)
+        )
+        for _ in stream(nlp, chapters, report=report):
+            pass
+        return report["peak_rss_mb"] - before
+
+    peak_growth(20)
+    short, long = peak_growth(20), peak_growth(120)
+    # The docs of 120 chapters of 15 kB take about 65 MB if they are kept
+    assert long < short + 20
+
+
+def test_stream_raises_the_errors_of_a_stage():
+    nlp = spacy.blank("en")
+
+    def failing_resolver(texts):
+        raise RuntimeError("model failed")
+
+    chapters = [(number, make_chapter(number)) for number in range(1, 4)]
+    with pytest.raises(RuntimeError, match="model failed"):
+        list(stream(nlp, chapters, resolver=failing_resolver))
+
+
+def test_closing_the_stream_stops_the_stages():
+    nlp = spacy.blank("en")
+    threads = threading.active_count()
+    chapters = ((number, make_chapter(number)) for number in range(1, 100))
+    matches = stream(nlp, chapters)
+    next(matches)
+    matches.close()
+    assert threading.active_count() == threads
@@ -0,0 +1,101 @@
+import os
+import pickle
+
+from hp_nlp_graph.scraper import (
+    Chapter,
+    Character,
+    CharacterRegistry,
+    benchmark_character_storage,
+)
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "data", "processed")
+
+
+def make_chapters(*chapters: list[str]) -> list[Chapter]:
+    return [
+        Chapter(
+            chapter=number,
+            characters=[Character(name, f"/wiki/{name}") for name in names],
+        )
+        for number, names in enumerate(chapters, start=1)
+    ]
+
+
+def test_registry_shares_characters_across_chapters_and_books():
+    registry = CharacterRegistry()
+    first = registry.register_chapters(make_chapters(["Harry", "Ron"], ["Harry"]), 1)
+    second = registry.register_chapters(make_chapters(["Harry", "Hermione"]), 2)
+    assert first[0].characters[0] is first[1].characters[0]
+    assert first[0].characters[0] is second[0].characters[0]
+    assert len(registry) == 3
+    assert registry.occurrences == 5
+    assert registry.fetches_saved == 2
+
+
+def test_registering_chapters_again_does_not_inflate_fetches_saved():
+    registry = CharacterRegistry()
+    registry.register_chapters(make_chapters(["Harry", "Ron"], ["Harry"]), 1)
+    registry.register_chapters(make_chapters(["Harry", "Ron"], ["Harry"]), 1)
+    assert registry.occurrences == 3
+    assert registry.fetches_saved == 1
+
+
+def test_chapters_of_different_books_are_counted_separately():
+    registry = CharacterRegistry()
+    registry.register_chapters(make_chapters(["Harry"]), 1)
+    registry.register_chapters(make_chapters(["Harry"]), 2)
+    assert registry.occurrences == 2
+    assert registry.fetches_saved == 1
+
+
+def test_characters_are_slotted_and_interned():
+    first = Character("Harry", "/wiki/Harry", house="".join(["Gryff", "indor"]))
+    second = Character("Ron", "/wiki/Ron")
+    second.set_attr("house", "".join(["Gryffin", "dor"]))
+    second.set_attr("loyalties", ["".join(["Order of ", "the Phoenix"])])
+    first.set_attr("loyalties", ["".join(["Order of the ", "Phoenix"])])
+    assert not hasattr(first, "__dict__")
+    assert first.house is second.house
+    assert first.loyalties[0] is second.loyalties[0]
+
+
+def test_character_pickles_round_trip():
+    character = Character(
+        "Ron",
+        "/wiki/Ron",
+        loyalties=["Order of the Phoenix"],
+        family_relations=[{"person": "Arthur Weasley", "type": "father"}],
+        house="Gryffindor",
+    )
+    loaded = pickle.loads(pickle.dumps(character))
+    assert loaded == character
+    assert loaded.famliy_relations == character.family_relations
+    assert loaded.to_dict()["house"] == "Gryffindor"
+
+
+def test_legacy_character_pickles_load():
+    # The former dict-based class pickled its __dict__ with the misspelt field
+    legacy = Character.__new__(Character)
+    legacy.__setstate__(
+        {
+            "title": "Ron",
+            "href": "/wiki/Ron",
+            "famliy_relations": [{"person": "Arthur Weasley", "type": "father"}],
+            "house": "Gryffindor",
+        }
+    )
+    assert legacy.family_relations == [{"person": "Arthur Weasley", "type": "father"}]
+    assert legacy.aliases is None
+    assert legacy.house == "Gryffindor"
+
+
+def test_chapter_characters_stay_mutable_lists():
+    chapter = pickle.loads(pickle.dumps(make_chapters(["Harry"])[0]))
+    chapter.characters.append(Character("Ron", "/wiki/Ron"))
+    assert [character.title for character in chapter.characters] == ["Harry", "Ron"]
+
+
+def test_compact_characters_are_smaller_than_legacy_pickles():
+    report = benchmark_character_storage(DATA_DIRECTORY)
+    assert report["slotted"]["bytes"] < 0.7 * report["legacy"]["bytes"]
+    assert report["slotted"]["memory_bytes"] < 0.8 * report["legacy"]["memory_bytes"]
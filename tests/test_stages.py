@@ -0,0 +1,127 @@
+import pytest
+
+from hp_nlp_graph.stages import ArtifactStore, Stage, StageRunner, hash_key
+
+
+def get_stages(source: dict, calls: list, force_source: bool = False) -> list[Stage]:
+    # "source" stands in for scraping, "lengths" and "total" derive per part artefacts from it
+    def compute_source(parts, inputs):
+        calls.append(("source", sorted(parts)))
+        return {"book": dict(source)}
+
+    def get_lengths_keys(inputs):
+        return {
+            name: hash_key(inputs["source"].keys["book"], text)
+            for name, text in inputs["source"].values["book"].items()
+        }
+
+    def compute_lengths(parts, inputs):
+        calls.append(("lengths", sorted(parts)))
+        return {name: len(inputs["source"].values["book"][name]) for name in parts}
+
+    def compute_total(parts, inputs):
+        calls.append(("total", sorted(parts)))
+        return {"book": sum(inputs["lengths"].values.values())}
+
+    return [
+        Stage(
+            "total",
+            lambda inputs: {"book": hash_key(sorted(inputs["lengths"].keys.items()))},
+            compute_total,
+            inputs=("lengths",),
+        ),
+        Stage("lengths", get_lengths_keys, compute_lengths, inputs=("source",)),
+        Stage(
+            "source",
+            lambda inputs: {"book": hash_key("source")},
+            compute_source,
+            force=force_source,
+        ),
+    ]
+
+
+def run(tmp_path, source: dict, force_source: bool = False, targets=("total",)):
+    calls = []
+    runner = StageRunner(
+        ArtifactStore(str(tmp_path)), get_stages(source, calls, force_source)
+    )
+    return runner.run(list(targets)), runner.report, calls
+
+
+def test_stages_run_in_dependency_order(tmp_path):
+    outputs, report, calls = run(tmp_path, {"a": "x", "b": "yy"})
+    assert [stage for stage, _ in calls] == ["source", "lengths", "total"]
+    assert outputs["lengths"].values == {"a": 1, "b": 2}
+    assert outputs["total"].values == {"book": 3}
+    assert report["lengths"] == {"reused": 0, "computed": 2}
+
+
+def test_stored_parts_are_reused(tmp_path):
+    run(tmp_path, {"a": "x", "b": "yy"})
+    outputs, report, calls = run(tmp_path, {"a": "x", "b": "yy"})
+    assert calls == []
+    assert outputs["total"].values == {"book": 3}
+    assert report == {
+        "source": {"reused": 1, "computed": 0},
+        "lengths": {"reused": 2, "computed": 0},
+        "total": {"reused": 1, "computed": 0},
+    }
+
+
+def test_only_the_targets_and_their_inputs_run(tmp_path):
+    outputs, report, calls = run(tmp_path, {"a": "x"}, targets=("lengths",))
+    assert set(outputs) == {"source", "lengths"}
+    assert "total" not in report
+
+
+def test_a_changed_input_key_recomputes_the_downstream_parts(tmp_path):
+    run(tmp_path, {"a": "x", "b": "yy"})
+    # The key of the source does not change, so the stored source is used
+    outputs, _, calls = run(tmp_path, {"a": "x", "b": "zzz"})
+    assert calls == []
+    # Once it is refreshed, only the parts whose inputs changed are computed again
+    outputs, report, calls = run(tmp_path, {"a": "x", "b": "zzz"}, force_source=True)
+    assert calls == [("source", ["book"]), ("lengths", ["b"]), ("total", ["book"])]
+    assert outputs["total"].values == {"book": 4}
+    assert report["lengths"] == {"reused": 1, "computed": 1}
+
+
+def test_a_forced_stage_replaces_its_stored_artefacts(tmp_path):
+    run(tmp_path, {"a": "x"})
+    run(tmp_path, {"a": "xyz"}, force_source=True)
+    # Later runs reuse the refreshed artefacts instead of the first ones
+    outputs, _, calls = run(tmp_path, {"a": "x"})
+    assert calls == []
+    assert outputs["source"].values == {"book": {"a": "xyz"}}
+    assert outputs["total"].values == {"book": 3}
+
+
+def test_uncached_stages_only_store_a_marker(tmp_path):
+    calls = []
+    stage = Stage(
+        "side_effect",
+        lambda inputs: {"book": hash_key("side_effect")},
+        lambda parts, inputs: calls.append(parts) or {"book": "done"},
+        cache=False,
+    )
+    store = ArtifactStore(str(tmp_path))
+    assert StageRunner(store, [stage]).run(["side_effect"])["side_effect"].values == {
+        "book": "done"
+    }
+    assert StageRunner(store, [stage]).run(["side_effect"])["side_effect"].values == {
+        "book": None
+    }
+    assert calls == [["book"]]
+    assert store.get("side_effect", hash_key("side_effect")) is True
+
+
+def test_cycles_and_unknown_stages_are_rejected(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    stages = [
+        Stage("a", dict, dict, inputs=("b",)),
+        Stage("b", dict, dict, inputs=("a",)),
+    ]
+    with pytest.raises(ValueError, match="cycle"):
+        StageRunner(store, stages).run(["a"])
+    with pytest.raises(ValueError, match="Unknown stage"):
+        StageRunner(store, stages).run(["c"])